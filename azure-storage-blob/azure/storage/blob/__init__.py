@@ -4,7 +4,11 @@
 # license information.
 # --------------------------------------------------------------------------
 from .appendblobservice import AppendBlobService
+from .appendblobwriter import AppendBlobWriter
+from .blobcache import BlobCache
+from .blobreader import BlobReader
 from .blockblobservice import BlockBlobService
+from .blockblobwriter import BlockBlobWriter
 from .models import (
     Container,
     ContainerProperties,
@@ -19,6 +23,8 @@ from .models import (
     BlobPermissions,
     _LeaseActions,
     AppendBlockProperties,
+    AppendBlobWriterStatistics,
+    DirectoryTransferReport,
     PageBlobProperties,
     ResourceProperties,
     Include,
@@ -0,0 +1,87 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import zlib
+
+from azure.common import AzureException
+
+from ._error import _ERROR_TRUNCATED_GZIP_CONTENT
+
+_GZIP_CONTENT_ENCODING = 'gzip'
+
+# zlib reads and writes the gzip header and trailer with this window size
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def _compress_chunks(stream, count, read_size):
+    '''
+    Reads the stream, up to count bytes if count is given, read_size bytes at a
+    time, and yields its gzip-compressed content in chunks of any size. zlib
+    releases the GIL while it compresses, so the compression can run on a thread
+    of its own while the compressed blocks are staged.
+    '''
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, _GZIP_WBITS)
+    remaining = count
+    while remaining is None or remaining > 0:
+        data = stream.read(read_size if remaining is None else min(read_size, remaining))
+        if not data:
+            break
+        if remaining is not None:
+            remaining -= len(data)
+
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+class _BlobDecompressionStage(object):
+    '''
+    Decompresses the content of a gzip-encoded blob as it is received, in order.
+    Concatenated gzip members are decompressed one after the other, as by gzip.
+    '''
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(_GZIP_WBITS)
+        self.received = False
+
+    def update(self, data):
+        self.received = self.received or len(data) > 0
+        decompressed = [self.decompressor.decompress(data)]
+
+        # The data that follows the end of a member starts the next one
+        while self.decompressor.unused_data:
+            data = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(_GZIP_WBITS)
+            decompressed.append(self.decompressor.decompress(data))
+
+        return b''.join(decompressed)
+
+    def finalize(self):
+        data = self.decompressor.flush()
+
+        # An empty blob has no member. Python 2 does not tell whether the end of
+        # the member was reached.
+        if self.received and not getattr(self.decompressor, 'eof', True):
+            raise AzureException(_ERROR_TRUNCATED_GZIP_CONTENT)
+        return data
+
+
+class _DecompressingWriter(object):
+    '''
+    Writes the decompressed content of a gzip-encoded blob to the stream, as the
+    compressed chunks are written to it in order.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.stage = _BlobDecompressionStage()
+
+    def write(self, data):
+        self.stream.write(self.stage.update(data))
+
+    def finalize(self):
+        self.stream.write(self.stage.finalize())
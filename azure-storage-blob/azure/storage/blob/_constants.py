@@ -12,3 +12,6 @@ X_MS_VERSION = '2019-02-02'
 
 # internal configurations, should not be changed
 _LARGE_BLOB_UPLOAD_MAX_READ_BUFFER_SIZE = 4 * 1024 * 1024
+
+# number of chunks prepared ahead of the one being sent by pipelined uploads
+_PIPELINED_UPLOAD_READ_AHEAD = 2
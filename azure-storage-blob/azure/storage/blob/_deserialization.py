@@ -4,8 +4,6 @@
 # license information.
 # --------------------------------------------------------------------------
 from azure.common import AzureException
-from dateutil import parser
-
 from azure.storage.common._http import HTTPResponse
 
 try:
@@ -15,14 +13,16 @@ except ImportError:
 from azure.storage.common._common_conversion import (
     _decode_base64_to_text,
     _to_str,
+    _get_content_crc64,
     _get_content_md5
 )
 from azure.storage.common._deserialization import (
-    _parse_properties,
+    _parse_properties_and_metadata,
+    _parse_datetime,
     _to_int,
-    _parse_metadata,
     _convert_xml_to_signed_identifiers,
     _bool,
+    _XmlListParser,
 )
 from .models import (
     Container,
@@ -42,6 +42,7 @@ from .models import (
 from ._encryption import _decrypt_blob
 from azure.storage.common.models import _list
 from azure.storage.common._error import (
+    _validate_content_crc64_match,
     _validate_content_match,
     _ERROR_DECRYPTION_FAILURE,
 )
@@ -62,7 +63,7 @@ def _parse_base_properties(response):
     Extracts basic response headers.
     '''
     resource_properties = ResourceProperties()
-    resource_properties.last_modified = parser.parse(response.headers.get('last-modified'))
+    resource_properties.last_modified = _parse_datetime(response.headers.get('last-modified'))
     resource_properties.etag = response.headers.get('etag')
     _parse_cpk_headers(response, resource_properties)
 
@@ -74,7 +75,7 @@ def _parse_page_properties(response):
     Extracts page response headers.
     '''
     put_page = PageBlobProperties()
-    put_page.last_modified = parser.parse(response.headers.get('last-modified'))
+    put_page.last_modified = _parse_datetime(response.headers.get('last-modified'))
     put_page.etag = response.headers.get('etag')
     put_page.sequence_number = _to_int(response.headers.get('x-ms-blob-sequence-number'))
     _parse_cpk_headers(response, put_page)
@@ -87,7 +88,7 @@ def _parse_append_block(response):
     Extracts append block response headers.
     '''
     append_block = AppendBlockProperties()
-    append_block.last_modified = parser.parse(response.headers.get('last-modified'))
+    append_block.last_modified = _parse_datetime(response.headers.get('last-modified'))
     append_block.etag = response.headers.get('etag')
     append_block.append_offset = _to_int(response.headers.get('x-ms-blob-append-offset'))
     append_block.committed_block_count = _to_int(response.headers.get('x-ms-blob-committed-block-count'))
@@ -119,12 +120,12 @@ def _parse_lease(response):
 
 
 def _parse_blob(response, name, snapshot, validate_content=False, require_encryption=False,
-                key_encryption_key=None, key_resolver_function=None, start_offset=None, end_offset=None):
+                key_encryption_key=None, key_resolver_function=None, start_offset=None, end_offset=None,
+                content_keys=None, key_cache=None, key_cache_ttl=None):
     if response is None:
         return None
 
-    metadata = _parse_metadata(response)
-    props = _parse_properties(response, BlobProperties)
+    props, metadata = _parse_properties_and_metadata(response, BlobProperties)
 
     # For range gets, only look at 'x-ms-blob-content-md5' for overall MD5
     content_settings = getattr(props, 'content_settings')
@@ -134,14 +135,20 @@ def _parse_blob(response, name, snapshot, validate_content=False, require_encryp
         else:
             delattr(content_settings, 'content_md5')
 
+    # The service returns the checksum that was asked for by the range get
     if validate_content:
-        computed_md5 = _get_content_md5(response.body)
-        _validate_content_match(response.headers['content-md5'], computed_md5)
+        if 'x-ms-content-crc64' in response.headers:
+            computed_crc64 = _get_content_crc64(response.body)
+            _validate_content_crc64_match(response.headers['x-ms-content-crc64'], computed_crc64)
+        else:
+            computed_md5 = _get_content_md5(response.body)
+            _validate_content_match(response.headers['content-md5'], computed_md5)
 
     if key_encryption_key is not None or key_resolver_function is not None:
         try:
             response.body = _decrypt_blob(require_encryption, key_encryption_key, key_resolver_function,
-                                          response, start_offset, end_offset)
+                                          response, start_offset, end_offset, content_keys,
+                                          key_cache, key_cache_ttl)
         except:
             raise AzureException(_ERROR_DECRYPTION_FAILURE)
 
@@ -152,8 +159,7 @@ def _parse_container(response, name):
     if response is None:
         return None
 
-    metadata = _parse_metadata(response)
-    props = _parse_properties(response, ContainerProperties)
+    props, metadata = _parse_properties_and_metadata(response, ContainerProperties)
     return Container(name, props, metadata)
 
 
@@ -196,14 +202,12 @@ def _convert_xml_to_containers(response):
         return None
 
     containers = _list()
-    list_element = ETree.fromstring(response.body)
+    list_parser = _XmlListParser(response.body)
 
-    # Set next marker
-    setattr(containers, 'next_marker', list_element.findtext('NextMarker'))
+    for container_element in list_parser:
+        if container_element.tag != 'Container':
+            continue
 
-    containers_element = list_element.find('Containers')
-
-    for container_element in containers_element.findall('Container'):
         # Name element
         container = Container()
         container.name = container_element.findtext('Name')
@@ -218,7 +222,7 @@ def _convert_xml_to_containers(response):
         # Properties
         properties_element = container_element.find('Properties')
         container.properties.etag = properties_element.findtext('Etag')
-        container.properties.last_modified = parser.parse(properties_element.findtext('Last-Modified'))
+        container.properties.last_modified = _parse_datetime(properties_element.findtext('Last-Modified'))
         container.properties.lease_status = properties_element.findtext('LeaseStatus')
         container.properties.lease_state = properties_element.findtext('LeaseState')
         container.properties.lease_duration = properties_element.findtext('LeaseDuration')
@@ -229,11 +233,14 @@ def _convert_xml_to_containers(response):
         # Add container to list
         containers.append(container)
 
+    # Set next marker
+    setattr(containers, 'next_marker', list_parser.findtext('NextMarker'))
+
     return containers
 
 
 LIST_BLOBS_ATTRIBUTE_MAP = {
-    'Last-Modified': (None, 'last_modified', parser.parse),
+    'Last-Modified': (None, 'last_modified', _parse_datetime),
     'Etag': (None, 'etag', _to_str),
     'x-ms-blob-sequence-number': (None, 'sequence_number', _to_int),
     'BlobType': (None, 'blob_type', _to_str),
@@ -255,12 +262,12 @@ LIST_BLOBS_ATTRIBUTE_MAP = {
     'CopyCompletionTime': ('copy', 'completion_time', _to_str),
     'CopyStatusDescription': ('copy', 'status_description', _to_str),
     'AccessTier': (None, 'blob_tier', _to_str),
-    'AccessTierChangeTime': (None, 'blob_tier_change_time', parser.parse),
+    'AccessTierChangeTime': (None, 'blob_tier_change_time', _parse_datetime),
     'AccessTierInferred': (None, 'blob_tier_inferred', _bool),
     'ArchiveStatus': (None, 'rehydration_status', _to_str),
-    'DeletedTime': (None, 'deleted_time', parser.parse),
+    'DeletedTime': (None, 'deleted_time', _parse_datetime),
     'RemainingRetentionDays': (None, 'remaining_retention_days', _to_int),
-    'Creation-Time': (None, 'creation_time', parser.parse),
+    'Creation-Time': (None, 'creation_time', _parse_datetime),
 }
 
 
@@ -319,19 +326,19 @@ def _convert_xml_to_blob_list(response):
         return None
 
     blob_list = _list()
-    list_element = ETree.fromstring(response.body)
-
-    setattr(blob_list, 'next_marker', list_element.findtext('NextMarker'))
+    list_parser = _XmlListParser(response.body)
 
-    blobs_element = list_element.find('Blobs')
-    blob_prefix_elements = blobs_element.findall('BlobPrefix')
-    if blob_prefix_elements is not None:
-        for blob_prefix_element in blob_prefix_elements:
+    # The prefixes are listed before the blobs
+    blobs = []
+    for blob_element in list_parser:
+        if blob_element.tag == 'BlobPrefix':
             prefix = BlobPrefix()
-            prefix.name = blob_prefix_element.findtext('Name')
+            prefix.name = blob_element.findtext('Name')
             blob_list.append(prefix)
+            continue
+        elif blob_element.tag != 'Blob':
+            continue
 
-    for blob_element in blobs_element.findall('Blob'):
         blob = Blob()
         blob.name = blob_element.findtext('Name')
         blob.snapshot = blob_element.findtext('Snapshot')
@@ -361,7 +368,10 @@ def _convert_xml_to_blob_list(response):
                 blob.metadata[metadata_element.tag] = metadata_element.text
 
         # Add blob to list
-        blob_list.append(blob)
+        blobs.append(blob)
+
+    blob_list.extend(blobs)
+    setattr(blob_list, 'next_marker', list_parser.findtext('NextMarker'))
 
     return blob_list
 
@@ -421,18 +431,18 @@ def _convert_xml_to_blob_name_list(response):
         return None
 
     blob_list = _list()
-    list_element = ETree.fromstring(response.body)
-
-    setattr(blob_list, 'next_marker', list_element.findtext('NextMarker'))
-
-    blobs_element = list_element.find('Blobs')
-    blob_prefix_elements = blobs_element.findall('BlobPrefix')
-    if blob_prefix_elements is not None:
-        for blob_prefix_element in blob_prefix_elements:
-            blob_list.append(blob_prefix_element.findtext('Name'))
-
-    for blob_element in blobs_element.findall('Blob'):
-        blob_list.append(blob_element.findtext('Name'))
+    list_parser = _XmlListParser(response.body)
+
+    # The prefixes are listed before the blobs
+    blob_names = []
+    for blob_element in list_parser:
+        if blob_element.tag == 'BlobPrefix':
+            blob_list.append(blob_element.findtext('Name'))
+        elif blob_element.tag == 'Blob':
+            blob_names.append(blob_element.findtext('Name'))
+
+    blob_list.extend(blob_names)
+    setattr(blob_list, 'next_marker', list_parser.findtext('NextMarker'))
 
     return blob_list
 
@@ -0,0 +1,441 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import calendar
+import hashlib
+import time
+from fnmatch import fnmatchcase
+from os import (
+    makedirs,
+    path,
+    utime,
+    walk,
+)
+from threading import (
+    BoundedSemaphore,
+    Lock,
+)
+
+from azure.storage.common._common_conversion import _encode_base64
+from azure.storage.common._serialization import url_quote
+
+from .models import (
+    BlobBlock,
+    DirectoryTransferReport,
+)
+
+
+class _DirectoryTransfer(object):
+    '''
+    Runs the tasks of a bulk transfer on one shared pool of worker threads and
+    keeps the aggregate report up to date.
+    '''
+
+    def __init__(self, max_connections, progress_callback):
+        import concurrent.futures
+
+        # Bounds the number of queued tasks so that the producer (walking the
+        # tree or listing the container) stays just ahead of the workers.
+        self.task_throttler = BoundedSemaphore(max_connections + 1)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_connections)
+        self.running_futures = []
+        self.progress_callback = progress_callback
+        self.progress_lock = Lock()
+        self.report = DirectoryTransferReport()
+        self.start_time = time.time()
+
+    def submit(self, task, *args):
+        # Check for exceptions and fail fast.
+        for future in [f for f in self.running_futures if f.done()]:
+            if future.exception() is not None:
+                raise future.exception()
+            self.running_futures.remove(future)
+
+        self.task_throttler.acquire()
+        future = self.executor.submit(task, *args)
+        future.add_done_callback(lambda x: self.task_throttler.release())
+        self.running_futures.append(future)
+
+    def wait(self):
+        for future in self.running_futures:
+            future.result()
+        return self._update_report()
+
+    def close(self):
+        for future in self.running_futures:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+    def update_progress(self, bytes_transferred=0, files_transferred=0, files_skipped=0):
+        report = self._update_report(bytes_transferred, files_transferred, files_skipped)
+        if self.progress_callback is not None:
+            self.progress_callback(report)
+
+    def _update_report(self, bytes_transferred=0, files_transferred=0, files_skipped=0):
+        # returns a snapshot so that callbacks never observe a report being updated
+        with self.progress_lock:
+            report = self.report
+            report.bytes_transferred += bytes_transferred
+            report.files_transferred += files_transferred
+            report.files_skipped += files_skipped
+            report.elapsed_time = time.time() - self.start_time
+            if report.elapsed_time > 0:
+                report.throughput = report.bytes_transferred / report.elapsed_time
+
+            snapshot = DirectoryTransferReport()
+            snapshot.__dict__.update(report.__dict__)
+            return snapshot
+
+
+class _FileUpload(object):
+    '''
+    Uploads a single file of a directory upload as one or more tasks of the
+    shared pool. Large files are split into blocks that are staged as
+    independent tasks, and the worker staging the last block commits them.
+    '''
+
+    def __init__(self, blob_service, container_name, blob_name, file_path, file_size,
+                 transfer, content_settings, metadata, validate_content, timeout,
+                 standard_blob_tier, cpk):
+        self.blob_service = blob_service
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self.file_path = file_path
+        self.file_size = file_size
+        self.transfer = transfer
+        self.content_settings = content_settings
+        self.metadata = metadata
+        self.validate_content = validate_content
+        self.timeout = timeout
+        self.standard_blob_tier = standard_blob_tier
+        self.cpk = cpk
+        self.block_list = []
+        self.remaining_blocks = 0
+        self.block_lock = Lock()
+
+    def get_tasks(self):
+        blob_service = self.blob_service
+
+        # Client-side encryption chains the blocks, so they cannot be staged out of order.
+        if blob_service.key_encryption_key is not None:
+            yield self.upload_encrypted_file
+        elif self.file_size < blob_service.MAX_SINGLE_PUT_SIZE:
+            yield self.put_file
+        else:
+            block_size = blob_service.MAX_BLOCK_SIZE
+            offsets = range(0, self.file_size, block_size)
+            self.block_list = [BlobBlock(url_quote(_encode_base64('{0:032d}'.format(offset))))
+                               for offset in offsets]
+            self.remaining_blocks = len(self.block_list)
+            for index, offset in enumerate(offsets):
+                yield lambda index=index, offset=offset: self.put_block(
+                    index, offset, min(block_size, self.file_size - offset))
+
+    def put_file(self):
+        with open(self.file_path, 'rb') as stream:
+            data = stream.read()
+
+        self.blob_service._put_blob(
+            self.container_name,
+            self.blob_name,
+            data,
+            content_settings=self.content_settings,
+            metadata=self.metadata,
+            validate_content=self.validate_content,
+            timeout=self.timeout,
+            standard_blob_tier=self.standard_blob_tier,
+            cpk=self.cpk,
+        )
+        self.transfer.update_progress(len(data), files_transferred=1)
+
+    def upload_encrypted_file(self):
+        self.blob_service.create_blob_from_path(
+            self.container_name,
+            self.blob_name,
+            self.file_path,
+            content_settings=self.content_settings,
+            metadata=self.metadata,
+            validate_content=self.validate_content,
+            max_connections=1,
+            timeout=self.timeout,
+            standard_blob_tier=self.standard_blob_tier,
+            cpk=self.cpk,
+        )
+        self.transfer.update_progress(self.file_size, files_transferred=1)
+
+    def put_block(self, index, offset, length):
+        with open(self.file_path, 'rb') as stream:
+            stream.seek(offset)
+            data = stream.read(length)
+
+        self.blob_service._put_block(
+            self.container_name,
+            self.blob_name,
+            data,
+            self.block_list[index].id,
+            validate_content=self.validate_content,
+            timeout=self.timeout,
+            cpk=self.cpk,
+        )
+
+        with self.block_lock:
+            self.remaining_blocks -= 1
+            last_block = self.remaining_blocks == 0
+
+        if last_block:
+            self.blob_service._put_block_list(
+                self.container_name,
+                self.blob_name,
+                self.block_list,
+                content_settings=self.content_settings,
+                metadata=self.metadata,
+                validate_content=self.validate_content,
+                timeout=self.timeout,
+                standard_blob_tier=self.standard_blob_tier,
+                cpk=self.cpk,
+            )
+        self.transfer.update_progress(len(data), files_transferred=1 if last_block else 0)
+
+
+class _BlobDownload(object):
+    '''
+    Downloads a single blob of a directory download as one or more tasks of the
+    shared pool. Large blobs are split into ranges that are written in place to
+    a preallocated file as independent tasks. Every request is pinned to the
+    ETag seen in the listing, and the file is given the last modified time of
+    the blob once it is complete, which is what skip_unchanged compares.
+    '''
+
+    def __init__(self, blob_service, container_name, blob, file_path, transfer,
+                 validate_content, timeout, cpk):
+        self.blob_service = blob_service
+        self.container_name = container_name
+        self.blob_name = blob.name
+        self.blob_size = blob.properties.content_length
+        self.etag = blob.properties.etag
+        self.last_modified = _get_timestamp(blob.properties.last_modified)
+        self.file_path = file_path
+        self.transfer = transfer
+        self.validate_content = validate_content
+        self.timeout = timeout
+        self.cpk = cpk
+        self.remaining_chunks = 0
+        self.chunk_lock = Lock()
+
+    def get_tasks(self):
+        blob_service = self.blob_service
+
+        # Client-side encrypted blobs can only be decrypted by the regular download path.
+        if blob_service.key_encryption_key is not None or blob_service.require_encryption:
+            yield self.download_encrypted_blob
+        elif self.blob_size <= self._get_single_get_size():
+            yield self.get_blob
+        else:
+            # the file is preallocated so that the chunks can be written in any order
+            with open(self.file_path, 'wb') as stream:
+                stream.truncate(self.blob_size)
+
+            chunk_size = blob_service.MAX_CHUNK_GET_SIZE
+            offsets = range(0, self.blob_size, chunk_size)
+            self.remaining_chunks = len(offsets)
+            for offset in offsets:
+                yield lambda offset=offset: self.get_chunk(offset, min(offset + chunk_size, self.blob_size))
+
+    def _get_single_get_size(self):
+        # the service only returns transactional MD5s for ranges of up to 4MB
+        if self.validate_content:
+            return self.blob_service.MAX_CHUNK_GET_SIZE
+        return self.blob_service.MAX_SINGLE_GET_SIZE
+
+    def get_blob(self):
+        blob = self.blob_service._get_blob(
+            self.container_name,
+            self.blob_name,
+            validate_content=self.validate_content,
+            if_match=self.etag,
+            timeout=self.timeout,
+            cpk=self.cpk,
+        )
+        content = blob.content or b''
+        with open(self.file_path, 'wb') as stream:
+            stream.write(content)
+
+        self._complete_file()
+        self.transfer.update_progress(len(content), files_transferred=1)
+
+    def download_encrypted_blob(self):
+        self.blob_service.get_blob_to_path(
+            self.container_name,
+            self.blob_name,
+            self.file_path,
+            validate_content=self.validate_content,
+            max_connections=1,
+            if_match=self.etag,
+            timeout=self.timeout,
+            cpk=self.cpk,
+        )
+        self._complete_file()
+        self.transfer.update_progress(self.blob_size, files_transferred=1)
+
+    def get_chunk(self, chunk_start, chunk_end):
+        blob = self.blob_service._get_blob(
+            self.container_name,
+            self.blob_name,
+            start_range=chunk_start,
+            end_range=chunk_end - 1,
+            validate_content=self.validate_content,
+            if_match=self.etag,
+            timeout=self.timeout,
+            cpk=self.cpk,
+        )
+        with open(self.file_path, 'r+b') as stream:
+            stream.seek(chunk_start)
+            stream.write(blob.content)
+
+        with self.chunk_lock:
+            self.remaining_chunks -= 1
+            last_chunk = self.remaining_chunks == 0
+
+        if last_chunk:
+            self._complete_file()
+        self.transfer.update_progress(chunk_end - chunk_start, files_transferred=1 if last_chunk else 0)
+
+    def _complete_file(self):
+        utime(self.file_path, (self.last_modified, self.last_modified))
+
+
+def _get_timestamp(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+def _matches_any(name, patterns):
+    return any(fnmatchcase(name, pattern) for pattern in patterns or ())
+
+
+def _matches_path(relative_path, patterns):
+    # a path matches if it, or any of its parent directories, matches a pattern
+    segments = relative_path.split('/')
+    return any(_matches_any('/'.join(segments[:i]), patterns) for i in range(1, len(segments) + 1))
+
+
+def _walk_directory(directory, include, exclude):
+    # Lazily yields (file path, relative path with '/' separators) for the files to transfer.
+    for root, dirs, files in walk(directory):
+        relative_root = path.relpath(root, directory)
+        relative_root = '' if relative_root == path.curdir else relative_root.replace(path.sep, '/') + '/'
+
+        # Excluded directories are pruned so that they are never walked.
+        dirs[:] = sorted(d for d in dirs if not _matches_any(relative_root + d, exclude))
+
+        for name in sorted(files):
+            relative_path = relative_root + name
+            if include and not _matches_any(relative_path, include):
+                continue
+            if _matches_any(relative_path, exclude):
+                continue
+            yield path.join(root, name), relative_path
+
+
+def _get_file_md5(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(4 * 1024 * 1024), b''):
+            md5.update(chunk)
+    return _encode_base64(md5.digest())
+
+
+def _is_file_unchanged(file_path, file_size, blob_properties, compare_content_md5):
+    if blob_properties is None or blob_properties.content_length != file_size:
+        return False
+
+    content_md5 = blob_properties.content_settings.content_md5
+    if compare_content_md5 and content_md5:
+        return _get_file_md5(file_path) == content_md5
+
+    # The blob is up to date if it was written after the file was last modified.
+    return _get_timestamp(blob_properties.last_modified) >= int(path.getmtime(file_path))
+
+
+def _is_blob_unchanged(file_path, blob_properties):
+    # Downloaded files are given the last modified time of their blob.
+    try:
+        return (path.getsize(file_path) == blob_properties.content_length and
+                int(path.getmtime(file_path)) == _get_timestamp(blob_properties.last_modified))
+    except OSError:
+        return False
+
+
+def _upload_directory(blob_service, container_name, directory, blob_prefix, include, exclude,
+                      skip_unchanged, compare_content_md5, max_connections, progress_callback,
+                      content_settings, metadata, validate_content, timeout, standard_blob_tier, cpk):
+    existing_blobs = {}
+    if skip_unchanged:
+        for blob in blob_service.list_blobs(container_name, prefix=blob_prefix or None, timeout=timeout):
+            existing_blobs[blob.name] = blob.properties
+
+    transfer = _DirectoryTransfer(max_connections, progress_callback)
+    try:
+        for file_path, relative_path in _walk_directory(directory, include, exclude):
+            blob_name = blob_prefix + relative_path
+            file_size = path.getsize(file_path)
+
+            if skip_unchanged and _is_file_unchanged(file_path, file_size, existing_blobs.get(blob_name),
+                                                     compare_content_md5):
+                transfer.update_progress(files_skipped=1)
+                continue
+
+            upload = _FileUpload(blob_service, container_name, blob_name, file_path, file_size, transfer,
+                                 content_settings, metadata, validate_content, timeout, standard_blob_tier, cpk)
+            for task in upload.get_tasks():
+                transfer.submit(task)
+
+        return transfer.wait()
+    finally:
+        transfer.close()
+
+
+def _download_directory(blob_service, container_name, directory, prefix, include, exclude,
+                        skip_unchanged, max_connections, progress_callback, validate_content, timeout, cpk):
+    directory = path.abspath(directory)
+    created_directories = set()
+
+    transfer = _DirectoryTransfer(max_connections, progress_callback)
+    try:
+        # The listing is consumed lazily, so the next pages are fetched while
+        # the blobs of the previous ones are being downloaded.
+        for blob in blob_service.list_blobs(container_name, prefix=prefix or None, timeout=timeout):
+            relative_path = blob.name[len(prefix or ''):].lstrip('/')
+
+            # skip the empty blobs used as folder placeholders
+            if not relative_path or relative_path.endswith('/'):
+                continue
+            if include and not _matches_any(relative_path, include):
+                continue
+            if _matches_path(relative_path, exclude):
+                continue
+
+            file_path = path.normpath(path.join(directory, *relative_path.split('/')))
+            if not file_path.startswith(path.join(directory, '')):
+                raise ValueError('The name of blob {0} points outside of directory.'.format(blob.name))
+
+            if skip_unchanged and _is_blob_unchanged(file_path, blob.properties):
+                transfer.update_progress(files_skipped=1)
+                continue
+
+            # directories are only created once a file is downloaded in them
+            file_directory = path.dirname(file_path)
+            if file_directory not in created_directories:
+                if not path.isdir(file_directory):
+                    makedirs(file_directory)
+                created_directories.add(file_directory)
+
+            download = _BlobDownload(blob_service, container_name, blob, file_path, transfer,
+                                     validate_content, timeout, cpk)
+            for task in download.get_tasks():
+                transfer.submit(task)
+
+        return transfer.wait()
+    finally:
+        transfer.close()
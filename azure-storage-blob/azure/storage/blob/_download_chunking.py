@@ -3,16 +3,34 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import os
 import threading
+from collections import deque
+
+from azure.storage.common._common_conversion import (
+    _get_positional_fileno,
+    _OrderedDigest,
+    _preallocate,
+)
 
 
 def _download_blob_chunks(blob_service, container_name, blob_name, snapshot,
                           download_size, block_size, progress, start_range, end_range,
                           stream, max_connections, progress_callback, validate_content,
                           lease_id, if_modified_since, if_unmodified_since, if_match,
-                          if_none_match, timeout, operation_context, cpk):
+                          if_none_match, timeout, operation_context, cpk, digest=None):
 
-    downloader_class = _ParallelBlobChunkDownloader if max_connections > 1 else _SequentialBlobChunkDownloader
+    if isinstance(stream, memoryview):
+        # The chunks are written straight into a buffer.
+        downloader_class = _BufferBlobChunkDownloader
+    elif max_connections > 1:
+        # Regular files are written with positional writes, which need no lock.
+        if _get_positional_fileno(stream) is not None:
+            downloader_class = _PositionalBlobChunkDownloader
+        else:
+            downloader_class = _ParallelBlobChunkDownloader
+    else:
+        downloader_class = _SequentialBlobChunkDownloader
 
     downloader = downloader_class(
         blob_service,
@@ -36,6 +54,114 @@ def _download_blob_chunks(blob_service, container_name, blob_name, snapshot,
         operation_context,
         cpk,
     )
+    downloader.digest = digest
+
+    if max_connections > 1:
+        import concurrent.futures
+        executor = concurrent.futures.ThreadPoolExecutor(max_connections)
+        try:
+            list(executor.map(downloader.process_chunk, downloader.get_chunk_offsets()))
+        finally:
+            executor.shutdown(wait=False)
+        if downloader_class is _PositionalBlobChunkDownloader:
+            downloader.seek_to_end()
+    else:
+        for chunk in downloader.get_chunk_offsets():
+            downloader.process_chunk(chunk)
+
+
+def _iter_blob_chunks(blob_service, container_name, blob_name, snapshot,
+                      download_size, block_size, progress, start_range, end_range,
+                      read_ahead, progress_callback, validate_content, lease_id,
+                      if_modified_since, if_unmodified_since, if_match, if_none_match,
+                      timeout, operation_context, cpk, decrypt=True, transform=None):
+    downloader = _SequentialBlobChunkDownloader(
+        blob_service,
+        container_name,
+        blob_name,
+        snapshot,
+        download_size,
+        block_size,
+        progress,
+        start_range,
+        end_range,
+        None,
+        progress_callback,
+        validate_content,
+        lease_id,
+        if_modified_since,
+        if_unmodified_since,
+        if_match,
+        if_none_match,
+        timeout,
+        operation_context,
+        cpk,
+    )
+    downloader.decrypt = decrypt
+
+    # The chunks are transformed, such as decrypted, by the threads that download them
+    get_chunk = downloader.get_chunk
+    if transform is not None:
+        get_chunk = lambda chunk_start: transform(downloader.get_chunk(chunk_start))
+
+    if read_ahead < 1:
+        for chunk_start in downloader.get_chunk_offsets():
+            chunk_data = get_chunk(chunk_start)
+            downloader._update_progress(len(chunk_data))
+            yield chunk_data
+        return
+
+    import concurrent.futures
+    executor = concurrent.futures.ThreadPoolExecutor(read_ahead)
+
+    # Keeps read_ahead ranged gets in flight beyond the chunk handed to the consumer,
+    # which bounds the memory used to read_ahead + 1 chunks.
+    pending = deque()
+    try:
+        for chunk_start in downloader.get_chunk_offsets():
+            pending.append(executor.submit(get_chunk, chunk_start))
+            if len(pending) > read_ahead:
+                chunk_data = pending.popleft().result()
+                downloader._update_progress(len(chunk_data))
+                yield chunk_data
+
+        while pending:
+            chunk_data = pending.popleft().result()
+            downloader._update_progress(len(chunk_data))
+            yield chunk_data
+    finally:
+        # the consumer may stop early, in which case the chunks read ahead are dropped
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _download_blob_page_ranges(blob_service, container_name, blob_name, snapshot, page_ranges,
+                               block_size, stream, max_connections, progress_callback,
+                               validate_content, lease_id, if_match, timeout, cpk):
+    downloader = _PageRangeBlobChunkDownloader(
+        blob_service,
+        container_name,
+        blob_name,
+        snapshot,
+        sum(page_range.end - page_range.start + 1 for page_range in page_ranges),
+        block_size,
+        0,
+        0,
+        page_ranges[-1].end + 1 if page_ranges else 0,
+        stream,
+        progress_callback,
+        validate_content,
+        lease_id,
+        None,
+        None,
+        if_match,
+        None,
+        timeout,
+        None,
+        cpk,
+    )
+    downloader.page_ranges = page_ranges
 
     if max_connections > 1:
         import concurrent.futures
@@ -46,7 +172,79 @@ def _download_blob_chunks(blob_service, container_name, blob_name, snapshot,
             downloader.process_chunk(chunk)
 
 
+def _download_blob_ranges(blob_service, container_name, blob_name, snapshot, ranges, max_gap,
+                          max_merged_size, max_connections, validate_content, lease_id, if_match,
+                          timeout, operation_context, cpk):
+    merged_ranges = _coalesce_ranges(ranges, max_gap, max_merged_size)
+    results = [None] * len(ranges)
+
+    def download_merged_range(merged_range, if_match):
+        merged_start, merged_end, indexes = merged_range
+        response = blob_service._get_blob(
+            container_name,
+            blob_name,
+            snapshot=snapshot,
+            start_range=merged_start,
+            end_range=merged_end,
+            validate_content=validate_content,
+            lease_id=lease_id,
+            if_match=if_match,
+            timeout=timeout,
+            _context=operation_context,
+            cpk=cpk,
+        )
+
+        # The requested ranges are views over the content of the merged get,
+        # so slicing them back out does not copy the data.
+        content = memoryview(response.content)
+        for index in indexes:
+            start, end = ranges[index]
+            results[index] = content[start - merged_start:end - merged_start + 1]
+        return response.properties.etag
+
+    if not merged_ranges:
+        return results
+
+    # The first get tells the etag of the blob, which the other gets are locked
+    # on. This can be overriden by the user by specifying '*'
+    etag = download_merged_range(merged_ranges[0], if_match)
+    if_match = if_match if if_match is not None else etag
+
+    if max_connections > 1 and len(merged_ranges) > 2:
+        import concurrent.futures
+        executor = concurrent.futures.ThreadPoolExecutor(max_connections)
+        list(executor.map(lambda merged_range: download_merged_range(merged_range, if_match), merged_ranges[1:]))
+    else:
+        for merged_range in merged_ranges[1:]:
+            download_merged_range(merged_range, if_match)
+
+    return results
+
+
+def _coalesce_ranges(ranges, max_gap, max_merged_size):
+    # Merges the inclusive (start, end) ranges that overlap or are at most max_gap
+    # bytes apart, as long as the merged range spans at most max_merged_size bytes.
+    # Returns the merged ranges as (start, end, indexes of the ranges they cover).
+    merged_ranges = []
+    for index in sorted(range(len(ranges)), key=lambda i: ranges[i]):
+        start, end = ranges[index]
+        if merged_ranges:
+            merged_start, merged_end, indexes = merged_ranges[-1]
+            merged_size = max(merged_end, end) - merged_start + 1
+            if start - merged_end - 1 <= max_gap and merged_size <= max_merged_size:
+                merged_ranges[-1] = (merged_start, max(merged_end, end), indexes + [index])
+                continue
+        merged_ranges.append((start, end, [index]))
+    return merged_ranges
+
+
 class _BlobChunkDownloader(object):
+    # whether the chunks of encrypted blobs are decrypted one by one
+    decrypt = True
+
+    # the _OrderedDigest that hashes the chunks, if any
+    digest = None
+
     def __init__(self, blob_service, container_name, blob_name, snapshot, download_size,
                  chunk_size, progress, start_range, end_range, stream,
                  progress_callback, validate_content, lease_id, if_modified_since,
@@ -88,16 +286,28 @@ class _BlobChunkDownloader(object):
             index += self.chunk_size
 
     def process_chunk(self, chunk_start):
-        if chunk_start + self.chunk_size > self.blob_end:
-            chunk_end = self.blob_end
-        else:
-            chunk_end = chunk_start + self.chunk_size
+        try:
+            chunk_end = self._get_chunk_end(chunk_start)
+            chunk_data = self._download_chunk(chunk_start, chunk_end).content
+            length = chunk_end - chunk_start
+            if length > 0:
+                self._write_to_stream(chunk_data, chunk_start)
+                if self.digest is not None:
+                    self.digest.update(chunk_start, chunk_data)
+                self._update_progress(length)
+        except:
+            # the chunks ahead of this one would wait for it to be hashed
+            if self.digest is not None:
+                self.digest.abort()
+            raise
+
+    def get_chunk(self, chunk_start):
+        return self._download_chunk(chunk_start, self._get_chunk_end(chunk_start)).content
 
-        chunk_data = self._download_chunk(chunk_start, chunk_end).content
-        length = chunk_end - chunk_start
-        if length > 0:
-            self._write_to_stream(chunk_data, chunk_start)
-            self._update_progress(length)
+    def _get_chunk_end(self, chunk_start):
+        if chunk_start + self.chunk_size > self.blob_end:
+            return self.blob_end
+        return chunk_start + self.chunk_size
 
     # should be provided by the subclass
     def _update_progress(self, length):
@@ -123,6 +333,7 @@ class _BlobChunkDownloader(object):
             timeout=self.timeout,
             _context=self.operation_context,
             cpk=self.cpk,
+            _decrypt=self.decrypt,
         )
 
         # This makes sure that if_match is set so that we can validate 
@@ -167,6 +378,73 @@ class _ParallelBlobChunkDownloader(_BlobChunkDownloader):
             self.stream.write(chunk_data)
 
 
+class _PositionalBlobChunkDownloader(_ParallelBlobChunkDownloader):
+    def __init__(self, *args):
+        super(_PositionalBlobChunkDownloader, self).__init__(*args)
+
+        # The chunks are written straight to the file descriptor, so anything
+        # still buffered by the stream must reach the file first.
+        self.stream.flush()
+        self.fileno = self.stream.fileno()
+        _preallocate(self.fileno, self.stream_start, self.blob_end - self.start_index)
+
+    def _write_to_stream(self, chunk_data, chunk_start):
+        # Positional writes do not move a shared file offset, so the workers
+        # can write their chunks concurrently without taking the stream lock.
+        offset = self.stream_start + (chunk_start - self.start_index)
+        data = memoryview(chunk_data)
+        while data:
+            written = os.pwrite(self.fileno, data, offset)
+            offset += written
+            data = data[written:]
+
+    def seek_to_end(self):
+        # The positional writes leave the stream where the download started, so
+        # it is moved past the downloaded range, as a write would have left it.
+        self.stream.seek(self.stream_start + (self.blob_end - self.start_index))
+
+
+class _PageRangeBlobChunkDownloader(_ParallelBlobChunkDownloader):
+    page_ranges = ()
+
+    def get_chunk_offsets(self):
+        # Only the valid page ranges are downloaded, each in chunks that do not
+        # cross the end of the range, and the pages between them are left as
+        # holes in the destination.
+        self._chunk_ends = {}
+        for page_range in self.page_ranges:
+            range_end = page_range.end + 1
+            index = page_range.start
+            while index < range_end:
+                self._chunk_ends[index] = min(index + self.chunk_size, range_end)
+                yield index
+                index += self.chunk_size
+
+    def _get_chunk_end(self, chunk_start):
+        return self._chunk_ends[chunk_start]
+
+
+class _BufferBlobChunkDownloader(_BlobChunkDownloader):
+    def __init__(self, *args):
+        super(_BufferBlobChunkDownloader, self).__init__(*args)
+
+        # the stream is a memoryview over the part of the buffer that starts at start_range
+        self.progress_lock = threading.Lock()
+
+    def _update_progress(self, length):
+        if self.progress_callback is not None:
+            with self.progress_lock:
+                self.progress_total += length
+                total_so_far = self.progress_total
+            self.progress_callback(total_so_far, self.download_size)
+
+    def _write_to_stream(self, chunk_data, chunk_start):
+        # Each chunk is copied once into its own slice of the buffer, so the
+        # workers do not need a lock.
+        offset = chunk_start - self.start_index
+        self.stream[offset:offset + len(chunk_data)] = chunk_data
+
+
 class _SequentialBlobChunkDownloader(_BlobChunkDownloader):
     def __init__(self, *args):
         super(_SequentialBlobChunkDownloader, self).__init__(*args)
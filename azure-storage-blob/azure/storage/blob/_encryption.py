@@ -9,7 +9,10 @@ from json import (
     loads,
 )
 from os import urandom
+from threading import Lock
+from time import time
 
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.padding import PKCS7
 
 from azure.storage.common._encryption import (
@@ -18,18 +21,34 @@ from azure.storage.common._encryption import (
     _dict_to_encryption_data,
     _validate_and_unwrap_cek,
     _EncryptionAlgorithm,
+    _GCM_NONCE_LENGTH,
+    _GCM_REGION_DATA_LENGTH,
+    _GCM_TAG_LENGTH,
 )
 from azure.storage.common._error import (
     _validate_not_none,
+    _validate_encryption_protocol_version,
     _validate_key_encryption_key_wrap,
     _ERROR_DATA_NOT_ENCRYPTED,
     _ERROR_UNSUPPORTED_ENCRYPTION_ALGORITHM,
 )
+from azure.storage.common._constants import (
+    _ENCRYPTION_PROTOCOL_V1,
+    _ENCRYPTION_PROTOCOL_V2,
+)
+from ._error import (
+    _ERROR_RANGED_REGION_DECRYPTION,
+    _ERROR_TRUNCATED_ENCRYPTED_REGION,
+)
 
+# Only blobs support the regions of encryption protocol 2.0
+_BLOB_ENCRYPTION_PROTOCOLS = (_ENCRYPTION_PROTOCOL_V1, _ENCRYPTION_PROTOCOL_V2)
 
-def _encrypt_blob(blob, key_encryption_key):
+
+def _encrypt_blob(blob, key_encryption_key, region_length=None):
     '''
-    Encrypts the given blob using AES256 in CBC mode with 128 bit padding.
+    Encrypts the given blob using AES256 in CBC mode with 128 bit padding, or
+    in GCM mode by regions of region_length bytes if it is set.
     Wraps the generated content-encryption-key using the user-provided key-encryption-key (kek). 
     Returns a json-formatted string containing the encryption metadata. This method should
     only be used when a blob is small enough for single shot upload. Encrypting larger blobs
@@ -42,6 +61,9 @@ def _encrypt_blob(blob, key_encryption_key):
         wrap_key(key)--wraps the specified key using an algorithm of the user's choice.
         get_key_wrap_algorithm()--returns the algorithm used to wrap the specified symmetric key.
         get_kid()--returns a string key id for this key-encryption-key.
+    :param int region_length:
+        The length of the regions encrypted with encryption protocol 2.0. If not
+        set, the blob is encrypted with encryption protocol 1.0.
     :return: A tuple of json-formatted string containing the encryption metadata and the encrypted blob data.
     :rtype: (str, bytes)
     '''
@@ -52,6 +74,14 @@ def _encrypt_blob(blob, key_encryption_key):
 
     # AES256 uses 256 bit (32 byte) keys and always with 16 byte blocks
     content_encryption_key = urandom(32)
+
+    if region_length is not None:
+        encrypted_data = _encrypt_regions(content_encryption_key, region_length, blob)
+        encryption_data = _generate_encryption_data_dict(key_encryption_key, content_encryption_key, None,
+                                                         region_length)
+        encryption_data['EncryptionMode'] = 'FullBlob'
+        return dumps(encryption_data), encrypted_data
+
     initialization_vector = urandom(16)
 
     cipher = _generate_AES_CBC_cipher(content_encryption_key, initialization_vector)
@@ -70,12 +100,15 @@ def _encrypt_blob(blob, key_encryption_key):
     return dumps(encryption_data), encrypted_data
 
 
-def _generate_blob_encryption_data(key_encryption_key):
+def _generate_blob_encryption_data(key_encryption_key, region_length=None):
     '''
     Generates the encryption_metadata for the blob.
     
     :param bytes key_encryption_key:
         The key-encryption-key used to wrap the cek associate with this blob.
+    :param int region_length:
+        The length of the regions encrypted with encryption protocol 2.0, which
+        uses no iv. If not set, the metadata is for encryption protocol 1.0.
     :return: A tuple containing the cek and iv for this blob as well as the 
         serialized encryption metadata for the blob.
     :rtype: (bytes, bytes, str)
@@ -86,10 +119,11 @@ def _generate_blob_encryption_data(key_encryption_key):
     if key_encryption_key:
         _validate_key_encryption_key_wrap(key_encryption_key)
         content_encryption_key = urandom(32)
-        initialization_vector = urandom(16)
+        initialization_vector = urandom(16) if region_length is None else None
         encryption_data = _generate_encryption_data_dict(key_encryption_key,
                                                          content_encryption_key,
-                                                         initialization_vector)
+                                                         initialization_vector,
+                                                         region_length)
         encryption_data['EncryptionMode'] = 'FullBlob'
         encryption_data = dumps(encryption_data)
 
@@ -97,7 +131,8 @@ def _generate_blob_encryption_data(key_encryption_key):
 
 
 def _decrypt_blob(require_encryption, key_encryption_key, key_resolver,
-                  response, start_offset, end_offset):
+                  response, start_offset, end_offset, content_keys=None,
+                  key_cache=None, key_cache_ttl=None):
     '''
     Decrypts the given blob contents and returns only the requested range.
     
@@ -111,6 +146,13 @@ def _decrypt_blob(require_encryption, key_encryption_key, key_resolver,
     :param key_resolver(kid):
         The user-provided key resolver. Uses the kid string to return a key-encryption-key 
         implementing the interface defined above.
+    :param dict content_keys:
+        The content-encryption-keys already unwrapped during this transfer, keyed
+        by the encryption metadata, to which the key of this response is added.
+    :param _ContentKeyCache key_cache:
+        The content-encryption-keys unwrapped by the calling blob service.
+    :param int key_cache_ttl:
+        The number of seconds the keys unwrapped are kept in key_cache.
     :return: The decrypted blob content.
     :rtype: bytes
     '''
@@ -118,16 +160,23 @@ def _decrypt_blob(require_encryption, key_encryption_key, key_resolver,
     content = response.body
     _validate_not_none('content', content)
 
-    try:
-        encryption_data = _dict_to_encryption_data(loads(response.headers['x-ms-meta-encryptiondata']))
-    except:
-        if require_encryption:
-            raise ValueError(_ERROR_DATA_NOT_ENCRYPTED)
+    encryption_metadata = response.headers.get('x-ms-meta-encryptiondata')
+    if content_keys is not None and encryption_metadata in content_keys:
+        # the chunks of a transfer share the metadata, which is parsed and
+        # unwrapped for the first chunk only
+        encryption_data, content_encryption_key = content_keys[encryption_metadata]
+    else:
+        encryption_data, content_encryption_key = _get_blob_content_encryption_key(
+            require_encryption, key_encryption_key, key_resolver, encryption_metadata, key_cache, key_cache_ttl)
+        if encryption_data is None:
+            return content
 
-        return content
+        if content_keys is not None:
+            content_keys[encryption_metadata] = (encryption_data, content_encryption_key)
 
-    if not (encryption_data.encryption_agent.encryption_algorithm == _EncryptionAlgorithm.AES_CBC_256):
-        raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_ALGORITHM)
+    if encryption_data.encrypted_region_info is not None:
+        return _decrypt_whole_blob_regions(encryption_data, content_encryption_key, response, start_offset,
+                                           end_offset)
 
     blob_type = response.headers['x-ms-blob-type']
 
@@ -163,7 +212,6 @@ def _decrypt_blob(require_encryption, key_encryption_key, key_resolver,
     if blob_type == 'PageBlob':
         unpad = False
 
-    content_encryption_key = _validate_and_unwrap_cek(encryption_data, key_encryption_key, key_resolver)
     cipher = _generate_AES_CBC_cipher(content_encryption_key, iv)
     decryptor = cipher.decryptor()
 
@@ -175,6 +223,130 @@ def _decrypt_blob(require_encryption, key_encryption_key, key_resolver,
     return content[start_offset: len(content) - end_offset]
 
 
+def _get_blob_content_encryption_key(require_encryption, key_encryption_key, key_resolver,
+                                     encryption_metadata, key_cache=None, key_cache_ttl=None):
+    '''
+    Parses the encryption metadata of a blob and unwraps its content-encryption-key.
+
+    :return: The encryption data and the content-encryption-key, or (None, None)
+        if the blob is not encrypted and encryption is not required.
+    :rtype: (_EncryptionData, bytes)
+    '''
+    try:
+        encryption_data = _dict_to_encryption_data(loads(encryption_metadata), _BLOB_ENCRYPTION_PROTOCOLS)
+    except:
+        if require_encryption:
+            raise ValueError(_ERROR_DATA_NOT_ENCRYPTED)
+
+        return None, None
+
+    encryption_algorithm = encryption_data.encryption_agent.encryption_algorithm
+    if encryption_data.encrypted_region_info is not None:
+        if encryption_algorithm != _EncryptionAlgorithm.AES_GCM_256:
+            raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_ALGORITHM)
+    elif encryption_algorithm != _EncryptionAlgorithm.AES_CBC_256:
+        raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_ALGORITHM)
+
+    return encryption_data, _unwrap_cek(encryption_data, key_encryption_key, key_resolver,
+                                        key_cache, key_cache_ttl)
+
+
+class _BlobDecryptionStage(object):
+    '''
+    Decrypts the ciphertext of a contiguous range of an encrypted blob as it is
+    received, in order, with a single CBC decryptor that carries the IV from
+    one chunk to the next, and returns only the plaintext of the requested range.
+    Without a content-encryption-key, the data is passed through unchanged.
+    '''
+
+    def __init__(self, content_encryption_key, iv, skip, length, unpad):
+        # skip is the number of leading bytes that precede the requested range,
+        # and length the size of the range, or None if it extends to the end
+        self.decryptor = None
+        self.unpadder = None
+        if content_encryption_key is not None:
+            self.decryptor = _generate_AES_CBC_cipher(content_encryption_key, iv).decryptor()
+            if unpad:
+                self.unpadder = PKCS7(128).unpadder()
+
+        self.skip = skip
+        self.remaining = length
+
+    def update(self, data):
+        if self.decryptor is not None:
+            data = self.decryptor.update(data)
+            if self.unpadder is not None:
+                data = self.unpadder.update(data)
+        return self._trim(data)
+
+    def finalize(self):
+        data = b''
+        if self.decryptor is not None:
+            data = self.decryptor.finalize()
+            if self.unpadder is not None:
+                data = self.unpadder.update(data) + self.unpadder.finalize()
+        return self._trim(data)
+
+    def _trim(self, data):
+        if self.skip:
+            skipped = min(self.skip, len(data))
+            data = data[skipped:]
+            self.skip -= skipped
+        if self.remaining is not None:
+            data = data[:self.remaining]
+            self.remaining -= len(data)
+        return data
+
+
+def _unwrap_cek(encryption_data, key_encryption_key, key_resolver, key_cache, key_cache_ttl):
+    if key_cache is None:
+        return _validate_and_unwrap_cek(encryption_data, key_encryption_key, key_resolver, _BLOB_ENCRYPTION_PROTOCOLS)
+
+    if encryption_data.encrypted_region_info is None:
+        _validate_not_none('content_encryption_IV', encryption_data.content_encryption_IV)
+    _validate_encryption_protocol_version(encryption_data.encryption_agent.protocol, _BLOB_ENCRYPTION_PROTOCOLS)
+
+    wrapped_content_key = encryption_data.wrapped_content_key
+    cache_key = (wrapped_content_key.key_id, wrapped_content_key.algorithm, wrapped_content_key.encrypted_key)
+    content_encryption_key = key_cache.get(cache_key)
+    if content_encryption_key is None:
+        content_encryption_key = _validate_and_unwrap_cek(encryption_data, key_encryption_key, key_resolver,
+                                                          _BLOB_ENCRYPTION_PROTOCOLS)
+        key_cache.set(cache_key, content_encryption_key, key_cache_ttl)
+
+    return content_encryption_key
+
+
+class _ContentKeyCache(object):
+    '''
+    Keeps unwrapped content-encryption-keys for a limited time, keyed by the id
+    of the key-encryption-key, the wrapping algorithm and the wrapped key, so
+    that downloads of blobs sharing a wrapped key do not unwrap it again.
+    '''
+
+    def __init__(self):
+        self._keys = {}
+        self._lock = Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._keys.get(cache_key)
+            if entry is None:
+                return None
+            if entry[1] <= time():
+                del self._keys[cache_key]
+                return None
+            return entry[0]
+
+    def set(self, cache_key, content_encryption_key, ttl):
+        now = time()
+        with self._lock:
+            # drop the expired keys so that the cache does not grow without bound
+            for expired_key in [key for key, entry in self._keys.items() if entry[1] <= now]:
+                del self._keys[expired_key]
+            self._keys[cache_key] = (content_encryption_key, now + ttl)
+
+
 def _get_blob_encryptor_and_padder(cek, iv, should_pad):
     encryptor = None
     padder = None
@@ -185,3 +357,94 @@ def _get_blob_encryptor_and_padder(cek, iv, should_pad):
         padder = PKCS7(128).padder() if should_pad else None
 
     return encryptor, padder
+
+
+def _get_encryption_region_length(block_size):
+    '''
+    Returns the length of the regions encrypted with encryption protocol 2.0 for
+    an upload in blocks of block_size bytes, so that every block but the last
+    holds whole regions and can be encrypted independently of the others.
+    '''
+    if block_size <= _GCM_REGION_DATA_LENGTH:
+        return block_size
+    if block_size % _GCM_REGION_DATA_LENGTH == 0:
+        return _GCM_REGION_DATA_LENGTH
+    return block_size
+
+
+def _get_encrypted_length(length, region_length):
+    # each region is stored along with its nonce and its authentication tag
+    regions = (length + region_length - 1) // region_length
+    return length + regions * (_GCM_NONCE_LENGTH + _GCM_TAG_LENGTH)
+
+
+def _encrypt_regions(content_encryption_key, region_length, data):
+    '''
+    Encrypts the data by regions of region_length bytes with AES256 in GCM mode.
+    Each region is encrypted with its own random nonce, and stored as the nonce,
+    the ciphertext and the authentication tag, so that the regions can be
+    encrypted, decrypted and authenticated independently of one another.
+
+    :param bytes content_encryption_key:
+        The content-encryption-key.
+    :param int region_length:
+        The length of the plaintext of each region. The data must start on a region.
+    :param bytes data:
+        The plaintext.
+    :return: The encrypted regions.
+    :rtype: bytes
+    '''
+    aesgcm = AESGCM(content_encryption_key)
+    view = memoryview(data)
+    regions = []
+    for offset in range(0, len(view), region_length):
+        nonce = urandom(_GCM_NONCE_LENGTH)
+        regions.append(nonce)
+        regions.append(aesgcm.encrypt(nonce, view[offset:offset + region_length].tobytes(), None))
+    return b''.join(regions)
+
+
+def _decrypt_regions(content_encryption_key, encrypted_region_info, data):
+    '''
+    Decrypts and authenticates the regions encrypted by _encrypt_regions. The data
+    must start on a region and hold whole regions, the last of which may be short.
+    Raises cryptography.exceptions.InvalidTag if any region was tampered with.
+
+    :param bytes content_encryption_key:
+        The content-encryption-key.
+    :param ~azure.storage.common._encryption._EncryptedRegionInfo encrypted_region_info:
+        The layout of the regions.
+    :param bytes data:
+        The encrypted regions.
+    :return: The plaintext.
+    :rtype: bytes
+    '''
+    aesgcm = AESGCM(content_encryption_key)
+    nonce_length = encrypted_region_info.nonce_length
+    encrypted_region_length = encrypted_region_info.data_length + nonce_length + encrypted_region_info.tag_length
+    view = memoryview(data)
+    regions = []
+    for offset in range(0, len(view), encrypted_region_length):
+        region = view[offset:offset + encrypted_region_length]
+        if len(region) <= nonce_length + encrypted_region_info.tag_length:
+            raise ValueError(_ERROR_TRUNCATED_ENCRYPTED_REGION)
+        regions.append(aesgcm.decrypt(region[:nonce_length].tobytes(), region[nonce_length:].tobytes(), None))
+    return b''.join(regions)
+
+
+def _decrypt_whole_blob_regions(encryption_data, content_encryption_key, response, start_offset, end_offset):
+    # The regions can only be located in a response that holds the whole blob, as
+    # _get_blob aligns the requested ranges for encryption protocol 1.0. Ranged
+    # downloads of blobs encrypted with protocol 2.0 are aligned on the regions
+    # by get_blob_to_stream instead.
+    if start_offset or end_offset:
+        raise ValueError(_ERROR_RANGED_REGION_DECRYPTION)
+
+    if 'content-range' in response.headers:
+        content_range = response.headers['content-range'].split(' ')[1]
+        start_end, blob_size = content_range.split('/')
+        start_range, end_range = start_end.split('-')
+        if int(start_range) != 0 or int(end_range) != int(blob_size) - 1:
+            raise ValueError(_ERROR_RANGED_REGION_DECRYPTION)
+
+    return _decrypt_regions(content_encryption_key, encryption_data.encrypted_region_info, response.body)
@@ -27,3 +27,21 @@ _ERROR_NO_SINGLE_THREAD_CHUNKING = \
     'To use blob chunk downloader more than 1 thread must be ' + \
     'used since get_blob_to_bytes should be called for single threaded ' + \
     'blob downloads.'
+
+_ERROR_RANGED_REGION_DECRYPTION = \
+    'Ranged gets of blobs encrypted with protocol 2.0 must be aligned on the encrypted regions.'
+
+_ERROR_TRUNCATED_ENCRYPTED_REGION = \
+    'The encrypted region is truncated.'
+
+_ERROR_BLOB_MD5_REQUIRES_WHOLE_DOWNLOAD = \
+    'validate_blob_md5 requires a whole download of a blob that is not client-side encrypted.'
+
+_ERROR_TRUNCATED_GZIP_CONTENT = \
+    'The gzip-encoded content of the blob is truncated.'
+
+_ERROR_DECOMPRESSION_REQUIRES_WHOLE_DOWNLOAD = \
+    'decompress requires a whole download of a blob that is not client-side encrypted.'
+
+_ERROR_COMPRESSION_WITH_ENCRYPTION = \
+    'compress is not supported with client-side encryption.'
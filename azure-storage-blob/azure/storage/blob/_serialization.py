@@ -21,6 +21,8 @@ from azure.storage.common._error import (
     _validate_not_none,
     _ERROR_START_END_NEEDED_FOR_MD5,
     _ERROR_RANGE_TOO_LARGE_FOR_MD5,
+    _ERROR_START_END_NEEDED_FOR_CRC64,
+    _ERROR_RANGE_TOO_LARGE_FOR_CRC64,
 )
 from ._error import (
     _ERROR_PAGE_BLOB_START_ALIGNMENT,
@@ -66,7 +68,7 @@ def _validate_and_add_cpk_headers(request, encryption_key, protocol):
 
 def _validate_and_format_range_headers(request, start_range, end_range, start_range_required=True,
                                        end_range_required=True, check_content_md5=False, align_to_page=False,
-                                       range_header_name='x-ms-range'):
+                                       range_header_name='x-ms-range', check_content_crc64=False):
     # If end range is provided, start range must be provided
     if start_range_required or end_range is not None:
         _validate_not_none('start_range', start_range)
@@ -96,6 +98,15 @@ def _validate_and_format_range_headers(request, start_range, end_range, start_ra
 
         request.headers['x-ms-range-get-content-md5'] = 'true'
 
+    # The same applies to the content CRC64
+    if check_content_crc64:
+        if start_range is None or end_range is None:
+            raise ValueError(_ERROR_START_END_NEEDED_FOR_CRC64)
+        if end_range - start_range > 4 * 1024 * 1024:
+            raise ValueError(_ERROR_RANGE_TOO_LARGE_FOR_CRC64)
+
+        request.headers['x-ms-range-get-content-crc64'] = 'true'
+
 
 def _convert_block_list_to_xml(block_id_list):
     '''
@@ -3,12 +3,16 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+from collections import deque
 from io import (BytesIO, IOBase, SEEK_CUR, SEEK_END, SEEK_SET, UnsupportedOperation)
 from threading import Lock
 
 from math import ceil
 
-from azure.storage.common._common_conversion import _encode_base64
+from azure.storage.common._common_conversion import (
+    _encode_base64,
+    _get_content_checksum,
+)
 from azure.storage.common._error import _ERROR_VALUE_SHOULD_BE_SEEKABLE_STREAM
 from azure.storage.common._serialization import (
     url_quote,
@@ -20,6 +24,7 @@ from ._constants import (
     _LARGE_BLOB_UPLOAD_MAX_READ_BUFFER_SIZE
 )
 from ._encryption import (
+    _encrypt_regions,
     _get_blob_encryptor_and_padder,
 )
 from .models import BlobBlock
@@ -30,7 +35,8 @@ def _upload_blob_chunks(blob_service, container_name, blob_name,
                         progress_callback, validate_content, lease_id, uploader_class,
                         maxsize_condition=None, if_modified_since=None, if_unmodified_since=None, if_match=None,
                         if_none_match=None, timeout=None, cpk=None,
-                        content_encryption_key=None, initialization_vector=None, resource_properties=None):
+                        content_encryption_key=None, initialization_vector=None, resource_properties=None,
+                        read_ahead=0, encryption_region_length=None, cpu_executor=None, digest=None):
     encryptor, padder = _get_blob_encryptor_and_padder(content_encryption_key, initialization_vector,
                                                        uploader_class is not _PageBlobChunkUploader)
 
@@ -53,6 +59,14 @@ def _upload_blob_chunks(blob_service, container_name, blob_name,
 
     uploader.maxsize_condition = maxsize_condition
 
+    # Encryption protocol 2.0 encrypts the regions of each chunk independently,
+    # on the thread that uploads the chunk.
+    if encryption_region_length is not None:
+        uploader.content_encryption_key = content_encryption_key
+        uploader.encryption_region_length = encryption_region_length
+    uploader.cpu_executor = cpu_executor
+    uploader.digest = digest
+
     # Access conditions do not work with parallelism
     if max_connections > 1:
         uploader.if_match = uploader.if_none_match = uploader.if_modified_since = uploader.if_unmodified_since = None
@@ -100,7 +114,14 @@ def _upload_blob_chunks(blob_service, container_name, blob_name,
         # result() will wait until completion and also raise any exceptions that may have been set.
         range_ids = [f.result() for f in futures]
     else:
-        range_ids = [uploader.process_chunk(result) for result in uploader.get_chunk_streams()]
+        chunks = uploader.get_chunk_streams()
+
+        # Prepare the next chunks in the background so that reading and encrypting
+        # them overlaps with the serial upload of the current one.
+        if read_ahead > 0:
+            chunks = _read_ahead(chunks, read_ahead)
+
+        range_ids = [uploader.process_chunk(result) for result in chunks]
 
     if resource_properties and uploader.response_properties is not None:
         resource_properties.clone(uploader.response_properties)
@@ -111,7 +132,7 @@ def _upload_blob_chunks(blob_service, container_name, blob_name,
 def _upload_blob_substream_blocks(blob_service, container_name, blob_name,
                                   blob_size, block_size, stream, max_connections,
                                   progress_callback, validate_content, lease_id, uploader_class,
-                                  maxsize_condition=None, if_match=None, timeout=None, cpk=None):
+                                  maxsize_condition=None, if_match=None, timeout=None, cpk=None, digest=None):
     uploader = uploader_class(
         blob_service,
         container_name,
@@ -130,6 +151,7 @@ def _upload_blob_substream_blocks(blob_service, container_name, blob_name,
     )
 
     uploader.maxsize_condition = maxsize_condition
+    uploader.digest = digest
 
     # ETag matching does not work with parallelism as a ranged upload may start
     # before the previous finishes and provides an etag
@@ -141,14 +163,150 @@ def _upload_blob_substream_blocks(blob_service, container_name, blob_name,
     if max_connections > 1:
         import concurrent.futures
         executor = concurrent.futures.ThreadPoolExecutor(max_connections)
-        range_ids = list(executor.map(uploader.process_substream_block, uploader.get_substream_blocks()))
+        try:
+            range_ids = list(executor.map(uploader.process_substream_block, uploader.get_substream_blocks()))
+        finally:
+            executor.shutdown(wait=False)
     else:
         range_ids = [uploader.process_substream_block(result) for result in uploader.get_substream_blocks()]
 
     return range_ids
 
 
+def _prepare_chunk(content_encryption_key, encryption_region_length, content_validation_algorithm, chunk_data):
+    '''
+    Encrypts the chunk with encryption protocol 2.0 if encryption_region_length
+    is set, and computes the transactional checksum of the chunk to upload with
+    content_validation_algorithm if it is set. This runs on the cpu_executor of
+    the blob service, which may be a process pool, so it is a module level
+    function of picklable arguments.
+
+    :return: The chunk to upload and its checksum, or None.
+    :rtype: (bytes, str)
+    '''
+    if encryption_region_length is not None:
+        chunk_data = _encrypt_regions(content_encryption_key, encryption_region_length, chunk_data)
+    content_checksum = None
+    if content_validation_algorithm is not None:
+        content_checksum = _get_content_checksum(chunk_data, content_validation_algorithm)
+    return chunk_data, content_checksum
+
+
+def _prepare_chunk_on_executor(cpu_executor, content_encryption_key, encryption_region_length,
+                               content_validation_algorithm, chunk_data):
+    # Without an executor, the chunk is encrypted on the calling thread, and its
+    # checksum is left to the request.
+    if cpu_executor is None:
+        return _prepare_chunk(content_encryption_key, encryption_region_length, None, chunk_data)
+    if encryption_region_length is None and content_validation_algorithm is None:
+        return chunk_data, None
+
+    # The calling thread waits for the result, which bounds the chunks being
+    # prepared to the chunks being uploaded.
+    return cpu_executor.submit(_prepare_chunk, content_encryption_key, encryption_region_length,
+                               content_validation_algorithm, chunk_data).result()
+
+
+def _read_ahead(chunks, depth):
+    '''
+    Drains the given chunk generator on a single background thread, keeping up to
+    'depth' chunks prepared ahead of the consumer. Chunks are yielded in their
+    original order, and any exception raised while producing a chunk is re-raised
+    to the consumer when that chunk is reached.
+    '''
+    import concurrent.futures
+
+    chunk_iterator = iter(chunks)
+    end_of_chunks = object()
+
+    # A single worker guarantees the generator is only ever resumed by one thread,
+    # and that the submitted reads complete in stream order.
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    pending = deque()
+    try:
+        for _ in range(depth):
+            pending.append(executor.submit(next, chunk_iterator, end_of_chunks))
+
+        while pending:
+            chunk = pending.popleft().result()
+            if chunk is end_of_chunks:
+                break
+
+            pending.append(executor.submit(next, chunk_iterator, end_of_chunks))
+            yield chunk
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+class _BlockAccumulator(object):
+    '''
+    Re-chunks a sequence of byte strings into blocks of block_size bytes.
+
+    Immutable bytes are referenced rather than copied until a block is complete. A
+    block that lines up with a single input chunk is returned as that very object,
+    and any other block is assembled with a single join.
+    '''
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._pieces = []
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def add(self, data):
+        '''
+        Adds the data and yields the blocks it completes. The returned generator
+        must be exhausted before data is added again.
+        '''
+        if not isinstance(data, bytes):
+            # mutable buffers may be reused by the caller, so they must be copied
+            data = memoryview(data).tobytes()
+
+        view = None
+        offset = 0
+        while offset < len(data):
+            length = min(self.block_size - self._length, len(data) - offset)
+            if length == len(data):
+                self._pieces.append(data)
+            else:
+                view = view if view is not None else memoryview(data)
+                self._pieces.append(view[offset:offset + length])
+            self._length += length
+            offset += length
+
+            if self._length == self.block_size:
+                yield self.pop()
+
+    def pop(self):
+        '''
+        Returns the buffered data, which may be shorter than a block, and empties
+        the accumulator.
+        '''
+        if len(self._pieces) == 1 and isinstance(self._pieces[0], bytes):
+            block = self._pieces[0]
+        else:
+            block = b''.join(self._pieces)
+
+        self._pieces = []
+        self._length = 0
+        return block
+
+
 class _BlobChunkUploader(object):
+    # the key and the region length used to encrypt each chunk with encryption protocol 2.0
+    content_encryption_key = None
+    encryption_region_length = None
+
+    # the executor, such as a process pool, on which the chunks are encrypted and hashed
+    cpu_executor = None
+
+    # the _OrderedDigest that computes the MD5 of the whole stream as it is read, if any
+    digest = None
+
     def __init__(self, blob_service, container_name, blob_name, blob_size,
                  chunk_size, stream, parallel, progress_callback,
                  validate_content, lease_id, timeout, encryptor, padder, cpk):
@@ -191,6 +349,11 @@ class _BlobChunkUploader(object):
                 if temp == b'' or len(data) == self.chunk_size:
                     break
 
+            # the chunks are read in order, so the MD5 of the whole stream is computed
+            # here even if they are uploaded in parallel
+            if self.digest is not None:
+                self.digest.update(self.digest.position, data)
+
             if len(data) == self.chunk_size:
                 if self.padder:
                     data = self.padder.update(data)
@@ -224,8 +387,14 @@ class _BlobChunkUploader(object):
             self.progress_callback(total, self.blob_size)
 
     def _upload_chunk_with_progress(self, chunk_offset, chunk_data):
-        range_id = self._upload_chunk(chunk_offset, chunk_data)
-        self._update_progress(len(chunk_data))
+        length = len(chunk_data)
+        content_validation_algorithm = self.blob_service.content_validation_algorithm if self.validate_content \
+            else None
+        chunk_data, content_checksum = _prepare_chunk_on_executor(
+            self.cpu_executor, self.content_encryption_key, self.encryption_region_length,
+            content_validation_algorithm, chunk_data)
+        range_id = self._upload_chunk(chunk_offset, chunk_data, content_checksum)
+        self._update_progress(length)
         return range_id
 
     def get_substream_blocks(self):
@@ -244,13 +413,19 @@ class _BlobChunkUploader(object):
         for i in range(blocks):
             yield ('BlockId{}'.format("%05d" % i),
                    _SubStream(self.stream, i * self.chunk_size, last_block_size if i == blocks - 1 else self.chunk_size,
-                              lock))
+                              lock, self.digest))
 
     def process_substream_block(self, block_data):
         return self._upload_substream_block_with_progress(block_data[0], block_data[1])
 
     def _upload_substream_block_with_progress(self, block_id, block_stream):
-        range_id = self._upload_substream_block(block_id, block_stream)
+        try:
+            range_id = self._upload_substream_block(block_id, block_stream)
+        except:
+            # the blocks ahead of this one would wait for it to be hashed
+            if self.digest is not None:
+                self.digest.abort()
+            raise
         self._update_progress(len(block_stream))
         return range_id
 
@@ -259,7 +434,7 @@ class _BlobChunkUploader(object):
 
 
 class _BlockBlobChunkUploader(_BlobChunkUploader):
-    def _upload_chunk(self, chunk_offset, chunk_data):
+    def _upload_chunk(self, chunk_offset, chunk_data, content_checksum=None):
         block_id = url_quote(_encode_base64('{0:032d}'.format(chunk_offset)))
         self.blob_service._put_block(
             self.container_name,
@@ -270,6 +445,7 @@ class _BlockBlobChunkUploader(_BlobChunkUploader):
             lease_id=self.lease_id,
             timeout=self.timeout,
             cpk=self.cpk,
+            content_checksum=content_checksum,
         )
         return BlobBlock(block_id)
 
@@ -299,7 +475,7 @@ class _PageBlobChunkUploader(_BlobChunkUploader):
                 return False
         return True
 
-    def _upload_chunk(self, chunk_start, chunk_data):
+    def _upload_chunk(self, chunk_start, chunk_data, content_checksum=None):
         # avoid uploading the empty pages
         if not self._is_chunk_empty(chunk_data):
             chunk_end = chunk_start + len(chunk_data) - 1
@@ -314,6 +490,7 @@ class _PageBlobChunkUploader(_BlobChunkUploader):
                 if_match=self.if_match,
                 timeout=self.timeout,
                 cpk=self.cpk,
+                content_checksum=content_checksum,
             )
 
             if not self.parallel:
@@ -323,7 +500,7 @@ class _PageBlobChunkUploader(_BlobChunkUploader):
 
 
 class _AppendBlobChunkUploader(_BlobChunkUploader):
-    def _upload_chunk(self, chunk_offset, chunk_data):
+    def _upload_chunk(self, chunk_offset, chunk_data, content_checksum=None):
         if not hasattr(self, 'current_length'):
             resp = self.blob_service.append_block(
                 self.container_name,
@@ -358,7 +535,7 @@ class _AppendBlobChunkUploader(_BlobChunkUploader):
 
 
 class _SubStream(IOBase):
-    def __init__(self, wrapped_stream, stream_begin_index, length, lockObj):
+    def __init__(self, wrapped_stream, stream_begin_index, length, lockObj, digest=None):
         # Python 2.7: file-like objects created with open() typically support seek(), but are not
         # derivations of io.IOBase and thus do not implement seekable().
         # Python > 3.0: file-like objects created with open() are derived from io.IOBase.
@@ -382,6 +559,11 @@ class _SubStream(IOBase):
         self._current_buffer_start = 0
         self._current_buffer_size = 0
 
+        # the data read from the wrapped stream is given once to the digest, even
+        # if the sub stream is read again when a request is retried
+        self._digest = digest
+        self._digested_length = 0
+
     def __len__(self):
         return self._length
 
@@ -442,6 +624,7 @@ class _SubStream(IOBase):
                 self._buffer = BytesIO(buffer_from_stream)
                 self._current_buffer_start = self._position
                 self._current_buffer_size = len(buffer_from_stream)
+                self._update_digest(buffer_from_stream)
 
                 # read the remaining bytes from the new buffer and update position
                 second_read_buffer = self._buffer.read(bytes_remaining)
@@ -453,6 +636,18 @@ class _SubStream(IOBase):
     def readable(self):
         return True
 
+    def _update_digest(self, buffer_from_stream):
+        # This runs outside of the lock of the wrapped stream, since the digest
+        # may wait for the sub streams that precede this one.
+        if self._digest is None:
+            return
+
+        buffer_end = self._current_buffer_start + len(buffer_from_stream)
+        if self._current_buffer_start <= self._digested_length < buffer_end:
+            self._digest.update(self._stream_begin_index + self._digested_length,
+                                buffer_from_stream[self._digested_length - self._current_buffer_start:])
+            self._digested_length = buffer_end
+
     def readinto(self, b):
         raise UnsupportedOperation
 
@@ -10,7 +10,6 @@ from azure.storage.common._common_conversion import (
     _to_str,
     _int_to_str,
     _datetime_to_utc_string,
-    _get_content_md5,
 )
 from azure.storage.common._constants import (
     SERVICE_HOST_BASE,
@@ -25,6 +24,7 @@ from azure.storage.common._error import (
 from azure.storage.common._http import HTTPRequest
 from azure.storage.common._serialization import (
     _get_data_bytes_only,
+    _add_content_checksum_header,
     _add_metadata_headers,
 )
 from ._deserialization import (
@@ -36,6 +36,9 @@ from ._serialization import (
     _validate_and_format_range_headers,
     _validate_and_add_cpk_headers,
 )
+from ._constants import (
+    _PIPELINED_UPLOAD_READ_AHEAD,
+)
 from ._upload_chunking import (
     _AppendBlobChunkUploader,
     _upload_blob_chunks,
@@ -295,8 +298,7 @@ class AppendBlobService(BaseBlobService):
         request.body = _get_data_bytes_only('block', block)
 
         if validate_content:
-            computed_md5 = _get_content_md5(request.body)
-            request.headers['Content-MD5'] = _to_str(computed_md5)
+            _add_content_checksum_header(request, self.content_validation_algorithm)
 
         return self._perform_request(request, _parse_append_block)
 
@@ -430,7 +432,7 @@ class AppendBlobService(BaseBlobService):
             self, container_name, blob_name, file_path, validate_content=False,
             maxsize_condition=None, progress_callback=None, lease_id=None, timeout=None,
             if_modified_since=None, if_unmodified_since=None, if_match=None,
-            if_none_match=None, cpk=None):
+            if_none_match=None, cpk=None, use_pipelined_upload=False):
         '''
         Appends to the content of an existing blob from a file path, with automatic
         chunking and progress notifications.
@@ -491,6 +493,13 @@ class AppendBlobService(BaseBlobService):
             Use of customer-provided keys must be done over HTTPS.
             As the encryption key itself is provided in the request,
             a secure connection must be established to transfer the key.
+        :param bool use_pipelined_upload:
+            If True, the next chunks of the stream are read (and prepared) on a
+            background thread while the current chunk is being appended. Appends are
+            still sent one at a time and in order, so the append position condition
+            of each block is preserved. This overlaps reads from slow sources, such as
+            disks, with the network transfer at the cost of buffering a few extra
+            blocks of MAX_BLOCK_SIZE in memory.
         :return: ETag and last modified properties for the Append Blob
         :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
         '''
@@ -515,7 +524,8 @@ class AppendBlobService(BaseBlobService):
                 if_unmodified_since=if_unmodified_since,
                 if_match=if_match,
                 if_none_match=if_none_match,
-                cpk=cpk)
+                cpk=cpk,
+                use_pipelined_upload=use_pipelined_upload)
 
     def append_blob_from_bytes(
             self, container_name, blob_name, blob, index=0, count=None,
@@ -722,7 +732,7 @@ class AppendBlobService(BaseBlobService):
             self, container_name, blob_name, stream, count=None,
             validate_content=False, maxsize_condition=None, progress_callback=None,
             lease_id=None, timeout=None, if_modified_since=None, if_unmodified_since=None, if_match=None,
-            if_none_match=None, cpk=None):
+            if_none_match=None, cpk=None, use_pipelined_upload=False):
         '''
         Appends to the content of an existing blob from a file/stream, with
         automatic chunking and progress notifications.
@@ -786,6 +796,13 @@ class AppendBlobService(BaseBlobService):
             Use of customer-provided keys must be done over HTTPS.
             As the encryption key itself is provided in the request,
             a secure connection must be established to transfer the key.
+        :param bool use_pipelined_upload:
+            If True, the next chunks of the stream are read (and prepared) on a
+            background thread while the current chunk is being appended. Appends are
+            still sent one at a time and in order, so the append position condition
+            of each block is preserved. This overlaps reads from slow sources, such as
+            disks, with the network transfer at the cost of buffering a few extra
+            blocks of MAX_BLOCK_SIZE in memory.
         :return: ETag and last modified properties for the Append Blob
         :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
         '''
@@ -818,6 +835,7 @@ class AppendBlobService(BaseBlobService):
             if_match=if_match,
             if_none_match=if_none_match,
             cpk=cpk,
+            read_ahead=_PIPELINED_UPLOAD_READ_AHEAD if use_pipelined_upload else 0,
         )
 
         return resource_properties
@@ -0,0 +1,277 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import time
+from collections import deque
+from io import IOBase
+from threading import (
+    Condition,
+    Thread,
+)
+
+from azure.storage.common._error import _validate_not_none
+
+from .models import AppendBlobWriterStatistics
+
+
+class AppendBlobWriter(IOBase):
+    '''
+    A writable file-like object that appends the data written to it to an existing
+    append blob.
+
+    Small writes are coalesced into blocks of up to block_size bytes, so that many
+    tiny writes cost a single append block request. A block is sealed and handed to a
+    background flusher as soon as it is full, when flush() or close() is called, or
+    when the oldest buffered byte is older than flush_interval seconds. The flusher
+    appends blocks one at a time and in order, pinning every append after the first
+    to the expected position with appendpos_condition, so that interleaved writers
+    are detected instead of silently corrupting the blob.
+
+    Errors raised by the background flusher are re-raised by the next call to
+    write(), flush() or close(). Data written after a failure is not appended.
+    '''
+    _flusher = None
+    _closing = False
+
+    def __init__(self, blob_service, container_name, blob_name, block_size=None,
+                 flush_interval=None, max_pending_blocks=2, validate_content=False,
+                 maxsize_condition=None, lease_id=None, timeout=None, cpk=None):
+        '''
+        :param ~azure.storage.blob.appendblobservice.AppendBlobService blob_service:
+            The service used to append the blocks.
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of existing append blob.
+        :param int block_size:
+            The size of the blocks to append. Defaults to blob_service.MAX_BLOCK_SIZE.
+        :param float flush_interval:
+            If set, the maximum time in seconds that written data is buffered before
+            it is appended, even if the block is not full.
+        :param int max_pending_blocks:
+            The number of sealed blocks that may wait for the flusher. Writes block
+            once this many blocks are waiting, which bounds the memory used to
+            roughly (max_pending_blocks + 2) * block_size.
+        :param bool validate_content:
+            If true, calculates an MD5 hash of each block. The storage service
+            checks the hash of the content that has arrived with the hash that
+            was sent.
+        :param int maxsize_condition:
+            Optional conditional header. The max length in bytes permitted for
+            the append blob.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. It applies to each
+            append block request individually.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Encrypts the data on the service-side with the given key.
+        '''
+        _validate_not_none('blob_service', blob_service)
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+
+        block_size = block_size or blob_service.MAX_BLOCK_SIZE
+        if block_size < 1:
+            raise ValueError('block_size should be greater than 0.')
+        if max_pending_blocks < 1:
+            raise ValueError('max_pending_blocks should be greater than 0.')
+
+        self.blob_service = blob_service
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.max_pending_blocks = max_pending_blocks
+        self.validate_content = validate_content
+        self.maxsize_condition = maxsize_condition
+        self.lease_id = lease_id
+        self.timeout = timeout
+        self.cpk = cpk
+
+        # properties returned by the last successful append
+        self.response_properties = None
+
+        self._condition = Condition()
+        self._buffer = bytearray()
+        self._buffer_started = None
+        self._sealed_blocks = deque()
+        self._in_flight = False
+        self._closing = False
+        self._error = None
+        self._append_position = None
+        self._bytes_written = 0
+        self._total_flush_latency = 0.0
+        self._statistics = AppendBlobWriterStatistics()
+
+        self._flusher = Thread(target=self._flush_blocks)
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    @property
+    def statistics(self):
+        '''
+        A snapshot of the statistics collected so far.
+
+        :rtype: :class:`~azure.storage.blob.models.AppendBlobWriterStatistics`
+        '''
+        with self._condition:
+            statistics = AppendBlobWriterStatistics()
+            statistics.__dict__.update(self._statistics.__dict__)
+            statistics.pending_bytes = self._bytes_written - statistics.bytes_appended
+            return statistics
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._bytes_written
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        data = memoryview(b)
+        if data.itemsize != 1:
+            data = memoryview(data.tobytes())
+
+        with self._condition:
+            self._raise_if_failed()
+
+            offset = 0
+            while offset < len(data):
+                # Throttle the writer while the flusher is behind.
+                while len(self._sealed_blocks) >= self.max_pending_blocks and self._error is None:
+                    self._condition.wait()
+                self._raise_if_failed()
+
+                if not self._buffer:
+                    self._buffer_started = time.time()
+
+                length = min(self.block_size - len(self._buffer), len(data) - offset)
+                self._buffer.extend(data[offset:offset + length])
+                offset += length
+                self._bytes_written += length
+
+                if len(self._buffer) == self.block_size:
+                    self._seal_buffer()
+
+            # wake up the flusher so that it tracks the flush interval of the new data
+            self._condition.notify_all()
+
+        return len(data)
+
+    def flush(self):
+        '''
+        Appends all the data written so far and waits for the service to
+        acknowledge it.
+        '''
+        if self.closed or self._flusher is None or self._closing:
+            return
+
+        with self._condition:
+            if self._buffer:
+                self._seal_buffer()
+
+            while (self._sealed_blocks or self._in_flight) and self._error is None:
+                self._condition.wait()
+
+            self._raise_if_failed()
+
+    def close(self):
+        '''
+        Flushes the remaining data and stops the background flusher.
+        '''
+        if self.closed or self._flusher is None:
+            IOBase.close(self)
+            return
+
+        try:
+            self.flush()
+        finally:
+            with self._condition:
+                self._closing = True
+                self._condition.notify_all()
+            self._flusher.join()
+            IOBase.close(self)
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def _seal_buffer(self):
+        # must be called while holding the condition
+        self._sealed_blocks.append((bytes(self._buffer), time.time()))
+        self._buffer = bytearray()
+        self._buffer_started = None
+        self._condition.notify_all()
+
+    def _next_block(self):
+        with self._condition:
+            while not self._sealed_blocks:
+                if self._closing or self._error is not None:
+                    return None
+
+                if self._buffer and self.flush_interval is not None:
+                    remaining = self._buffer_started + self.flush_interval - time.time()
+                    if remaining <= 0:
+                        self._seal_buffer()
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+
+            self._in_flight = True
+            return self._sealed_blocks.popleft()
+
+    def _flush_blocks(self):
+        while True:
+            next_block = self._next_block()
+            if next_block is None:
+                return
+
+            try:
+                self._append_block(*next_block)
+            except Exception as ex:
+                with self._condition:
+                    self._error = ex
+                    self._in_flight = False
+                    self._condition.notify_all()
+                return
+
+    def _append_block(self, block, sealed_time):
+        resp = self.blob_service.append_block(
+            self.container_name,
+            self.blob_name,
+            block,
+            validate_content=self.validate_content,
+            maxsize_condition=self.maxsize_condition,
+            appendpos_condition=self._append_position,
+            lease_id=self.lease_id,
+            timeout=self.timeout,
+            cpk=self.cpk,
+        )
+        latency = time.time() - sealed_time
+
+        with self._condition:
+            self._append_position = resp.append_offset + len(block)
+            self.response_properties = resp
+
+            statistics = self._statistics
+            statistics.blocks_appended += 1
+            statistics.bytes_appended += len(block)
+            statistics.average_batch_size = statistics.bytes_appended / float(statistics.blocks_appended)
+            self._total_flush_latency += latency
+            statistics.average_flush_latency = self._total_flush_latency / statistics.blocks_appended
+            statistics.max_flush_latency = max(statistics.max_flush_latency, latency)
+
+            self._in_flight = False
+            self._condition.notify_all()
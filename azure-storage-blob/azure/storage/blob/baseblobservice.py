@@ -7,7 +7,10 @@ import sys
 import uuid
 from abc import ABCMeta
 
-from azure.common import AzureHttpError
+from azure.common import (
+    AzureException,
+    AzureHttpError,
+)
 
 from azure.storage.common._auth import (
     _StorageSASAuthentication,
@@ -18,11 +21,16 @@ from azure.storage.common._common_conversion import (
     _int_to_str,
     _to_str,
     _datetime_to_utc_string,
+    _OrderedDigest,
 )
 from azure.storage.common._connection import _ServiceParameters
 from azure.storage.common._constants import (
     SERVICE_HOST_BASE,
     DEFAULT_PROTOCOL,
+    _CONTENT_VALIDATION_CRC64,
+    _CONTENT_VALIDATION_MD5,
+    _ENCRYPTION_PROTOCOL_V1,
+    _ENCRYPTION_PROTOCOL_V2,
 )
 from azure.storage.common._deserialization import (
     _convert_xml_to_service_properties,
@@ -36,9 +44,13 @@ from azure.storage.common._error import (
     _dont_fail_on_exist,
     _validate_not_none,
     _validate_decryption_required,
+    _validate_encryption_unsupported,
+    _ERROR_DECRYPTION_FAILURE,
     _validate_access_policies,
     _ERROR_PARALLEL_NOT_SEEKABLE,
     _validate_user_delegation_key,
+    _validate_content_match,
+    _validate_content_validation_algorithm,
 )
 from azure.storage.common._http import HTTPRequest
 from azure.storage.common._serialization import (
@@ -69,8 +81,25 @@ from ._deserialization import (
     _parse_account_information,
     _convert_xml_to_user_delegation_key,
     _ingest_batch_response)
-from ._download_chunking import _download_blob_chunks
+from ._directory_transfer import _download_directory
+from ._encryption import (
+    _BlobDecryptionStage,
+    _ContentKeyCache,
+    _decrypt_regions,
+    _get_blob_content_encryption_key,
+)
+from ._compression import (
+    _GZIP_CONTENT_ENCODING,
+    _DecompressingWriter,
+)
+from ._download_chunking import (
+    _download_blob_chunks,
+    _download_blob_ranges,
+    _iter_blob_chunks,
+)
 from ._error import (
+    _ERROR_BLOB_MD5_REQUIRES_WHOLE_DOWNLOAD,
+    _ERROR_DECOMPRESSION_REQUIRES_WHOLE_DOWNLOAD,
     _ERROR_INVALID_LEASE_DURATION,
     _ERROR_INVALID_LEASE_BREAK_PERIOD,
 )
@@ -146,6 +175,45 @@ class BaseBlobService(StorageClient):
         A flag that may be set to ensure that all messages successfully uploaded to the queue and all those downloaded and
         successfully read from the queue are/were encrypted while on the server. If this flag is set, all required
         parameters for encryption/decryption must be provided. See the above comments on the key_encryption_key and resolver.
+    :ivar int content_key_cache_ttl:
+        If set, the content-encryption-keys unwrapped with the key_encryption_key or
+        the key_resolver_function are kept for this number of seconds, keyed by the
+        key id and the wrapped key, so that downloading blobs that share a wrapped
+        key does not call unwrap_key again. Within a single download, the key is
+        unwrapped once regardless of this setting.
+    :ivar str encryption_version:
+        The client-side encryption protocol used to encrypt the uploaded block blobs
+        when a key_encryption_key is set. '1.0' (the default) encrypts the whole
+        blob with AES-CBC, so the blocks are encrypted one after the other. '2.0'
+        encrypts independent regions of up to 4MB with AES-GCM, so the blocks are
+        encrypted in parallel along with their upload, and every region of the blob
+        is authenticated when it is downloaded. Blobs encrypted with either protocol
+        are decrypted regardless of this setting, but ranged downloads of blobs
+        encrypted with '2.0' start with a smaller get when it is set to '2.0'.
+    :ivar concurrent.futures.Executor cpu_executor:
+        An optional executor, such as a concurrent.futures.ProcessPoolExecutor, on
+        which chunked transfers run the per-chunk CPU work that would otherwise
+        share the interpreter lock with the threads driving the connections: the
+        MD5 of the blocks and pages uploaded with validate_content, and the
+        encryption and decryption of the chunks with encryption protocol 2.0.
+        The chunks are passed to the executor by value. The executor is owned by
+        the caller, who shuts it down.
+    :ivar str content_validation_algorithm:
+        The transactional checksum sent with the uploads and checked on the
+        downloads that set validate_content. 'md5' (the default) uses the
+        Content-MD5 header. 'crc64' uses the x-ms-content-crc64 header, with the
+        CRC64 that the service also computes. The CRC64 is computed by the C
+        extension of crcmod if it is installed, at a cost close to the MD5 of
+        hashlib. Otherwise, it is computed in Python, which is about 45 times
+        slower than MD5, so it is best combined with a cpu_executor for chunked
+        uploads. Either is returned by the service only for ranges of up to 4MB,
+        so the first get of a validated download is limited to
+        MAX_CHUNK_GET_SIZE either way.
+    :ivar ~azure.storage.blob.blobcache.BlobCache blob_cache:
+        An optional local cache of downloaded blobs. If set, whole downloads by the
+        get_blob_to_path, get_blob_to_stream and get_blob_to_bytes methods without
+        ranges, access conditions or encryption are served from the cache when the
+        etag of the blob has not changed.
     '''
 
     __metaclass__ = ABCMeta
@@ -230,6 +298,12 @@ class BaseBlobService(StorageClient):
         self.require_encryption = False
         self.key_encryption_key = None
         self.key_resolver_function = None
+        self.encryption_version = _ENCRYPTION_PROTOCOL_V1
+        self.cpu_executor = None
+        self.content_validation_algorithm = _CONTENT_VALIDATION_MD5
+        self.blob_cache = None
+        self.content_key_cache_ttl = None
+        self._content_key_cache = _ContentKeyCache()
         self._X_MS_VERSION = X_MS_VERSION
         self._update_user_agent_string(package_version)
 
@@ -1767,7 +1841,7 @@ class BaseBlobService(StorageClient):
             self, container_name, blob_name, snapshot=None, start_range=None,
             end_range=None, validate_content=False, lease_id=None, if_modified_since=None,
             if_unmodified_since=None, if_match=None, if_none_match=None, timeout=None, cpk=None,
-            _context=None):
+            _context=None, _decrypt=True):
         '''
         Downloads a blob's content, metadata, and properties. You can also
         call this API to read a snapshot. You can specify a range if you don't
@@ -1837,8 +1911,12 @@ class BaseBlobService(StorageClient):
                                       self.key_encryption_key,
                                       self.key_resolver_function)
 
+        # The ciphertext is returned as is if the caller decrypts it
+        key_encryption_key = self.key_encryption_key if _decrypt else None
+        key_resolver_function = self.key_resolver_function if _decrypt else None
+
         start_offset, end_offset = 0, 0
-        if self.key_encryption_key is not None or self.key_resolver_function is not None:
+        if key_encryption_key is not None or key_resolver_function is not None:
             if start_range is not None:
                 # Align the start of the range along a 16 byte block
                 start_offset = start_range % 16
@@ -1872,18 +1950,27 @@ class BaseBlobService(StorageClient):
             'If-None-Match': _to_str(if_none_match),
         }
         _validate_and_add_cpk_headers(request, encryption_key=cpk, protocol=self.protocol)
+        if validate_content:
+            _validate_content_validation_algorithm(self.content_validation_algorithm)
         _validate_and_format_range_headers(
             request,
             start_range,
             end_range,
             start_range_required=False,
             end_range_required=False,
-            check_content_md5=validate_content)
+            check_content_md5=validate_content and self.content_validation_algorithm != _CONTENT_VALIDATION_CRC64,
+            check_content_crc64=validate_content and self.content_validation_algorithm == _CONTENT_VALIDATION_CRC64)
+
+        # The keys unwrapped for the first chunk of a transfer are reused for the
+        # others, and for other transfers if the client-level cache is enabled.
+        content_keys = _context.content_keys if _context is not None else None
+        key_cache = self._content_key_cache if self.content_key_cache_ttl else None
 
         return self._perform_request(request, _parse_blob,
                                      [blob_name, snapshot, validate_content, self.require_encryption,
-                                      self.key_encryption_key, self.key_resolver_function,
-                                      start_offset, end_offset],
+                                      key_encryption_key, key_resolver_function,
+                                      start_offset, end_offset, content_keys, key_cache,
+                                      self.content_key_cache_ttl],
                                      operation_context=_context)
 
     def get_blob_to_path(
@@ -1891,7 +1978,8 @@ class BaseBlobService(StorageClient):
             snapshot=None, start_range=None, end_range=None,
             validate_content=False, progress_callback=None,
             max_connections=2, lease_id=None, if_modified_since=None,
-            if_unmodified_since=None, if_match=None, if_none_match=None, timeout=None, cpk=None):
+            if_unmodified_since=None, if_match=None, if_none_match=None, timeout=None, cpk=None,
+            validate_blob_md5=False, decompress=False):
         '''
         Downloads a blob to a file path, with automatic chunking and progress
         notifications. Returns an instance of :class:`~azure.storage.blob.models.Blob` with
@@ -1947,7 +2035,9 @@ class BaseBlobService(StorageClient):
             used, network requests are very expensive, or a non-seekable stream 
             prevents parallel download. This may also be useful if many blobs are 
             expected to be empty as an extra request is required for empty blobs 
-            if max_connections is greater than 1.
+            if max_connections is greater than 1. Where the platform supports it,
+            the file is preallocated and the chunks are written in place with
+            positional writes, without serializing the threads on a lock.
         :param str lease_id:
             Required if the blob has an active lease.
         :param datetime if_modified_since:
@@ -1980,6 +2070,23 @@ class BaseBlobService(StorageClient):
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
             each call individually.
+        :param bool validate_blob_md5:
+            If true, the MD5 of the whole blob is computed while it is downloaded,
+            by hashing the chunks in order as soon as they form a contiguous prefix
+            even if they complete out of order, and is compared with the MD5
+            stored with the blob, so that its integrity is verified without
+            reading the content again. The computed MD5 is returned as the
+            content_md5 of the blob properties. Only whole downloads of blobs
+            that are not client-side encrypted can be verified. Otherwise, the
+            content_md5 of a whole download is the MD5 stored with the blob,
+            which is not verified.
+        :param bool decompress:
+            If true and the content_encoding of the blob is 'gzip', the content is
+            decompressed as it is downloaded, and the decompressed content is
+            written instead. The chunks of a parallel download are decompressed in
+            order, as with ordered_writes. The properties still describe the
+            stored blob. Only whole downloads of blobs that are not client-side
+            encrypted can be decompressed.
         :return: A Blob with properties and metadata. If max_connections is greater 
             than 1, the content_md5 (if set on the blob) will not be returned. If you 
             require this value, either use get_blob_properties or set max_connections 
@@ -2011,7 +2118,9 @@ class BaseBlobService(StorageClient):
                 if_match,
                 if_none_match,
                 timeout=timeout,
-                cpk=cpk)
+                cpk=cpk,
+                validate_blob_md5=validate_blob_md5,
+                decompress=decompress)
 
         return blob
 
@@ -2020,7 +2129,8 @@ class BaseBlobService(StorageClient):
             start_range=None, end_range=None, validate_content=False,
             progress_callback=None, max_connections=2, lease_id=None,
             if_modified_since=None, if_unmodified_since=None, if_match=None,
-            if_none_match=None, timeout=None, cpk=None):
+            if_none_match=None, timeout=None, cpk=None, ordered_writes=False,
+            validate_blob_md5=False, decompress=False):
 
         '''
         Downloads a blob to a stream, with automatic chunking and progress
@@ -2071,9 +2181,9 @@ class BaseBlobService(StorageClient):
             If set to 1, a single large get request will be done. This is not 
             generally recommended but available if very few threads should be 
             used, network requests are very expensive, or a non-seekable stream 
-            prevents parallel download. This may also be useful if many blobs are 
-            expected to be empty as an extra request is required for empty blobs 
-            if max_connections is greater than 1.
+            prevents parallel download and ordered_writes is not set. This may 
+            also be useful if many blobs are expected to be empty as an extra 
+            request is required for empty blobs if max_connections is greater than 1.
         :param str lease_id:
             Required if the blob has an active lease.
         :param datetime if_modified_since:
@@ -2106,6 +2216,29 @@ class BaseBlobService(StorageClient):
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
             each call individually.
+        :param bool ordered_writes:
+            If true, the chunks of a parallel download are written to the stream
+            strictly in order, so that the stream does not need to be seekable,
+            for example a socket or stdout. Up to max_connections chunks are
+            downloaded ahead of the next chunk to write, and at most
+            max_connections + 1 chunks are held in memory.
+        :param bool validate_blob_md5:
+            If true, the MD5 of the whole blob is computed while it is downloaded,
+            by hashing the chunks in order as soon as they form a contiguous prefix
+            even if they complete out of order, and is compared with the MD5
+            stored with the blob, so that its integrity is verified without
+            reading the content again. The computed MD5 is returned as the
+            content_md5 of the blob properties. Only whole downloads of blobs
+            that are not client-side encrypted can be verified. Otherwise, the
+            content_md5 of a whole download is the MD5 stored with the blob,
+            which is not verified.
+        :param bool decompress:
+            If true and the content_encoding of the blob is 'gzip', the content is
+            decompressed as it is downloaded, and the decompressed content is
+            written instead. The chunks of a parallel download are decompressed in
+            order, as with ordered_writes. The properties still describe the
+            stored blob. Only whole downloads of blobs that are not client-side
+            encrypted can be decompressed.
         :return: A Blob with properties and metadata. If max_connections is greater 
             than 1, the content_md5 (if set on the blob) will not be returned. If you 
             require this value, either use get_blob_properties or set max_connections 
@@ -2119,8 +2252,17 @@ class BaseBlobService(StorageClient):
         if end_range is not None:
             _validate_not_none("start_range", start_range)
 
-        # the stream must be seekable if parallel download is required
-        if max_connections > 1:
+        if validate_blob_md5 and (start_range or end_range is not None or self.key_encryption_key is not None or
+                                  self.key_resolver_function is not None):
+            raise ValueError(_ERROR_BLOB_MD5_REQUIRES_WHOLE_DOWNLOAD)
+
+        if decompress and (start_range or end_range is not None or self.key_encryption_key is not None or
+                           self.key_resolver_function is not None):
+            raise ValueError(_ERROR_DECOMPRESSION_REQUIRES_WHOLE_DOWNLOAD)
+
+        # the stream must be seekable if parallel download is required, unless
+        # the chunks are written in order
+        if max_connections > 1 and not ordered_writes and not decompress:
             if sys.version_info >= (3,) and not stream.seekable():
                 raise ValueError(_ERROR_PARALLEL_NOT_SEEKABLE)
 
@@ -2129,78 +2271,67 @@ class BaseBlobService(StorageClient):
             except (NotImplementedError, AttributeError):
                 raise ValueError(_ERROR_PARALLEL_NOT_SEEKABLE)
 
+        # The cached entries are not hashed or decompressed again when they are used
+        if self.blob_cache is not None and not validate_blob_md5 and not decompress and \
+                self._can_use_blob_cache(start_range, end_range, if_modified_since, if_unmodified_since, if_match,
+                                         if_none_match, cpk):
+            return self._get_blob_to_stream_with_cache(container_name, blob_name, stream, snapshot,
+                                                       validate_content, progress_callback, max_connections,
+                                                       lease_id, timeout)
+
+        if self.key_encryption_key is not None or self.key_resolver_function is not None:
+            return self._download_encrypted_blob_to_stream(container_name, blob_name, stream, snapshot,
+                                                           start_range, end_range, validate_content,
+                                                           progress_callback, max_connections, lease_id,
+                                                           if_modified_since, if_unmodified_since, if_match,
+                                                           if_none_match, timeout, cpk)
+
+        return self._download_blob_to_stream(container_name, blob_name, stream, snapshot, start_range, end_range,
+                                             validate_content, progress_callback, max_connections, lease_id,
+                                             if_modified_since, if_unmodified_since, if_match, if_none_match,
+                                             timeout, cpk, ordered_writes, validate_blob_md5, decompress)
+
+    def _download_blob_to_stream(self, container_name, blob_name, stream, snapshot, start_range, end_range,
+                                 validate_content, progress_callback, max_connections, lease_id,
+                                 if_modified_since, if_unmodified_since, if_match, if_none_match,
+                                 timeout, cpk, ordered_writes, validate_blob_md5=False, decompress=False,
+                                 cache_writer=None):
         # The service only provides transactional MD5s for chunks under 4MB.
         # If validate_content is on, get only self.MAX_CHUNK_GET_SIZE for the first
         # chunk so a transactional MD5 can be retrieved.
         first_get_size = self.MAX_SINGLE_GET_SIZE if not validate_content else self.MAX_CHUNK_GET_SIZE
-
-        initial_request_start = start_range if start_range is not None else 0
-
-        if end_range is not None and end_range - start_range < first_get_size:
-            initial_request_end = end_range
-        else:
-            initial_request_end = initial_request_start + first_get_size - 1
-
-        # Send a context object to make sure we always retry to the initial location
-        operation_context = _OperationContext(location_lock=True)
-        try:
-            blob = self._get_blob(container_name,
-                                  blob_name,
-                                  snapshot,
-                                  start_range=initial_request_start,
-                                  end_range=initial_request_end,
-                                  validate_content=validate_content,
-                                  lease_id=lease_id,
-                                  if_modified_since=if_modified_since,
-                                  if_unmodified_since=if_unmodified_since,
-                                  if_match=if_match,
-                                  if_none_match=if_none_match,
-                                  timeout=timeout,
-                                  _context=operation_context,
-                                  cpk=cpk)
-
-            # Parse the total blob size and adjust the download size if ranges
-            # were specified
-            blob_size = _parse_length_from_content_range(blob.properties.content_range)
-            if end_range is not None:
-                # Use the end_range unless it is over the end of the blob
-                download_size = min(blob_size, end_range - start_range + 1)
-            elif start_range is not None:
-                download_size = blob_size - start_range
-            else:
-                download_size = blob_size
-        except AzureHttpError as ex:
-            if start_range is None and ex.status_code == 416:
-                # Get range will fail on an empty blob. If the user did not
-                # request a range, do a regular get request in order to get
-                # any properties.
-                blob = self._get_blob(container_name,
-                                      blob_name,
-                                      snapshot,
-                                      validate_content=validate_content,
-                                      lease_id=lease_id,
-                                      if_modified_since=if_modified_since,
-                                      if_unmodified_since=if_unmodified_since,
-                                      if_match=if_match,
-                                      if_none_match=if_none_match,
-                                      timeout=timeout,
-                                      _context=operation_context,
-                                      cpk=cpk)
-
-                # Set the download size to empty
-                download_size = 0
-            else:
-                raise ex
+        blob, blob_size, download_size, initial_request_end, operation_context = self._get_first_blob_range(
+            container_name, blob_name, snapshot, start_range, end_range, first_get_size, validate_content,
+            lease_id, if_modified_since, if_unmodified_since, if_match, if_none_match, timeout, cpk)
 
         # Mark the first progress chunk. If the blob is small or this is a single
         # shot download, this is the only call
         if progress_callback:
             progress_callback(blob.properties.content_length, download_size)
 
+        # The MD5 of the whole blob is computed as the chunks complete
+        digest = _OrderedDigest(0, 2 * max_connections * self.MAX_CHUNK_GET_SIZE) if validate_blob_md5 else None
+
+        # The blob cache keeps a copy of the content as it is written in order,
+        # unless the blob is too large to be cached
+        if cache_writer is not None:
+            cache_writer.start(download_size)
+            stream = cache_writer
+            ordered_writes = True
+
+        # A gzip-encoded blob is decompressed as its chunks are written in order
+        decompressing_writer = None
+        if decompress and blob.properties.content_settings.content_encoding == _GZIP_CONTENT_ENCODING:
+            decompressing_writer = _DecompressingWriter(stream)
+            stream = decompressing_writer
+            ordered_writes = True
+
         # Write the content to the user stream
         # Clear blob content since output has been written to user stream
         if blob.content is not None:
             stream.write(blob.content)
+            if digest is not None:
+                digest.update(0, blob.content)
             blob.content = None
 
         # If the blob is small, the download is complete at this point.
@@ -2214,29 +2345,56 @@ class BaseBlobService(StorageClient):
                 # Use the end_range unless it is over the end of the blob
                 end_blob = min(blob_size, end_range + 1)
 
-            _download_blob_chunks(
-                self,
-                container_name,
-                blob_name,
-                snapshot,
-                download_size,
-                self.MAX_CHUNK_GET_SIZE,
-                first_get_size,
-                initial_request_end + 1,  # start where the first download ended
-                end_blob,
-                stream,
-                max_connections,
-                progress_callback,
-                validate_content,
-                lease_id,
-                if_modified_since,
-                if_unmodified_since,
-                if_match,
-                if_none_match,
-                timeout,
-                operation_context,
-                cpk,
-            )
+            if ordered_writes and max_connections > 1:
+                for chunk in _iter_blob_chunks(
+                        self,
+                        container_name,
+                        blob_name,
+                        snapshot,
+                        download_size,
+                        self.MAX_CHUNK_GET_SIZE,
+                        first_get_size,
+                        initial_request_end + 1,  # start where the first download ended
+                        end_blob,
+                        max_connections,
+                        progress_callback,
+                        validate_content,
+                        lease_id,
+                        if_modified_since,
+                        if_unmodified_since,
+                        if_match,
+                        if_none_match,
+                        timeout,
+                        operation_context,
+                        cpk):
+                    stream.write(chunk)
+                    if digest is not None:
+                        digest.update(digest.position, chunk)
+            else:
+                _download_blob_chunks(
+                    self,
+                    container_name,
+                    blob_name,
+                    snapshot,
+                    download_size,
+                    self.MAX_CHUNK_GET_SIZE,
+                    first_get_size,
+                    initial_request_end + 1,  # start where the first download ended
+                    end_blob,
+                    stream,
+                    max_connections,
+                    progress_callback,
+                    validate_content,
+                    lease_id,
+                    if_modified_since,
+                    if_unmodified_since,
+                    if_match,
+                    if_none_match,
+                    timeout,
+                    operation_context,
+                    cpk,
+                    digest,
+                )
 
             # Set the content length to the download size instead of the size of
             # the last range
@@ -2246,10 +2404,321 @@ class BaseBlobService(StorageClient):
             blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(start_range, end_range, blob_size)
 
             # Overwrite the content MD5 as it is the MD5 for the last range instead
-            # of the stored MD5
-            # TODO: Set to the stored MD5 when the service returns this
+            # of the stored MD5, which ranged gets return as x-ms-blob-content-md5.
+            # It is only the MD5 of the content for whole downloads.
+            if download_size == blob_size:
+                blob.properties.content_md5 = blob.properties.content_settings.content_md5
+            else:
+                blob.properties.content_md5 = None
+
+        if decompressing_writer is not None:
+            decompressing_writer.finalize()
+
+        if digest is not None:
+            # The stored MD5 is returned by ranged gets as x-ms-blob-content-md5
+            blob.properties.content_md5 = digest.get_content_md5()
+            stored_md5 = blob.properties.content_settings.content_md5
+            if stored_md5:
+                _validate_content_match(stored_md5, blob.properties.content_md5)
+
+        return blob
+
+    def _download_encrypted_blob_to_stream(self, container_name, blob_name, stream, snapshot, start_range,
+                                           end_range, validate_content, progress_callback, max_connections,
+                                           lease_id, if_modified_since, if_unmodified_since, if_match,
+                                           if_none_match, timeout, cpk):
+        # The ciphertext is downloaded in contiguous ranges, which only need to be
+        # aligned on the AES blocks at both ends of the download, and decrypted in
+        # order by a single CBC decryptor that carries the IV from one chunk to the
+        # next, while the following chunks are downloaded in the background.
+        start = start_range if start_range is not None else 0
+
+        # The download starts on the block that holds the start of the range,
+        # preceded by the block used as its IV.
+        fetch_start = start - start % 16
+        if fetch_start > 0:
+            fetch_start -= 16
+        fetch_end = None
+        if end_range is not None:
+            fetch_end = end_range + 15 - end_range % 16
+
+        first_get_size = self.MAX_SINGLE_GET_SIZE if not validate_content else self.MAX_CHUNK_GET_SIZE
+        if fetch_start > 0 and self.encryption_version == _ENCRYPTION_PROTOCOL_V2:
+            # The first get is not aligned on the regions of encryption protocol
+            # 2.0, so it is likely to be requested again once they are known.
+            first_get_size = self.MAX_CHUNK_GET_SIZE
+        first_end = fetch_start + first_get_size - 1
+        if fetch_end is not None:
+            first_end = min(first_end, fetch_end)
+
+        # Send a context object to make sure we always retry to the initial location
+        operation_context = _OperationContext(location_lock=True)
+        try:
+            blob = self._get_blob(container_name,
+                                  blob_name,
+                                  snapshot,
+                                  start_range=fetch_start,
+                                  end_range=first_end,
+                                  validate_content=validate_content,
+                                  lease_id=lease_id,
+                                  if_modified_since=if_modified_since,
+                                  if_unmodified_since=if_unmodified_since,
+                                  if_match=if_match,
+                                  if_none_match=if_none_match,
+                                  timeout=timeout,
+                                  _context=operation_context,
+                                  cpk=cpk,
+                                  _decrypt=False)
+        except AzureHttpError as ex:
+            if start_range is None and ex.status_code == 416:
+                # Get range will fail on an empty blob, which is downloaded with a
+                # regular get in order to get any properties.
+                return self._download_blob_to_stream(container_name, blob_name, stream, snapshot, None, None,
+                                                     validate_content, progress_callback, 1, lease_id,
+                                                     if_modified_since, if_unmodified_since, if_match,
+                                                     if_none_match, timeout, cpk, False)
+            raise ex
+
+        blob_size = _parse_length_from_content_range(blob.properties.content_range)
+        fetch_end = blob_size - 1 if fetch_end is None else min(fetch_end, blob_size - 1)
+        if end_range is not None:
+            download_size = min(end_range + 1, blob_size) - start
+        else:
+            download_size = blob_size - start
+
+        try:
+            encryption_data, content_encryption_key = _get_blob_content_encryption_key(
+                self.require_encryption, self.key_encryption_key, self.key_resolver_function,
+                blob.metadata.get('encryptiondata'), self._content_key_cache if self.content_key_cache_ttl else None,
+                self.content_key_cache_ttl)
+        except:
+            raise AzureException(_ERROR_DECRYPTION_FAILURE)
+
+        if encryption_data is not None and encryption_data.encrypted_region_info is not None:
+            return self._download_region_encrypted_blob_to_stream(
+                container_name, blob_name, stream, snapshot, start_range, end_range, progress_callback,
+                max_connections, lease_id, if_modified_since, if_unmodified_since, if_match, if_none_match,
+                timeout, cpk, blob, fetch_start, operation_context, encryption_data.encrypted_region_info,
+                content_encryption_key)
+
+        try:
+            content = blob.content
+            iv = None
+            skip = start - fetch_start
+            if encryption_data is not None:
+                if fetch_start > 0:
+                    iv, content = content[:16], content[16:]
+                    skip -= 16
+                else:
+                    iv = encryption_data.content_encryption_IV
+
+            # Only the end of a block blob or an append blob is padded
+            unpad = fetch_end == blob_size - 1 and blob.properties.blob_type != 'PageBlob'
+            decryption_stage = _BlobDecryptionStage(content_encryption_key, iv, skip,
+                                                    download_size if end_range is not None else None, unpad)
+        except:
+            raise AzureException(_ERROR_DECRYPTION_FAILURE)
+
+        def decrypt_to_stream(decrypt, progress, *ciphertext):
+            try:
+                plaintext = decrypt(*ciphertext)
+            except:
+                raise AzureException(_ERROR_DECRYPTION_FAILURE)
+
+            stream.write(plaintext)
+            progress += len(plaintext)
+            if progress_callback:
+                progress_callback(progress, download_size)
+            return progress
+
+        progress = decrypt_to_stream(decryption_stage.update, 0, content)
+
+        if first_end < fetch_end:
+            # Lock on the etag. This can be overriden by the user by specifying '*'
+            if_match = if_match if if_match is not None else blob.properties.etag
+
+            for chunk in _iter_blob_chunks(
+                    self,
+                    container_name,
+                    blob_name,
+                    snapshot,
+                    download_size,
+                    self.MAX_CHUNK_GET_SIZE,
+                    0,
+                    first_end + 1,  # start where the first download ended
+                    fetch_end + 1,
+                    max_connections if max_connections > 1 else 0,
+                    None,
+                    validate_content,
+                    lease_id,
+                    if_modified_since,
+                    if_unmodified_since,
+                    if_match,
+                    if_none_match,
+                    timeout,
+                    operation_context,
+                    cpk,
+                    decrypt=False):
+                progress = decrypt_to_stream(decryption_stage.update, progress, chunk)
+
             blob.properties.content_md5 = None
 
+        progress = decrypt_to_stream(decryption_stage.finalize, progress)
+
+        # The size of the plaintext is only known once the padding is removed
+        blob.content = None
+        blob.properties.content_length = progress
+        blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(start_range, end_range, blob_size)
+        return blob
+
+    def _download_region_encrypted_blob_to_stream(self, container_name, blob_name, stream, snapshot, start_range,
+                                                  end_range, progress_callback, max_connections, lease_id,
+                                                  if_modified_since, if_unmodified_since, if_match, if_none_match,
+                                                  timeout, cpk, blob, blob_start, operation_context,
+                                                  encrypted_region_info, content_encryption_key):
+        # Encryption protocol 2.0 stores independent regions, each with its nonce
+        # and authentication tag, so the download is aligned on the regions, and
+        # the chunks are decrypted and authenticated by the threads that download
+        # them before being written in order. The tags verify the integrity of
+        # every region, which replaces validate_content.
+        region_length = encrypted_region_info.data_length
+        encrypted_region_length = region_length + encrypted_region_info.nonce_length + \
+                                  encrypted_region_info.tag_length
+
+        blob_size = _parse_length_from_content_range(blob.properties.content_range)
+        regions = (blob_size + encrypted_region_length - 1) // encrypted_region_length
+        plaintext_size = blob_size - regions * (encrypted_region_length - region_length)
+
+        start = start_range if start_range is not None else 0
+        end = plaintext_size if end_range is None else min(end_range + 1, plaintext_size)
+        download_size = max(end - start, 0)
+
+        fetch_start = start // region_length * encrypted_region_length
+        fetch_end = min((end + region_length - 1) // region_length * encrypted_region_length, blob_size)
+
+        cpu_executor = self.cpu_executor
+
+        def decrypt(ciphertext):
+            try:
+                if cpu_executor is not None:
+                    return cpu_executor.submit(_decrypt_regions, content_encryption_key, encrypted_region_info,
+                                               ciphertext).result()
+                return _decrypt_regions(content_encryption_key, encrypted_region_info, ciphertext)
+            except:
+                raise AzureException(_ERROR_DECRYPTION_FAILURE)
+
+        # trims the plaintext of the regions to the requested range
+        trim_stage = _BlobDecryptionStage(None, None, start - fetch_start // encrypted_region_length * region_length,
+                                          download_size, False)
+
+        def write_to_stream(plaintext, progress):
+            plaintext = trim_stage.update(plaintext)
+            stream.write(plaintext)
+            progress += len(plaintext)
+            if progress_callback:
+                progress_callback(progress, download_size)
+            return progress
+
+        # The whole regions of the first get are used if it started on a region
+        progress = 0
+        position = fetch_start
+        if blob_start == fetch_start:
+            content_end = blob_start + len(blob.content)
+            if content_end < blob_size:
+                content_end = blob_start + len(blob.content) // encrypted_region_length * encrypted_region_length
+            position = max(min(content_end, fetch_end), fetch_start)
+            progress = write_to_stream(decrypt(blob.content[:position - fetch_start]), progress)
+
+        if position < fetch_end:
+            # Lock on the etag. This can be overriden by the user by specifying '*'
+            if_match = if_match if if_match is not None else blob.properties.etag
+
+            for plaintext in _iter_blob_chunks(
+                    self,
+                    container_name,
+                    blob_name,
+                    snapshot,
+                    download_size,
+                    max(1, self.MAX_CHUNK_GET_SIZE // encrypted_region_length) * encrypted_region_length,
+                    0,
+                    position,
+                    fetch_end,
+                    max_connections if max_connections > 1 else 0,
+                    None,
+                    False,
+                    lease_id,
+                    if_modified_since,
+                    if_unmodified_since,
+                    if_match,
+                    if_none_match,
+                    timeout,
+                    operation_context,
+                    cpk,
+                    decrypt=False,
+                    transform=decrypt):
+                progress = write_to_stream(plaintext, progress)
+
+            blob.properties.content_md5 = None
+
+        blob.content = None
+        blob.properties.content_length = progress
+        blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(start_range, end_range, blob_size)
+        return blob
+
+    def _can_use_blob_cache(self, start_range, end_range, if_modified_since, if_unmodified_since,
+                            if_match, if_none_match, cpk):
+        # Only whole, unconditional downloads are cached, and never the plaintext
+        # of client-side encrypted blobs or of blobs encrypted with a customer key.
+        return (start_range is None and end_range is None and if_modified_since is None and
+                if_unmodified_since is None and if_match is None and if_none_match is None and
+                cpk is None and not self.require_encryption and
+                self.key_encryption_key is None and self.key_resolver_function is None)
+
+    def _get_blob_to_stream_with_cache(self, container_name, blob_name, stream, snapshot,
+                                       validate_content, progress_callback, max_connections,
+                                       lease_id, timeout):
+        cache = self.blob_cache
+        entry_path = cache._get_entry_path(self.account_name, container_name, blob_name, snapshot)
+        entry, blob = cache._open_entry(entry_path, blob_name, snapshot)
+        if entry is None:
+            return self._download_blob_to_cache(entry_path, container_name, blob_name, stream, snapshot,
+                                                validate_content, progress_callback, max_connections,
+                                                lease_id, None, timeout)
+
+        with entry:
+            if not cache._is_fresh(entry_path):
+                # The download is conditioned on the cached etag, so an unchanged
+                # blob costs a single request answered with 304 Not Modified.
+                try:
+                    return self._download_blob_to_cache(entry_path, container_name, blob_name, stream, snapshot,
+                                                        validate_content, progress_callback, max_connections,
+                                                        lease_id, blob.properties.etag, timeout)
+                except AzureHttpError as ex:
+                    if ex.status_code != 304:
+                        raise ex
+                cache._mark_validated(entry_path)
+
+            cache._copy_entry(entry, blob, stream)
+
+        if progress_callback:
+            progress_callback(blob.properties.content_length, blob.properties.content_length)
+
+        return blob
+
+    def _download_blob_to_cache(self, entry_path, container_name, blob_name, stream, snapshot,
+                                validate_content, progress_callback, max_connections, lease_id,
+                                if_none_match, timeout):
+        # The content is written to the stream and to the new entry in one pass
+        cache_writer = self.blob_cache._create_writer(stream)
+        try:
+            blob = self._download_blob_to_stream(container_name, blob_name, stream, snapshot, None, None,
+                                                 validate_content, progress_callback, max_connections,
+                                                 lease_id, None, None, None, if_none_match, timeout, None,
+                                                 True, cache_writer=cache_writer)
+            cache_writer.add_entry(entry_path, blob)
+        finally:
+            cache_writer.close()
+
         return blob
 
     def get_blob_to_bytes(
@@ -2257,7 +2726,7 @@ class BaseBlobService(StorageClient):
             start_range=None, end_range=None, validate_content=False,
             progress_callback=None, max_connections=2, lease_id=None,
             if_modified_since=None, if_unmodified_since=None, if_match=None,
-            if_none_match=None, timeout=None, cpk=None):
+            if_none_match=None, timeout=None, cpk=None, validate_blob_md5=False, decompress=False):
         '''
         Downloads a blob as an array of bytes, with automatic chunking and
         progress notifications. Returns an instance of :class:`~azure.storage.blob.models.Blob` with
@@ -2340,6 +2809,23 @@ class BaseBlobService(StorageClient):
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
             each call individually.
+        :param bool validate_blob_md5:
+            If true, the MD5 of the whole blob is computed while it is downloaded,
+            by hashing the chunks in order as soon as they form a contiguous prefix
+            even if they complete out of order, and is compared with the MD5
+            stored with the blob, so that its integrity is verified without
+            reading the content again. The computed MD5 is returned as the
+            content_md5 of the blob properties. Only whole downloads of blobs
+            that are not client-side encrypted can be verified. Otherwise, the
+            content_md5 of a whole download is the MD5 stored with the blob,
+            which is not verified.
+        :param bool decompress:
+            If true and the content_encoding of the blob is 'gzip', the content is
+            decompressed as it is downloaded, and the decompressed content is
+            written instead. The chunks of a parallel download are decompressed in
+            order, as with ordered_writes. The properties still describe the
+            stored blob. Only whole downloads of blobs that are not client-side
+            encrypted can be decompressed.
         :return: A Blob with properties and metadata. If max_connections is greater 
             than 1, the content_md5 (if set on the blob) will not be returned. If you 
             require this value, either use get_blob_properties or set max_connections 
@@ -2366,17 +2852,183 @@ class BaseBlobService(StorageClient):
             if_match,
             if_none_match,
             timeout=timeout,
-            cpk=cpk)
+            cpk=cpk,
+            validate_blob_md5=validate_blob_md5,
+            decompress=decompress)
 
         blob.content = stream.getvalue()
         return blob
 
+    def get_blob_to_buffer(
+            self, container_name, blob_name, buffer=None, snapshot=None,
+            start_range=None, end_range=None, validate_content=False,
+            progress_callback=None, max_connections=2, lease_id=None,
+            if_modified_since=None, if_unmodified_since=None, if_match=None,
+            if_none_match=None, timeout=None, cpk=None):
+        '''
+        Downloads a blob into a single writable buffer, with automatic chunking
+        and progress notifications. Returns an instance of :class:`~azure.storage.blob.models.Blob`
+        with properties and metadata, whose content is the buffer.
+
+        Unlike get_blob_to_bytes, which assembles the chunks in an intermediate
+        stream and then copies them into the returned bytes, every chunk is copied
+        once, in parallel, into its own slice of the buffer. If no buffer is given,
+        a bytearray of the exact size of the download is allocated once the size
+        of the blob is known from the first response, so the peak memory used is
+        close to the size of the blob.
+
+        Client-side encrypted blobs are not supported.
+
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of existing blob.
+        :param buffer:
+            A writable bytes-like object, such as a bytearray, an mmap or a numpy
+            array, to download into from its start. It must be large enough for
+            the download. If not set, a bytearray is allocated.
+        :type buffer: bytearray
+        :param str snapshot:
+            The snapshot parameter is an opaque DateTime value that,
+            when present, specifies the blob snapshot to retrieve.
+        :param int start_range:
+            Start of byte range to use for downloading a section of the blob.
+            If no end_range is given, all bytes after the start_range will be downloaded.
+            The start_range and end_range params are inclusive.
+            Ex: start_range=0, end_range=511 will download first 512 bytes of blob.
+        :param int end_range:
+            End of byte range to use for downloading a section of the blob.
+            If end_range is given, start_range must be provided.
+            The start_range and end_range params are inclusive.
+            Ex: start_range=0, end_range=511 will download first 512 bytes of blob.
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each retrieved portion of
+            the blob. Note that the service will only return transactional MD5s
+            for chunks 4MB or less so the first get request will be of size
+            self.MAX_CHUNK_GET_SIZE instead of self.MAX_SINGLE_GET_SIZE. If
+            self.MAX_CHUNK_GET_SIZE was set to greater than 4MB an error will be
+            thrown.
+        :param progress_callback:
+            Callback for progress with signature function(current, total)
+            where current is the number of bytes transfered so far, and total is
+            the size of the blob if known.
+        :type progress_callback: func(current, total)
+        :param int max_connections:
+            If set to 2 or greater, an initial get will be done for the first
+            self.MAX_SINGLE_GET_SIZE bytes of the blob. If this is the entire blob,
+            the method returns at this point. If it is not, it will download the
+            remaining data parallel using the number of threads equal to
+            max_connections. Each chunk will be of size self.MAX_CHUNK_GET_SIZE.
+            If set to 1, the remaining chunks are downloaded one at a time.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param datetime if_modified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only
+            if the resource has been modified since the specified time.
+        :param datetime if_unmodified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only if
+            the resource has not been modified since the specified date/time.
+        :param str if_match:
+            An ETag value, or the wildcard character (*). Specify this header to perform
+            the operation only if the resource's ETag matches the value specified.
+        :param str if_none_match:
+            An ETag value, or the wildcard character (*). Specify this header
+            to perform the operation only if the resource's ETag does not match
+            the value specified. Specify the wildcard character (*) to perform
+            the operation only if the resource does not exist, and fail the
+            operation if it does exist.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Decrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make
+            multiple calls to the Azure service and the timeout will apply to
+            each call individually.
+        :return: A Blob with properties and metadata, whose content is the buffer.
+            The number of bytes written to the buffer is the content_length of
+            the properties. If max_connections is greater than 1, the content_md5
+            (if set on the blob) will not be returned.
+        :rtype: :class:`~azure.storage.blob.models.Blob`
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        _validate_encryption_unsupported(self.require_encryption,
+                                         self.key_encryption_key or self.key_resolver_function)
+        if end_range is not None:
+            _validate_not_none("start_range", start_range)
+
+        first_get_size = self.MAX_SINGLE_GET_SIZE if not validate_content else self.MAX_CHUNK_GET_SIZE
+        blob, blob_size, download_size, initial_request_end, operation_context = self._get_first_blob_range(
+            container_name, blob_name, snapshot, start_range, end_range, first_get_size, validate_content,
+            lease_id, if_modified_since, if_unmodified_since, if_match, if_none_match, timeout, cpk)
+
+        if buffer is None:
+            buffer = bytearray(download_size)
+        view = memoryview(buffer)
+        if view.readonly or view.itemsize != 1:
+            raise ValueError('buffer should be a writable bytes-like object.')
+        if len(view) < download_size:
+            raise ValueError('buffer is smaller than the {0} bytes to download.'.format(download_size))
+
+        if progress_callback:
+            progress_callback(blob.properties.content_length, download_size)
+
+        first_length = len(blob.content or b'')
+        view[:first_length] = blob.content or b''
+
+        if blob.properties.content_length != download_size:
+            # Lock on the etag. This can be overriden by the user by specifying '*'
+            if_match = if_match if if_match is not None else blob.properties.etag
+
+            end_blob = blob_size
+            if end_range is not None:
+                end_blob = min(blob_size, end_range + 1)
+
+            _download_blob_chunks(
+                self,
+                container_name,
+                blob_name,
+                snapshot,
+                download_size,
+                self.MAX_CHUNK_GET_SIZE,
+                first_get_size,
+                initial_request_end + 1,  # start where the first download ended
+                end_blob,
+                view[first_length:],
+                max_connections,
+                progress_callback,
+                validate_content,
+                lease_id,
+                if_modified_since,
+                if_unmodified_since,
+                if_match,
+                if_none_match,
+                timeout,
+                operation_context,
+                cpk,
+            )
+
+            blob.properties.content_length = download_size
+            blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(start_range, end_range, blob_size)
+            blob.properties.content_md5 = None
+
+        blob.content = buffer
+        return blob
+
     def get_blob_to_text(
             self, container_name, blob_name, encoding='utf-8', snapshot=None,
             start_range=None, end_range=None, validate_content=False,
             progress_callback=None, max_connections=2, lease_id=None,
             if_modified_since=None, if_unmodified_since=None, if_match=None,
-            if_none_match=None, timeout=None, cpk=None):
+            if_none_match=None, timeout=None, cpk=None, validate_blob_md5=False, decompress=False):
         '''
         Downloads a blob as unicode text, with automatic chunking and progress
         notifications. Returns an instance of :class:`~azure.storage.blob.models.Blob` with
@@ -2461,6 +3113,23 @@ class BaseBlobService(StorageClient):
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
             each call individually.
+        :param bool validate_blob_md5:
+            If true, the MD5 of the whole blob is computed while it is downloaded,
+            by hashing the chunks in order as soon as they form a contiguous prefix
+            even if they complete out of order, and is compared with the MD5
+            stored with the blob, so that its integrity is verified without
+            reading the content again. The computed MD5 is returned as the
+            content_md5 of the blob properties. Only whole downloads of blobs
+            that are not client-side encrypted can be verified. Otherwise, the
+            content_md5 of a whole download is the MD5 stored with the blob,
+            which is not verified.
+        :param bool decompress:
+            If true and the content_encoding of the blob is 'gzip', the content is
+            decompressed as it is downloaded, and the decompressed content is
+            written instead. The chunks of a parallel download are decompressed in
+            order, as with ordered_writes. The properties still describe the
+            stored blob. Only whole downloads of blobs that are not client-side
+            encrypted can be decompressed.
         :return: A Blob with properties and metadata. If max_connections is greater 
             than 1, the content_md5 (if set on the blob) will not be returned. If you 
             require this value, either use get_blob_properties or set max_connections 
@@ -2485,10 +3154,376 @@ class BaseBlobService(StorageClient):
                                       if_match,
                                       if_none_match,
                                       timeout=timeout,
-                                      cpk=cpk)
+                                      cpk=cpk,
+                                      validate_blob_md5=validate_blob_md5,
+                                      decompress=decompress)
         blob.content = blob.content.decode(encoding)
         return blob
 
+    def get_blob_chunks(
+            self, container_name, blob_name, snapshot=None,
+            start_range=None, end_range=None, validate_content=False,
+            progress_callback=None, read_ahead=2, lease_id=None,
+            if_modified_since=None, if_unmodified_since=None, if_match=None,
+            if_none_match=None, timeout=None, cpk=None):
+        '''
+        Downloads a blob as a generator of chunks of at most MAX_CHUNK_GET_SIZE
+        bytes, in order, so that the content can be processed incrementally
+        without buffering the whole blob.
+
+        Nothing is requested until the generator is first iterated. While the
+        consumer processes a chunk, up to read_ahead ranged gets of the following
+        chunks are in flight, so that at most read_ahead + 1 chunks are held in
+        memory. As with get_blob_to_stream, all the gets after the first one are
+        conditioned on the ETag of the blob, so a blob modified during the
+        download raises an error instead of yielding a mix of both versions.
+
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of existing blob.
+        :param str snapshot:
+            The snapshot parameter is an opaque DateTime value that,
+            when present, specifies the blob snapshot to retrieve.
+        :param int start_range:
+            Start of byte range to use for downloading a section of the blob.
+            If no end_range is given, all bytes after the start_range will be downloaded.
+            The start_range and end_range params are inclusive.
+            Ex: start_range=0, end_range=511 will download first 512 bytes of blob.
+        :param int end_range:
+            End of byte range to use for downloading a section of the blob.
+            If end_range is given, start_range must be provided.
+            The start_range and end_range params are inclusive.
+            Ex: start_range=0, end_range=511 will download first 512 bytes of blob.
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each retrieved chunk of
+            the blob. Note that the service will only return transactional MD5s
+            for chunks 4MB or less, so if self.MAX_CHUNK_GET_SIZE was set to
+            greater than 4MB an error will be thrown.
+        :param progress_callback:
+            Callback for progress with signature function(current, total)
+            where current is the number of bytes yielded so far, and total is
+            the size of the download.
+        :type progress_callback: func(current, total)
+        :param int read_ahead:
+            The number of chunks downloaded in parallel ahead of the chunk being
+            consumed. If set to 0, each chunk is only requested once the previous
+            one has been consumed.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param datetime if_modified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only
+            if the resource has been modified since the specified time.
+        :param datetime if_unmodified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only if
+            the resource has not been modified since the specified date/time.
+        :param str if_match:
+            An ETag value, or the wildcard character (*). Specify this header to perform
+            the operation only if the resource's ETag matches the value specified.
+        :param str if_none_match:
+            An ETag value, or the wildcard character (*). Specify this header
+            to perform the operation only if the resource's ETag does not match
+            the value specified. Specify the wildcard character (*) to perform
+            the operation only if the resource does not exist, and fail the
+            operation if it does exist.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Decrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make
+            multiple calls to the Azure service and the timeout will apply to
+            each call individually.
+        :return: A generator of the chunks of the blob content.
+        :rtype: generator(bytes)
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        if end_range is not None:
+            _validate_not_none("start_range", start_range)
+        if read_ahead < 0:
+            raise ValueError('read_ahead should not be negative.')
+
+        return self._get_blob_chunks(container_name, blob_name, snapshot, start_range, end_range,
+                                     validate_content, progress_callback, read_ahead, lease_id,
+                                     if_modified_since, if_unmodified_since, if_match, if_none_match,
+                                     timeout, cpk)
+
+    def _get_blob_chunks(self, container_name, blob_name, snapshot, start_range, end_range,
+                         validate_content, progress_callback, read_ahead, lease_id,
+                         if_modified_since, if_unmodified_since, if_match, if_none_match,
+                         timeout, cpk):
+        # The first get is limited to a single chunk as well to bound the memory used.
+        chunk_size = self.MAX_CHUNK_GET_SIZE
+        blob, blob_size, download_size, initial_request_end, operation_context = self._get_first_blob_range(
+            container_name, blob_name, snapshot, start_range, end_range, chunk_size, validate_content,
+            lease_id, if_modified_since, if_unmodified_since, if_match, if_none_match, timeout, cpk)
+
+        if progress_callback:
+            progress_callback(blob.properties.content_length, download_size)
+
+        if blob.content:
+            yield blob.content
+
+        if blob.properties.content_length != download_size:
+            # Lock on the etag. This can be overriden by the user by specifying '*'
+            if_match = if_match if if_match is not None else blob.properties.etag
+
+            end_blob = blob_size
+            if end_range is not None:
+                end_blob = min(blob_size, end_range + 1)
+
+            for chunk in _iter_blob_chunks(
+                    self,
+                    container_name,
+                    blob_name,
+                    snapshot,
+                    download_size,
+                    chunk_size,
+                    blob.properties.content_length,
+                    initial_request_end + 1,  # start where the first download ended
+                    end_blob,
+                    read_ahead,
+                    progress_callback,
+                    validate_content,
+                    lease_id,
+                    if_modified_since,
+                    if_unmodified_since,
+                    if_match,
+                    if_none_match,
+                    timeout,
+                    operation_context,
+                    cpk):
+                yield chunk
+
+    def _get_first_blob_range(self, container_name, blob_name, snapshot, start_range, end_range,
+                              first_get_size, validate_content, lease_id, if_modified_since,
+                              if_unmodified_since, if_match, if_none_match, timeout, cpk):
+        # Downloads the first range of a chunked download, which also tells the
+        # size of the blob. Returns the blob, the size of the blob, the size of
+        # the download, the end of the first range and the operation context.
+        initial_request_start = start_range if start_range is not None else 0
+
+        if end_range is not None and end_range - start_range < first_get_size:
+            initial_request_end = end_range
+        else:
+            initial_request_end = initial_request_start + first_get_size - 1
+
+        # Send a context object to make sure we always retry to the initial location
+        operation_context = _OperationContext(location_lock=True)
+        try:
+            blob = self._get_blob(container_name,
+                                  blob_name,
+                                  snapshot,
+                                  start_range=initial_request_start,
+                                  end_range=initial_request_end,
+                                  validate_content=validate_content,
+                                  lease_id=lease_id,
+                                  if_modified_since=if_modified_since,
+                                  if_unmodified_since=if_unmodified_since,
+                                  if_match=if_match,
+                                  if_none_match=if_none_match,
+                                  timeout=timeout,
+                                  _context=operation_context,
+                                  cpk=cpk)
+
+            blob_size = _parse_length_from_content_range(blob.properties.content_range)
+            if end_range is not None:
+                download_size = min(blob_size, end_range - start_range + 1)
+            elif start_range is not None:
+                download_size = blob_size - start_range
+            else:
+                download_size = blob_size
+        except AzureHttpError as ex:
+            if start_range is None and ex.status_code == 416:
+                # Get range will fail on an empty blob. If the user did not
+                # request a range, do a regular get request in order to get
+                # any properties.
+                blob = self._get_blob(container_name,
+                                      blob_name,
+                                      snapshot,
+                                      validate_content=validate_content,
+                                      lease_id=lease_id,
+                                      if_modified_since=if_modified_since,
+                                      if_unmodified_since=if_unmodified_since,
+                                      if_match=if_match,
+                                      if_none_match=if_none_match,
+                                      timeout=timeout,
+                                      _context=operation_context,
+                                      cpk=cpk)
+                blob_size = download_size = 0
+            else:
+                raise ex
+
+        return blob, blob_size, download_size, initial_request_end, operation_context
+
+    def read_ranges(
+            self, container_name, blob_name, ranges, snapshot=None, max_gap=64 * 1024,
+            validate_content=False, max_connections=2, lease_id=None, if_match=None,
+            timeout=None, cpk=None):
+        '''
+        Downloads several byte ranges of a blob, such as the scattered column
+        chunks needed by a columnar reader, in as few gets as possible.
+
+        The ranges that overlap or are at most max_gap bytes apart are merged
+        into a single get of at most self.MAX_CHUNK_GET_SIZE bytes (a range that
+        is larger on its own is fetched in a single get). The merged gets are
+        done in parallel and the requested ranges are returned as views over
+        their content, without copying it. All the gets after the first one are
+        conditioned on the ETag of the blob, so a blob modified while the ranges
+        are read raises an error instead of returning a mix of both versions.
+
+        Client-side encrypted blobs are not supported.
+
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of existing blob.
+        :param ranges:
+            The byte ranges to download, as (start, end) pairs in any order. Both
+            ends are inclusive, so (0, 511) downloads the first 512 bytes of the
+            blob. A range that extends past the end of the blob is truncated.
+        :type ranges: list(tuple(int, int))
+        :param str snapshot:
+            The snapshot parameter is an opaque DateTime value that,
+            when present, specifies the blob snapshot to retrieve.
+        :param int max_gap:
+            The largest number of unrequested bytes between two ranges for them
+            to be merged into a single get. Set it to 0 to merge only the ranges
+            that overlap or touch.
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each get. Note that the
+            service will only return transactional MD5s for gets of 4MB or less,
+            so an error will be thrown if self.MAX_CHUNK_GET_SIZE, or any single
+            range, is larger than 4MB.
+        :param int max_connections:
+            Maximum number of parallel connections to use once the first get
+            is done.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param str if_match:
+            An ETag value, or the wildcard character (*). Specify this header to perform
+            the operation only if the resource's ETag matches the value specified.
+            If not set, the ETag returned by the first get is used for the others.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Decrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make
+            multiple calls to the Azure service and the timeout will apply to
+            each call individually.
+        :return: The content of each range, in the order of the ranges.
+        :rtype: list(memoryview)
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        _validate_not_none('ranges', ranges)
+        _validate_encryption_unsupported(self.require_encryption,
+                                         self.key_encryption_key or self.key_resolver_function)
+        ranges = [(start, end) for start, end in ranges]
+        for start, end in ranges:
+            if start < 0 or end < start:
+                raise ValueError('Invalid range ({0}, {1}).'.format(start, end))
+        if max_gap < 0:
+            raise ValueError('max_gap should not be negative.')
+
+        # Send a context object to make sure we always retry to the initial location
+        operation_context = _OperationContext(location_lock=True)
+        return _download_blob_ranges(
+            self,
+            container_name,
+            blob_name,
+            snapshot,
+            ranges,
+            max_gap,
+            self.MAX_CHUNK_GET_SIZE,
+            max_connections,
+            validate_content,
+            lease_id,
+            if_match,
+            timeout,
+            operation_context,
+            cpk,
+        )
+
+    def download_directory(self, container_name, directory, prefix=None, include=None, exclude=None,
+                           skip_unchanged=False, max_connections=8, progress_callback=None,
+                           validate_content=False, timeout=None, cpk=None):
+        '''
+        Downloads the blobs under a prefix to a local directory, recreating the
+        '/' separated hierarchy of their names as sub-directories.
+
+        The container is listed lazily, so that the next pages of the listing are
+        fetched while the blobs already listed are downloaded on one pool of
+        max_connections worker threads shared by the whole transfer. Blobs of up to
+        MAX_SINGLE_GET_SIZE are downloaded with a single get blob request each,
+        while larger blobs are split into ranges of MAX_CHUNK_GET_SIZE that are
+        written in place as independent tasks of the same pool. Every request is
+        conditioned on the ETag returned by the listing, so a blob modified during
+        the transfer fails the download instead of producing a mixed file.
+        Sub-directories are only created when a file is downloaded in them. The
+        download stops at the first error.
+
+        :param str container_name:
+            Name of existing container.
+        :param str directory:
+            Path of the local directory to download to. It is created if needed.
+        :param str prefix:
+            Only the blobs whose names begin with this prefix are downloaded. The
+            prefix is removed from the names to form the relative file paths.
+        :param list(str) include:
+            If set, only the blobs whose relative path matches one of these
+            glob patterns are downloaded. Note that '*' also matches '/'.
+        :param list(str) exclude:
+            Blobs whose relative path, or one of its parent directories, matches
+            one of these glob patterns are not downloaded.
+        :param bool skip_unchanged:
+            If true, a blob is skipped if the local file has the same size and
+            the last modified time of the blob. Downloaded files are given the
+            last modified time of their blob, so that they are skipped by
+            subsequent downloads until the blob changes.
+        :param int max_connections:
+            Maximum number of parallel connections used by the whole transfer.
+        :param progress_callback:
+            Callback for progress with signature function(report), called
+            after each transferred range or blob with a snapshot of the
+            aggregate progress and throughput.
+        :type progress_callback: func(:class:`~azure.storage.blob.models.DirectoryTransferReport`)
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each retrieved portion of
+            the blob. Note that the service will only return transactional MD5s
+            for chunks 4MB or less, so blobs larger than MAX_CHUNK_GET_SIZE are
+            downloaded in ranges and MAX_CHUNK_GET_SIZE must not exceed 4MB.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make
+            multiple calls to the Azure service and the timeout will apply to
+            each call individually.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Decrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :return: The aggregate progress and throughput of the transfer.
+        :rtype: :class:`~azure.storage.blob.models.DirectoryTransferReport`
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('directory', directory)
+        if max_connections < 1:
+            raise ValueError('max_connections should be greater than 0.')
+
+        return _download_directory(self, container_name, directory, prefix, include, exclude,
+                                   skip_unchanged, max_connections, progress_callback,
+                                   validate_content, timeout, cpk)
+
     def get_blob_metadata(
             self, container_name, blob_name, snapshot=None, lease_id=None,
             if_modified_since=None, if_unmodified_since=None, if_match=None,
@@ -0,0 +1,282 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+from io import SEEK_END
+
+from azure.storage.common._deserialization import _parse_datetime
+from azure.storage.common._error import _validate_not_none
+
+from .models import (
+    Blob,
+    BlobProperties,
+)
+
+_ENTRY_SUFFIX = '.blob'
+_TEMP_SUFFIX = '.tmp'
+
+# the size of the content, which is followed by the properties and metadata of
+# the blob in JSON
+_ENTRY_TRAILER = struct.Struct('<Q')
+_COPY_SIZE = 4 * 1024 * 1024
+
+# marks the datetimes among the JSON properties
+_DATETIME_KEY = 'datetime'
+
+
+class BlobCache(object):
+    '''
+    A local on-disk cache of downloaded blobs, for workers that repeatedly
+    download the same blobs, such as models or configuration, at startup.
+    It is enabled by setting the blob_cache attribute of a blob service, and
+    is then used by get_blob_to_path, get_blob_to_stream and get_blob_to_bytes
+    for whole downloads without ranges, access conditions or encryption.
+
+    The entries are keyed by account, container, blob and snapshot, and hold
+    the content of the blob along with its properties and metadata. A cached
+    blob is revalidated by conditioning its download on the cached etag, so
+    that an unchanged blob costs a single request answered with 304 Not
+    Modified, and a changed blob is downloaded and replaces the entry. Within
+    ttl seconds of a download or revalidation by this cache, the entry is used
+    without any request.
+
+    Each entry is a single file that is downloaded under a temporary name in
+    the cache directory and then renamed into place, so several processes can
+    share the directory. Once the entries exceed max_size bytes, the least
+    recently used ones are removed.
+    '''
+
+    def __init__(self, directory, max_size=1024 * 1024 * 1024, ttl=None):
+        '''
+        :param str directory:
+            The directory holding the cache entries. It is created if it does
+            not exist.
+        :param int max_size:
+            The maximum total size of the cache entries, in bytes. Blobs larger
+            than this are not cached.
+        :param int ttl:
+            The number of seconds after a download or revalidation during which
+            an entry is used without being revalidated. If not set, every use of
+            an entry is revalidated.
+        '''
+        _validate_not_none('directory', directory)
+        if max_size < 0:
+            raise ValueError('max_size should not be negative.')
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # the times at which the entries were last known to be current
+        self._validated = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        '''
+        Removes all the entries of the cache.
+        '''
+        for path in self._list_entries():
+            self._remove_entry(path)
+
+    def _get_entry_path(self, account_name, container_name, blob_name, snapshot):
+        key = u'\n'.join([account_name or u'', container_name, blob_name, snapshot or u''])
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + _ENTRY_SUFFIX)
+
+    def _open_entry(self, path, blob_name, snapshot):
+        # Returns the entry opened at the start of its content along with the
+        # cached blob, or (None, None) if there is no valid entry. Reading from
+        # the opened file is not affected by the entry being replaced.
+        try:
+            entry = open(path, 'rb')
+        except (IOError, OSError):
+            return None, None
+
+        try:
+            entry.seek(-_ENTRY_TRAILER.size, SEEK_END)
+            content_length, = _ENTRY_TRAILER.unpack(entry.read(_ENTRY_TRAILER.size))
+            entry.seek(content_length)
+            values = json.loads(entry.read()[:-_ENTRY_TRAILER.size].decode('utf-8'))
+            properties = BlobProperties()
+            _set_properties(properties, values['properties'])
+            blob = Blob(blob_name, snapshot, props=properties, metadata=values['metadata'])
+            entry.seek(0)
+        except Exception:
+            # a truncated or corrupted entry is treated as missing
+            entry.close()
+            return None, None
+
+        self._touch(path)
+        return entry, blob
+
+    def _is_fresh(self, path):
+        if self.ttl is None:
+            return False
+        with self._lock:
+            validated = self._validated.get(path)
+        return validated is not None and time.time() - validated < self.ttl
+
+    def _mark_validated(self, path):
+        with self._lock:
+            self._validated[path] = time.time()
+
+    def _copy_entry(self, entry, blob, stream):
+        remaining = blob.properties.content_length
+        while remaining > 0:
+            data = entry.read(min(remaining, _COPY_SIZE))
+            if not data:
+                break
+            stream.write(data)
+            remaining -= len(data)
+
+    def _create_temp_file(self):
+        handle, path = tempfile.mkstemp(suffix=_TEMP_SUFFIX, dir=self.directory)
+        return os.fdopen(handle, 'w+b'), path
+
+    def _create_writer(self, stream):
+        return _BlobCacheWriter(self, stream)
+
+    def _write_entry_properties(self, temp_file, blob):
+        # The properties and metadata follow the content. Only data is stored,
+        # as the directory may be shared with other processes.
+        values = {'properties': _get_properties(blob.properties), 'metadata': blob.metadata}
+        temp_file.write(json.dumps(values).encode('utf-8'))
+        temp_file.write(_ENTRY_TRAILER.pack(blob.properties.content_length))
+
+    def _add_entry(self, path, temp_path):
+        if os.path.getsize(temp_path) > self.max_size:
+            return
+
+        try:
+            _replace(temp_path, path)
+        except OSError:
+            # another process may be reading the entry on a platform that does
+            # not allow replacing open files, in which case it is not cached
+            return
+
+        self._mark_validated(path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self._list_entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove_entry(path)
+            total_size -= size
+
+    def _list_entries(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith(_ENTRY_SUFFIX)]
+
+    def _remove_entry(self, path):
+        with self._lock:
+            self._validated.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _touch(self, path):
+        # the modification time orders the entries for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+
+class _BlobCacheWriter(object):
+    '''
+    Writes the content of a blob being downloaded to the stream and, if its
+    first response shows that the blob fits in the cache, to a temporary file
+    in the cache directory that becomes its entry once the download completes.
+    '''
+
+    def __init__(self, cache, stream):
+        self.cache = cache
+        self.stream = stream
+        self.temp_file = None
+        self.temp_path = None
+
+    def start(self, content_length):
+        if content_length <= self.cache.max_size:
+            self.temp_file, self.temp_path = self.cache._create_temp_file()
+
+    def write(self, data):
+        self.stream.write(data)
+        if self.temp_file is not None:
+            self.temp_file.write(data)
+
+    def add_entry(self, path, blob):
+        if self.temp_file is None:
+            return
+
+        with self.temp_file:
+            self.cache._write_entry_properties(self.temp_file, blob)
+        self.cache._add_entry(path, self.temp_path)
+
+    def close(self):
+        if self.temp_file is None:
+            return
+
+        self.temp_file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def _get_properties(properties):
+    values = {}
+    for name, value in vars(properties).items():
+        if isinstance(value, datetime):
+            value = {_DATETIME_KEY: value.isoformat()}
+        elif hasattr(value, '__dict__'):
+            value = _get_properties(value)
+        values[name] = value
+    return values
+
+
+def _set_properties(properties, values):
+    # Only the attributes of the properties are set, so the entries hold nothing
+    # but data.
+    for name, value in values.items():
+        if not hasattr(properties, name):
+            continue
+
+        current = getattr(properties, name)
+        if hasattr(current, '__dict__'):
+            _set_properties(current, value)
+        elif isinstance(value, dict):
+            setattr(properties, name, _parse_datetime(value[_DATETIME_KEY]))
+        else:
+            setattr(properties, name, value)
+
+
+def _replace(source, destination):
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        try:
+            os.rename(source, destination)
+        except OSError:
+            # rename does not overwrite an existing file on Windows
+            os.remove(destination)
+            os.rename(source, destination)
@@ -0,0 +1,281 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+from collections import OrderedDict
+from io import (
+    IOBase,
+    SEEK_CUR,
+    SEEK_END,
+    SEEK_SET,
+)
+
+from azure.storage.common._error import (
+    _validate_not_none,
+    _validate_encryption_unsupported,
+)
+
+
+class BlobReader(IOBase):
+    '''
+    A readable and seekable file-like object over the content of a blob, for
+    formats that are read with many small reads at arbitrary positions, such as
+    Parquet footers, ZIP central directories or sqlite pages.
+
+    The blob is read in aligned blocks of block_size bytes with ranged gets, and
+    the most recently used max_cached_blocks blocks are kept in memory, so that
+    small reads close to each other cost a single request. When reads move
+    sequentially from one block to the next, the following read_ahead blocks
+    are downloaded in the background. prefetch() downloads a range of blocks in
+    parallel ahead of time.
+
+    All the gets are conditioned on the ETag of the blob when the reader was
+    opened, so reading a blob that was modified since raises an error instead
+    of returning a mix of both versions.
+
+    Client-side encrypted blobs are not supported.
+    '''
+    _executor = None
+
+    def __init__(self, blob_service, container_name, blob_name, snapshot=None,
+                 block_size=None, max_cached_blocks=16, read_ahead=2, max_connections=2,
+                 validate_content=False, lease_id=None, if_match=None, timeout=None, cpk=None):
+        '''
+        :param ~azure.storage.blob.baseblobservice.BaseBlobService blob_service:
+            The service used to read the blob.
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of existing blob.
+        :param str snapshot:
+            The snapshot parameter is an opaque DateTime value that,
+            when present, specifies the blob snapshot to read.
+        :param int block_size:
+            The size of the blocks read and cached. Defaults to
+            blob_service.MAX_CHUNK_GET_SIZE.
+        :param int max_cached_blocks:
+            The maximum number of blocks kept in memory.
+        :param int read_ahead:
+            The number of blocks downloaded in the background once sequential
+            reads are detected. Set to 0 to disable read-ahead.
+        :param int max_connections:
+            Maximum number of parallel connections used for read-ahead and prefetch.
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each block read. Note that
+            the service will only return transactional MD5s for ranges of 4MB or
+            less, so block_size must not exceed 4MB.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param str if_match:
+            An ETag value. If set, the reader is opened only if the blob's ETag
+            matches the value specified.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. It applies to each
+            request individually.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Decrypts the data on the service-side with the given key.
+        '''
+        _validate_not_none('blob_service', blob_service)
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        _validate_encryption_unsupported(blob_service.require_encryption,
+                                         blob_service.key_encryption_key or blob_service.key_resolver_function)
+
+        block_size = block_size or blob_service.MAX_CHUNK_GET_SIZE
+        if block_size < 1:
+            raise ValueError('block_size should be greater than 0.')
+        if max_cached_blocks < 1:
+            raise ValueError('max_cached_blocks should be greater than 0.')
+        if read_ahead < 0:
+            raise ValueError('read_ahead should not be negative.')
+        if max_connections < 1:
+            raise ValueError('max_connections should be greater than 0.')
+
+        self.blob_service = blob_service
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self.snapshot = snapshot
+        self.block_size = block_size
+        self.max_cached_blocks = max_cached_blocks
+        self.read_ahead = read_ahead
+        self.max_connections = max_connections
+        self.validate_content = validate_content
+        self.lease_id = lease_id
+        self.timeout = timeout
+        self.cpk = cpk
+
+        blob = blob_service.get_blob_properties(container_name, blob_name, snapshot=snapshot, lease_id=lease_id,
+                                                if_match=if_match, timeout=timeout, cpk=cpk)
+
+        # properties of the blob when the reader was opened, to which all reads are pinned
+        self.properties = blob.properties
+        self.size = blob.properties.content_length
+        self.etag = blob.properties.etag
+
+        self._position = 0
+        self._cache = OrderedDict()
+        self._prefetching = {}
+        self._last_block = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=SEEK_SET):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self._position + offset
+        elif whence == SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid argument for the whence parameter.')
+
+        if position < 0:
+            raise ValueError('Seek position should not be negative.')
+
+        self._position = position
+        return position
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        remaining = max(self.size - self._position, 0)
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        chunks = []
+        while size > 0:
+            index = self._position // self.block_size
+            offset = self._position - index * self.block_size
+            data = self._get_block(index)[offset:offset + size]
+            if not data:
+                # the blob is shorter than when its size was fetched
+                break
+
+            chunks.append(data)
+            self._position += len(data)
+            size -= len(data)
+
+        return b''.join(chunks)
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        data = self.read(len(memoryview(b)))
+        b[:len(data)] = data
+        return len(data)
+
+    def prefetch(self, offset=0, length=None):
+        '''
+        Downloads the blocks covering a range of the blob in parallel and caches
+        them, so that subsequent reads in that range are served from memory.
+        Only the last max_cached_blocks blocks of the range are kept.
+
+        :param int offset:
+            Start of the range to prefetch.
+        :param int length:
+            Number of bytes to prefetch. Defaults to the rest of the blob.
+        '''
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        end = self.size if length is None else min(offset + length, self.size)
+        if end <= offset:
+            return
+
+        first_block = offset // self.block_size
+        last_block = (end - 1) // self.block_size
+        indexes = [i for i in range(first_block, last_block + 1)[-self.max_cached_blocks:]
+                   if i not in self._cache]
+
+        for index in indexes:
+            if index not in self._prefetching:
+                self._prefetching[index] = self._get_executor().submit(self._download_block, index)
+
+        for index in indexes:
+            self._cache_block(index, self._prefetching.pop(index).result())
+
+    def close(self):
+        if self.closed:
+            return
+
+        for future in self._prefetching.values():
+            future.cancel()
+        self._prefetching.clear()
+        self._cache.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        IOBase.close(self)
+
+    def _get_executor(self):
+        if self._executor is None:
+            import concurrent.futures
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.max_connections)
+        return self._executor
+
+    def _get_block(self, index):
+        block = self._cache.get(index)
+        if block is None:
+            future = self._prefetching.pop(index, None)
+            block = future.result() if future is not None else self._download_block(index)
+        self._cache_block(index, block)
+
+        if index != self._last_block:
+            sequential = self._last_block is not None and index == self._last_block + 1
+            self._schedule_read_ahead(index, sequential)
+            self._last_block = index
+
+        return block
+
+    def _cache_block(self, index, block):
+        # move the block to the most recently used end and evict the least recently used blocks
+        self._cache.pop(index, None)
+        self._cache[index] = block
+        while len(self._cache) > self.max_cached_blocks:
+            self._cache.popitem(last=False)
+
+    def _schedule_read_ahead(self, index, sequential):
+        if not sequential:
+            # the blocks read ahead of a previous sequential scan are no longer needed
+            for future in self._prefetching.values():
+                future.cancel()
+            self._prefetching.clear()
+            return
+
+        block_count = (self.size + self.block_size - 1) // self.block_size
+        for next_index in range(index + 1, min(index + 1 + self.read_ahead, block_count)):
+            if next_index not in self._cache and next_index not in self._prefetching:
+                self._prefetching[next_index] = self._get_executor().submit(self._download_block, next_index)
+
+    def _download_block(self, index):
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+
+        blob = self.blob_service._get_blob(
+            self.container_name,
+            self.blob_name,
+            snapshot=self.snapshot,
+            start_range=start,
+            end_range=end,
+            validate_content=self.validate_content,
+            lease_id=self.lease_id,
+            if_match=self.etag,
+            timeout=self.timeout,
+            cpk=self.cpk,
+        )
+        return blob.content
@@ -3,6 +3,7 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import copy
 import uuid
 from io import (
     BytesIO
@@ -16,17 +17,19 @@ from azure.storage.common._common_conversion import (
     _to_str,
     _int_to_str,
     _datetime_to_utc_string,
-    _get_content_md5,
+    _OrderedDigest,
 )
 from azure.storage.common._constants import (
     SERVICE_HOST_BASE,
     DEFAULT_PROTOCOL,
+    _ENCRYPTION_PROTOCOL_V2,
 )
 from azure.storage.common._error import (
     _validate_not_none,
     _validate_type_bytes,
     _validate_encryption_required,
     _validate_encryption_unsupported,
+    _validate_encryption_protocol_version,
     _ERROR_VALUE_NEGATIVE,
     _ERROR_VALUE_SHOULD_BE_STREAM
 )
@@ -35,19 +38,29 @@ from azure.storage.common._serialization import (
     _get_request_body,
     _get_data_bytes_only,
     _get_data_bytes_or_stream_only,
+    _add_content_checksum_header,
     _add_metadata_headers,
     _add_date_header, _update_request)
 from azure.storage.common._serialization import (
     _len_plus
 )
+from ._compression import (
+    _GZIP_CONTENT_ENCODING,
+    _compress_chunks,
+)
 from ._deserialization import (
     _convert_xml_to_block_list,
     _parse_base_properties,
     _ingest_batch_response)
+from ._directory_transfer import _upload_directory
 from ._encryption import (
     _encrypt_blob,
+    _BLOB_ENCRYPTION_PROTOCOLS,
     _generate_blob_encryption_data,
+    _get_encrypted_length,
+    _get_encryption_region_length,
 )
+from ._error import _ERROR_COMPRESSION_WITH_ENCRYPTION
 from ._serialization import (
     _convert_block_list_to_xml,
     _get_path,
@@ -58,12 +71,15 @@ from ._serialization import (
 )
 from ._upload_chunking import (
     _BlockBlobChunkUploader,
+    _read_ahead,
     _upload_blob_chunks,
     _upload_blob_substream_blocks,
 )
 from .baseblobservice import BaseBlobService
+from .blockblobwriter import BlockBlobWriter
 from .models import (
     _BlobTypes,
+    ContentSettings,
 )
 
 
@@ -404,7 +420,7 @@ class BlockBlobService(BaseBlobService):
     def create_blob_from_path(self, container_name, blob_name, file_path, content_settings=None, metadata=None,
                               validate_content=False, progress_callback=None, max_connections=2, lease_id=None,
                               if_modified_since=None, if_unmodified_since=None, if_match=None, if_none_match=None,
-                              timeout=None, standard_blob_tier=None, cpk=None):
+                              timeout=None, standard_blob_tier=None, cpk=None, compress=False):
         '''
         Creates a new blob from a file path, or updates the content of an
         existing blob, with automatic chunking and progress notifications.
@@ -472,6 +488,13 @@ class BlockBlobService(BaseBlobService):
         :param StandardBlobTier standard_blob_tier:
             A standard blob tier value to set the blob to. For this version of the library,
             this is only applicable to block blobs on standard storage accounts.
+        :param bool compress:
+            If true, the content is compressed with gzip as it is read, on a thread
+            of its own while the compressed blocks are staged in parallel, and the
+            content_encoding of the blob is set to 'gzip'. As the compressed size is
+            not known up front, the blob is always uploaded in blocks, and the
+            progress is reported in compressed bytes with a total of None. Not
+            supported with client-side encryption.
         :return: ETag and last modified properties for the Block Blob
         :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
         '''
@@ -488,13 +511,13 @@ class BlockBlobService(BaseBlobService):
                                                 if_modified_since=if_modified_since,
                                                 if_unmodified_since=if_unmodified_since, if_match=if_match,
                                                 if_none_match=if_none_match, timeout=timeout,
-                                                standard_blob_tier=standard_blob_tier, cpk=cpk)
+                                                standard_blob_tier=standard_blob_tier, cpk=cpk, compress=compress)
 
     def create_blob_from_stream(self, container_name, blob_name, stream, count=None, content_settings=None,
                                 metadata=None, validate_content=False, progress_callback=None, max_connections=2,
                                 lease_id=None, if_modified_since=None, if_unmodified_since=None, if_match=None,
                                 if_none_match=None, timeout=None, use_byte_buffer=False, standard_blob_tier=None,
-                                cpk=None):
+                                cpk=None, compress=False):
         '''
         Creates a new blob from a file/stream, or updates the content of
         an existing blob, with automatic chunking and progress
@@ -510,7 +533,11 @@ class BlockBlobService(BaseBlobService):
             Number of bytes to read from the stream. This is optional, but
             should be supplied for optimal performance.
         :param ~azure.storage.blob.models.ContentSettings content_settings:
-            ContentSettings object used to set blob properties.
+            ContentSettings object used to set blob properties. When the blob is
+            uploaded in blocks and is not client-side encrypted, the MD5 of the
+            whole blob is computed in stream order while the blocks are read, and
+            is set as its content_md5 when the blocks are committed, unless one
+            is given here.
         :param metadata:
             Name-value pairs associated with the blob as metadata.
         :type metadata: dict(str, str)
@@ -583,6 +610,13 @@ class BlockBlobService(BaseBlobService):
         :param StandardBlobTier standard_blob_tier:
             A standard blob tier value to set the blob to. For this version of the library,
             this is only applicable to block blobs on standard storage accounts.
+        :param bool compress:
+            If true, the content is compressed with gzip as it is read, on a thread
+            of its own while the compressed blocks are staged in parallel, and the
+            content_encoding of the blob is set to 'gzip'. As the compressed size is
+            not known up front, the blob is always uploaded in blocks, and the
+            progress is reported in compressed bytes with a total of None. Not
+            supported with client-side encryption.
         :return: ETag and last modified properties for the Block Blob
         :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
         '''
@@ -591,10 +625,34 @@ class BlockBlobService(BaseBlobService):
         _validate_not_none('stream', stream)
         _validate_encryption_required(self.require_encryption, self.key_encryption_key)
 
+        if compress:
+            if self.key_encryption_key is not None:
+                raise ValueError(_ERROR_COMPRESSION_WITH_ENCRYPTION)
+
+            content_settings = copy.copy(content_settings) if content_settings is not None else ContentSettings()
+            content_settings.content_encoding = _GZIP_CONTENT_ENCODING
+
+            # The content is compressed a few chunks ahead of the blocks being staged
+            return self.create_blob_from_iterable(container_name=container_name, blob_name=blob_name,
+                                                  iterable=_read_ahead(_compress_chunks(stream, count,
+                                                                                        self.MAX_BLOCK_SIZE), 2),
+                                                  content_settings=content_settings, metadata=metadata,
+                                                  validate_content=validate_content,
+                                                  progress_callback=progress_callback,
+                                                  max_connections=max_connections, lease_id=lease_id,
+                                                  if_modified_since=if_modified_since,
+                                                  if_unmodified_since=if_unmodified_since, if_match=if_match,
+                                                  if_none_match=if_none_match, timeout=timeout,
+                                                  standard_blob_tier=standard_blob_tier, cpk=cpk)
+
         # Adjust count to include padding if we are expected to encrypt.
         adjusted_count = count
+        encryption_region_length = self._get_encryption_region_length(self.MAX_BLOCK_SIZE)
         if (self.key_encryption_key is not None) and (adjusted_count is not None):
-            adjusted_count += (16 - (count % 16))
+            if encryption_region_length is not None:
+                adjusted_count = _get_encrypted_length(count, encryption_region_length)
+            else:
+                adjusted_count += (16 - (count % 16))
 
         # Do single put if the size is smaller than MAX_SINGLE_PUT_SIZE
         if adjusted_count is not None and (adjusted_count < self.MAX_SINGLE_PUT_SIZE):
@@ -644,9 +702,16 @@ class BlockBlobService(BaseBlobService):
                                        hasattr(stream, 'seekable') and not stream.seekable() or \
                                        not hasattr(stream, 'seek') or not hasattr(stream, 'tell')
 
+            # The blocks are hashed in stream order as they are read, which may hold the
+            # blocks read ahead of the others until the ones before them are read.
+            digest = None
+            if self.key_encryption_key is None and (content_settings is None or not content_settings.content_md5):
+                digest = _OrderedDigest(0, max_connections * self.MAX_BLOCK_SIZE)
+
             if use_original_upload_path:
                 if self.key_encryption_key:
-                    cek, iv, encryption_data = _generate_blob_encryption_data(self.key_encryption_key)
+                    cek, iv, encryption_data = _generate_blob_encryption_data(self.key_encryption_key,
+                                                                              encryption_region_length)
 
                 block_ids = _upload_blob_chunks(
                     blob_service=self,
@@ -664,6 +729,9 @@ class BlockBlobService(BaseBlobService):
                     content_encryption_key=cek,
                     initialization_vector=iv,
                     cpk=cpk,
+                    encryption_region_length=encryption_region_length,
+                    cpu_executor=self.cpu_executor,
+                    digest=digest,
                 )
             else:
                 block_ids = _upload_blob_substream_blocks(
@@ -680,8 +748,14 @@ class BlockBlobService(BaseBlobService):
                     uploader_class=_BlockBlobChunkUploader,
                     timeout=timeout,
                     cpk=cpk,
+                    digest=digest,
                 )
 
+            if digest is not None:
+                content_settings = copy.copy(content_settings) if content_settings is not None \
+                    else ContentSettings()
+                content_settings.content_md5 = digest.get_content_md5()
+
             return self._put_block_list(
                 container_name=container_name,
                 blob_name=blob_name,
@@ -703,7 +777,7 @@ class BlockBlobService(BaseBlobService):
     def create_blob_from_bytes(self, container_name, blob_name, blob, index=0, count=None, content_settings=None,
                                metadata=None, validate_content=False, progress_callback=None, max_connections=2,
                                lease_id=None, if_modified_since=None, if_unmodified_since=None, if_match=None,
-                               if_none_match=None, timeout=None, standard_blob_tier=None, cpk=None):
+                               if_none_match=None, timeout=None, standard_blob_tier=None, cpk=None, compress=False):
         '''
         Creates a new blob from an array of bytes, or updates the content
         of an existing blob, with automatic chunking and progress
@@ -775,6 +849,13 @@ class BlockBlobService(BaseBlobService):
         :param StandardBlobTier standard_blob_tier:
             A standard blob tier value to set the blob to. For this version of the library,
             this is only applicable to block blobs on standard storage accounts.
+        :param bool compress:
+            If true, the content is compressed with gzip as it is read, on a thread
+            of its own while the compressed blocks are staged in parallel, and the
+            content_encoding of the blob is set to 'gzip'. As the compressed size is
+            not known up front, the blob is always uploaded in blocks, and the
+            progress is reported in compressed bytes with a total of None. Not
+            supported with client-side encryption.
         :return: ETag and last modified properties for the Block Blob
         :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
         '''
@@ -800,12 +881,12 @@ class BlockBlobService(BaseBlobService):
                                             if_modified_since=if_modified_since,
                                             if_unmodified_since=if_unmodified_since, if_match=if_match,
                                             if_none_match=if_none_match, timeout=timeout, use_byte_buffer=True,
-                                            standard_blob_tier=standard_blob_tier, cpk=cpk)
+                                            standard_blob_tier=standard_blob_tier, cpk=cpk, compress=compress)
 
     def create_blob_from_text(self, container_name, blob_name, text, encoding='utf-8', content_settings=None,
                               metadata=None, validate_content=False, progress_callback=None, max_connections=2,
                               lease_id=None, if_modified_since=None, if_unmodified_since=None, if_match=None,
-                              if_none_match=None, timeout=None, standard_blob_tier=None, cpk=None):
+                              if_none_match=None, timeout=None, standard_blob_tier=None, cpk=None, compress=False):
         '''
         Creates a new blob from str/unicode, or updates the content of an
         existing blob, with automatic chunking and progress notifications.
@@ -873,6 +954,13 @@ class BlockBlobService(BaseBlobService):
         :param StandardBlobTier standard_blob_tier:
             A standard blob tier value to set the blob to. For this version of the library,
             this is only applicable to block blobs on standard storage accounts.
+        :param bool compress:
+            If true, the content is compressed with gzip as it is read, on a thread
+            of its own while the compressed blocks are staged in parallel, and the
+            content_encoding of the blob is set to 'gzip'. As the compressed size is
+            not known up front, the blob is always uploaded in blocks, and the
+            progress is reported in compressed bytes with a total of None. Not
+            supported with client-side encryption.
         :return: ETag and last modified properties for the Block Blob
         :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
         '''
@@ -890,7 +978,181 @@ class BlockBlobService(BaseBlobService):
                                            max_connections=max_connections, lease_id=lease_id,
                                            if_modified_since=if_modified_since, if_unmodified_since=if_unmodified_since,
                                            if_match=if_match, if_none_match=if_none_match, timeout=timeout,
-                                           standard_blob_tier=standard_blob_tier, cpk=cpk)
+                                           standard_blob_tier=standard_blob_tier, cpk=cpk, compress=compress)
+
+    def create_blob_from_iterable(self, container_name, blob_name, iterable, content_settings=None,
+                                  metadata=None, validate_content=False, progress_callback=None, max_connections=2,
+                                  lease_id=None, if_modified_since=None, if_unmodified_since=None, if_match=None,
+                                  if_none_match=None, timeout=None, standard_blob_tier=None, cpk=None):
+        '''
+        Creates a new blob from an iterable or generator of byte chunks, or updates
+        the content of an existing blob, with automatic chunking and progress
+        notifications.
+
+        The chunks may have any size. They are re-chunked into blocks of
+        MAX_BLOCK_SIZE, without copying when a chunk lines up with a block, and the
+        blocks are uploaded concurrently while the iterable keeps producing data.
+        This allows content such as HTTP responses or database cursors to be
+        proxied to a blob without spooling it to disk. At most max_connections + 1
+        blocks are held in memory. If the iterable raises, nothing is committed.
+
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of blob to create or update.
+        :param iterable:
+            An iterable yielding the content of the blob as bytes-like chunks.
+        :param ~azure.storage.blob.models.ContentSettings content_settings:
+            ContentSettings object used to set blob properties.
+        :param metadata:
+            Name-value pairs associated with the blob as metadata.
+        :type metadata: dict(str, str)
+        :param bool validate_content:
+            If true, calculates an MD5 hash for each chunk of the blob. The storage
+            service checks the hash of the content that has arrived with the hash
+            that was sent. This is primarily valuable for detecting bitflips on
+            the wire if using http instead of https as https (the default) will
+            already validate. Note that this MD5 hash is not stored with the
+            blob.
+        :param progress_callback:
+            Callback for progress with signature function(current, total) where
+            current is the number of bytes transfered so far, and total is None
+            as the size of the blob is unknown.
+        :type progress_callback: func(current, total)
+        :param int max_connections:
+            Maximum number of parallel connections to use to upload the blocks.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param datetime if_modified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only
+            if the resource has been modified since the specified time.
+        :param datetime if_unmodified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only if
+            the resource has not been modified since the specified date/time.
+        :param str if_match:
+            An ETag value, or the wildcard character (*). Specify this header to perform
+            the operation only if the resource's ETag matches the value specified.
+        :param str if_none_match:
+            An ETag value, or the wildcard character (*). Specify this header
+            to perform the operation only if the resource's ETag does not match
+            the value specified. Specify the wildcard character (*) to perform
+            the operation only if the resource does not exist, and fail the
+            operation if it does exist.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Encrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make
+            multiple calls to the Azure service and the timeout will apply to
+            each call individually.
+        :param StandardBlobTier standard_blob_tier:
+            A standard blob tier value to set the blob to. For this version of the library,
+            this is only applicable to block blobs on standard storage accounts.
+        :return: ETag and last modified properties for the Block Blob
+        :rtype: :class:`~azure.storage.blob.models.ResourceProperties`
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        _validate_not_none('iterable', iterable)
+
+        with BlockBlobWriter(self, container_name, blob_name, block_size=self.MAX_BLOCK_SIZE,
+                             max_connections=max_connections, content_settings=content_settings,
+                             metadata=metadata, validate_content=validate_content,
+                             progress_callback=progress_callback, lease_id=lease_id,
+                             if_modified_since=if_modified_since, if_unmodified_since=if_unmodified_since,
+                             if_match=if_match, if_none_match=if_none_match, timeout=timeout,
+                             standard_blob_tier=standard_blob_tier, cpk=cpk) as writer:
+            for chunk in iterable:
+                writer.write(chunk)
+
+        return writer.response_properties
+
+    def upload_directory(self, container_name, directory, blob_prefix='', include=None, exclude=None,
+                         skip_unchanged=False, compare_content_md5=False, max_connections=8,
+                         progress_callback=None, content_settings=None, metadata=None,
+                         validate_content=False, timeout=None, standard_blob_tier=None, cpk=None):
+        '''
+        Uploads the files of a local directory tree as block blobs.
+
+        The tree is walked lazily and every file is uploaded on one pool of
+        max_connections worker threads shared by the whole transfer. Files smaller
+        than MAX_SINGLE_PUT_SIZE are uploaded with a single put blob request each,
+        while larger files are split into blocks of MAX_BLOCK_SIZE that are staged
+        as independent tasks of the same pool, so that many small files and a few
+        large ones keep all the connections busy alike. The upload stops at the
+        first error.
+
+        :param str container_name:
+            Name of existing container.
+        :param str directory:
+            Path of the local directory to upload.
+        :param str blob_prefix:
+            Prefix prepended to the path of each file, relative to directory and
+            with '/' separators, to form its blob name.
+        :param list(str) include:
+            If set, only the files whose relative path matches one of these
+            glob patterns are uploaded. Note that '*' also matches '/'.
+        :param list(str) exclude:
+            Files and directories whose relative path matches one of these glob
+            patterns are not uploaded. Excluded directories are not walked.
+        :param bool skip_unchanged:
+            If true, the blobs under blob_prefix are listed first and a file is
+            skipped if a blob of the same size exists that was last modified
+            after the file.
+        :param bool compare_content_md5:
+            If true, and skip_unchanged is set, the MD5 hash of the files is
+            compared to the Content-MD5 of the blobs that have one, instead of
+            their modification times.
+        :param int max_connections:
+            Maximum number of parallel connections used by the whole transfer.
+        :param progress_callback:
+            Callback for progress with signature function(report), called
+            after each transferred block or file with a snapshot of the
+            aggregate progress and throughput.
+        :type progress_callback: func(:class:`~azure.storage.blob.models.DirectoryTransferReport`)
+        :param ~azure.storage.blob.models.ContentSettings content_settings:
+            ContentSettings object used to set the properties of every blob.
+        :param metadata:
+            Name-value pairs associated with every blob as metadata.
+        :type metadata: dict(str, str)
+        :param bool validate_content:
+            If true, calculates an MD5 hash of each request body. The storage
+            service checks the hash of the content that has arrived with the hash
+            that was sent. Note that this MD5 hash is not stored with the blob.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make
+            multiple calls to the Azure service and the timeout will apply to
+            each call individually.
+        :param StandardBlobTier standard_blob_tier:
+            A standard blob tier value to set the blobs to. For this version of the library,
+            this is only applicable to block blobs on standard storage accounts.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Encrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :return: The aggregate progress and throughput of the transfer.
+        :rtype: :class:`~azure.storage.blob.models.DirectoryTransferReport`
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('directory', directory)
+        _validate_encryption_required(self.require_encryption, self.key_encryption_key)
+        if not path.isdir(directory):
+            raise ValueError('directory should be an existing directory.')
+        if max_connections < 1:
+            raise ValueError('max_connections should be greater than 0.')
+
+        return _upload_directory(self, container_name, directory, blob_prefix or '', include, exclude,
+                                 skip_unchanged, compare_content_md5, max_connections, progress_callback,
+                                 content_settings, metadata, validate_content, timeout, standard_blob_tier, cpk)
 
     def set_standard_blob_tier(
             self, container_name, blob_name, standard_blob_tier, timeout=None, rehydrate_priority=None):
@@ -1247,23 +1509,27 @@ class BlockBlobService(BaseBlobService):
             request.headers.update(content_settings._to_headers())
         blob = _get_data_bytes_only('blob', blob)
         if self.key_encryption_key:
-            encryption_data, blob = _encrypt_blob(blob, self.key_encryption_key)
+            encryption_data, blob = _encrypt_blob(blob, self.key_encryption_key,
+                                                  self._get_encryption_region_length(self.MAX_BLOCK_SIZE))
             request.headers['x-ms-meta-encryptiondata'] = encryption_data
         request.body = blob
 
         if validate_content:
-            computed_md5 = _get_content_md5(request.body)
-            request.headers['Content-MD5'] = _to_str(computed_md5)
+            _add_content_checksum_header(request, self.content_validation_algorithm)
 
         return self._perform_request(request, _parse_base_properties)
 
     def _put_block(self, container_name, blob_name, block, block_id,
-                   validate_content=False, lease_id=None, cpk=None, timeout=None):
+                   validate_content=False, lease_id=None, cpk=None, timeout=None, content_checksum=None):
         '''
         See put_block for more details. This helper method
         allows for encryption or other such special behavior because
         it is safely handled by the library. These behaviors are
         prohibited in the public version of this function.
+        :param str content_checksum:
+            The transactional checksum of the block, if it was computed by the
+            caller, which is sent instead of being computed when validate_content
+            is set.
         '''
 
         _validate_not_none('container_name', container_name)
@@ -1295,8 +1561,7 @@ class BlockBlobService(BaseBlobService):
                     raise ValueError(_ERROR_VALUE_SHOULD_BE_STREAM.format('request.body'))
 
         if validate_content:
-            computed_md5 = _get_content_md5(request.body)
-            request.headers['Content-MD5'] = _to_str(computed_md5)
+            _add_content_checksum_header(request, self.content_validation_algorithm, content_checksum)
 
         self._perform_request(request)
 
@@ -1343,10 +1608,20 @@ class BlockBlobService(BaseBlobService):
             _convert_block_list_to_xml(block_list))
 
         if validate_content:
-            computed_md5 = _get_content_md5(request.body)
-            request.headers['Content-MD5'] = _to_str(computed_md5)
+            _add_content_checksum_header(request, self.content_validation_algorithm)
 
         if encryption_data is not None:
             request.headers['x-ms-meta-encryptiondata'] = encryption_data
 
         return self._perform_request(request, _parse_base_properties)
+
+    def _get_encryption_region_length(self, block_size):
+        '''
+        Returns the length of the regions encrypted with encryption protocol 2.0
+        for an upload in blocks of block_size bytes, or None if the blobs are
+        encrypted with encryption protocol 1.0.
+        '''
+        _validate_encryption_protocol_version(self.encryption_version, _BLOB_ENCRYPTION_PROTOCOLS)
+        if self.encryption_version == _ENCRYPTION_PROTOCOL_V2:
+            return _get_encryption_region_length(block_size)
+        return None
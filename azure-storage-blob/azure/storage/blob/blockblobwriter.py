@@ -0,0 +1,295 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+from io import IOBase
+from threading import (
+    BoundedSemaphore,
+    Lock,
+)
+
+from azure.storage.common._common_conversion import _encode_base64
+from azure.storage.common._error import (
+    _validate_not_none,
+    _validate_encryption_required,
+)
+from azure.storage.common._serialization import url_quote
+
+from ._encryption import (
+    _generate_blob_encryption_data,
+    _get_blob_encryptor_and_padder,
+)
+from ._upload_chunking import (
+    _BlockAccumulator,
+    _prepare_chunk_on_executor,
+)
+from .models import BlobBlock
+
+
+class BlockBlobWriter(IOBase):
+    '''
+    A writable file-like object that uploads the data written to it as a block blob.
+
+    Each write fills a block buffer of block_size bytes. Full blocks are staged in
+    the background with put block requests on a pool of max_connections threads,
+    while the caller keeps producing data. At most max_connections + 1 blocks are
+    buffered at any time, so serializers such as tarfile, gzip or csv can stream
+    arbitrarily large content to a blob with bounded memory.
+
+    The staged blocks are committed as the content of the blob when close() is
+    called, or when a with block exits normally. If the with block exits with an
+    exception, or abort() is called, nothing is committed and the existing content
+    of the blob (if any) is left untouched. Uncommitted blocks are garbage
+    collected by the service.
+
+    If the service has a key_encryption_key, the blocks are encrypted client-side
+    in the same format as create_blob_from_stream. With encryption protocol 2.0,
+    each block is encrypted on the thread that stages it, or on the cpu_executor
+    of the service if it is set.
+    '''
+    _executor = None
+
+    def __init__(self, blob_service, container_name, blob_name, block_size=None,
+                 max_connections=2, content_settings=None, metadata=None,
+                 validate_content=False, progress_callback=None, lease_id=None,
+                 if_modified_since=None, if_unmodified_since=None, if_match=None,
+                 if_none_match=None, timeout=None, standard_blob_tier=None, cpk=None):
+        '''
+        :param ~azure.storage.blob.blockblobservice.BlockBlobService blob_service:
+            The service used to stage and commit the blocks.
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of blob to create or update.
+        :param int block_size:
+            The size of the blocks to stage. Defaults to blob_service.MAX_BLOCK_SIZE.
+        :param int max_connections:
+            Maximum number of blocks staged in parallel.
+        :param ~azure.storage.blob.models.ContentSettings content_settings:
+            ContentSettings object used to set blob properties on commit.
+        :param metadata:
+            Name-value pairs associated with the blob as metadata.
+        :type metadata: dict(str, str)
+        :param bool validate_content:
+            If true, calculates an MD5 hash for each block of the blob. The storage
+            service checks the hash of the content that has arrived with the hash
+            that was sent. Note that this MD5 hash is not stored with the blob.
+        :param progress_callback:
+            Callback for progress with signature function(current, total) where
+            current is the number of bytes staged so far, and total is None as
+            the size of the blob is not known up front.
+        :type progress_callback: func(current, total)
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param datetime if_modified_since:
+            Only commit the blob if the resource has been modified since the specified time.
+        :param datetime if_unmodified_since:
+            Only commit the blob if the resource has not been modified since the specified time.
+        :param str if_match:
+            An ETag value, or the wildcard character (*). Only commit the blob if the
+            resource's ETag matches the value specified.
+        :param str if_none_match:
+            An ETag value, or the wildcard character (*). Only commit the blob if the
+            resource's ETag does not match the value specified.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. It applies to each
+            request individually.
+        :param StandardBlobTier standard_blob_tier:
+            A standard blob tier value to set the blob to.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Encrypts the data on the service-side with the given key.
+        '''
+        _validate_not_none('blob_service', blob_service)
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        _validate_encryption_required(blob_service.require_encryption, blob_service.key_encryption_key)
+
+        block_size = block_size or blob_service.MAX_BLOCK_SIZE
+        if block_size < 1:
+            raise ValueError('block_size should be greater than 0.')
+        if max_connections < 1:
+            raise ValueError('max_connections should be greater than 0.')
+
+        self.blob_service = blob_service
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self.block_size = block_size
+        self.content_settings = content_settings
+        self.metadata = metadata
+        self.validate_content = validate_content
+        self.progress_callback = progress_callback
+        self.lease_id = lease_id
+        self.if_modified_since = if_modified_since
+        self.if_unmodified_since = if_unmodified_since
+        self.if_match = if_match
+        self.if_none_match = if_none_match
+        self.timeout = timeout
+        self.standard_blob_tier = standard_blob_tier
+        self.cpk = cpk
+
+        # ETag and last modified properties of the committed blob, set by close()
+        self.response_properties = None
+
+        self._encryption_region_length = None
+        if blob_service.key_encryption_key is not None:
+            self._encryption_region_length = blob_service._get_encryption_region_length(block_size)
+        cek, iv, self._encryption_data = _generate_blob_encryption_data(blob_service.key_encryption_key,
+                                                                        self._encryption_region_length)
+        self._encryptor, self._padder = _get_blob_encryptor_and_padder(cek, iv, True)
+        self._content_encryption_key = cek
+
+        self._accumulator = _BlockAccumulator(block_size)
+        self._bytes_written = 0
+        self._staged_offset = 0
+        self._blocks = []
+        self._futures = []
+        self._progress_total = 0
+        self._progress_lock = Lock()
+
+        # max_connections + 1 ensures the next block is already buffered and ready
+        # for when a worker thread becomes available.
+        import concurrent.futures
+        self._block_throttler = BoundedSemaphore(max_connections + 1)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_connections)
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._bytes_written
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        length = memoryview(b).nbytes
+        for block in self._accumulator.add(b):
+            self._stage_block(block, final=False)
+
+        self._bytes_written += length
+        return length
+
+    def flush(self):
+        # Blocks can only be staged once they are full, and nothing is visible
+        # until close() commits the block list.
+        pass
+
+    def close(self):
+        '''
+        Stages the remaining data, waits for all blocks to be staged and commits
+        them as the content of the blob.
+        '''
+        if self.closed or self._executor is None:
+            IOBase.close(self)
+            return
+
+        try:
+            self._stage_block(self._accumulator.pop(), final=True)
+            for future in self._futures:
+                future.result()
+
+            self.response_properties = self.blob_service._put_block_list(
+                self.container_name,
+                self.blob_name,
+                self._blocks,
+                content_settings=self.content_settings,
+                metadata=self.metadata,
+                validate_content=self.validate_content,
+                lease_id=self.lease_id,
+                if_modified_since=self.if_modified_since,
+                if_unmodified_since=self.if_unmodified_since,
+                if_match=self.if_match,
+                if_none_match=self.if_none_match,
+                timeout=self.timeout,
+                encryption_data=self._encryption_data,
+                standard_blob_tier=self.standard_blob_tier,
+                cpk=self.cpk,
+            )
+        finally:
+            self._executor.shutdown(wait=True)
+            IOBase.close(self)
+
+    def abort(self):
+        '''
+        Discards the data written so far without committing anything.
+        '''
+        if self.closed:
+            return
+
+        for future in self._futures:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        IOBase.close(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self):
+        # Never commit a partially written blob from the garbage collector.
+        try:
+            self.abort()
+        except Exception:
+            pass
+
+    def _stage_block(self, data, final):
+        # CBC encryption chains the blocks, so it happens here, in stream order.
+        if self._padder:
+            data = self._padder.update(data) + (self._padder.finalize() if final else b'')
+        if self._encryptor:
+            data = self._encryptor.update(data) + (self._encryptor.finalize() if final else b'')
+
+        if not data:
+            return
+
+        # Fail fast if a previous block could not be staged.
+        for future in [f for f in self._futures if f.done()]:
+            if future.exception() is not None:
+                raise future.exception()
+            self._futures.remove(future)
+
+        # The offsets of the blocks are in plaintext with encryption protocol 2.0
+        block_id = url_quote(_encode_base64('{0:032d}'.format(self._staged_offset)))
+        self._staged_offset += len(data)
+        self._blocks.append(BlobBlock(block_id))
+
+        self._block_throttler.acquire()
+        future = self._executor.submit(self._put_block, block_id, data)
+        future.add_done_callback(lambda x: self._block_throttler.release())
+        self._futures.append(future)
+
+    def _put_block(self, block_id, data):
+        length = len(data)
+        content_validation_algorithm = self.blob_service.content_validation_algorithm if self.validate_content \
+            else None
+        data, content_checksum = _prepare_chunk_on_executor(
+            self.blob_service.cpu_executor, self._content_encryption_key, self._encryption_region_length,
+            content_validation_algorithm, data)
+
+        self.blob_service._put_block(
+            self.container_name,
+            self.blob_name,
+            data,
+            block_id,
+            validate_content=self.validate_content,
+            lease_id=self.lease_id,
+            timeout=self.timeout,
+            cpk=self.cpk,
+            content_checksum=content_checksum,
+        )
+
+        if self.progress_callback is not None:
+            with self._progress_lock:
+                self._progress_total += length
+                total = self._progress_total
+            self.progress_callback(total, None)
@@ -409,6 +409,60 @@ class AppendBlockProperties(ResourceProperties):
         self.committed_block_count = None
 
 
+class AppendBlobWriterStatistics(object):
+    '''
+    Statistics collected by an AppendBlobWriter about the blocks it has appended.
+
+    :ivar int blocks_appended:
+        Number of append block requests that completed successfully.
+    :ivar int bytes_appended:
+        Number of bytes committed to the blob by the writer.
+    :ivar int pending_bytes:
+        Number of bytes written to the writer that are not yet committed.
+    :ivar float average_batch_size:
+        Average size in bytes of the appended blocks.
+    :ivar float average_flush_latency:
+        Average time in seconds between a block being sealed for upload and the
+        service acknowledging its append.
+    :ivar float max_flush_latency:
+        Longest time in seconds between a block being sealed for upload and the
+        service acknowledging its append.
+    '''
+
+    def __init__(self):
+        self.blocks_appended = 0
+        self.bytes_appended = 0
+        self.pending_bytes = 0
+        self.average_batch_size = 0.0
+        self.average_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+
+class DirectoryTransferReport(object):
+    '''
+    Aggregate progress of a bulk transfer between a local directory and a container.
+
+    :ivar int files_transferred:
+        Number of files whose transfer completed successfully.
+    :ivar int files_skipped:
+        Number of files that were skipped because they were unchanged.
+    :ivar int bytes_transferred:
+        Number of bytes transferred so far, including the blocks of files
+        that are still in progress.
+    :ivar float elapsed_time:
+        Time in seconds since the transfer started.
+    :ivar float throughput:
+        Average number of bytes transferred per second since the transfer started.
+    '''
+
+    def __init__(self):
+        self.files_transferred = 0
+        self.files_skipped = 0
+        self.bytes_transferred = 0
+        self.elapsed_time = 0.0
+        self.throughput = 0.0
+
+
 class PageBlobProperties(ResourceProperties):
     '''
     Response for a page request.
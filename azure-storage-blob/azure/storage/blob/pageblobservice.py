@@ -10,7 +10,6 @@ from azure.storage.common._common_conversion import (
     _int_to_str,
     _to_str,
     _datetime_to_utc_string,
-    _get_content_md5,
 )
 from azure.storage.common._constants import (
     SERVICE_HOST_BASE,
@@ -26,6 +25,7 @@ from azure.storage.common._error import (
 from azure.storage.common._http import HTTPRequest
 from azure.storage.common._serialization import (
     _get_data_bytes_only,
+    _add_content_checksum_header,
     _add_metadata_headers,
 )
 from ._deserialization import (
@@ -33,6 +33,7 @@ from ._deserialization import (
     _parse_page_properties,
     _parse_base_properties,
 )
+from ._download_chunking import _download_blob_page_ranges
 from ._encryption import _generate_blob_encryption_data
 from ._error import (
     _ERROR_PAGE_BLOB_SIZE_ALIGNMENT,
@@ -1175,6 +1176,7 @@ class PageBlobService(BaseBlobService):
             initialization_vector=iv,
             resource_properties=resource_properties,
             cpk=cpk,
+            cpu_executor=self.cpu_executor,
         )
 
         return resource_properties
@@ -1292,6 +1294,117 @@ class PageBlobService(BaseBlobService):
             premium_page_blob_tier=premium_page_blob_tier,
             cpk=cpk)
 
+    def get_sparse_blob_to_path(
+            self, container_name, blob_name, file_path, snapshot=None,
+            validate_content=False, progress_callback=None, max_connections=2,
+            lease_id=None, if_modified_since=None, if_unmodified_since=None,
+            if_match=None, if_none_match=None, timeout=None, cpk=None):
+        '''
+        Downloads a page blob to a file path, fetching only the valid page ranges.
+        The file is sized to the blob and the pages that were never written or
+        were cleared are left as holes, which most file systems store sparsely,
+        so the time and space taken by a mostly empty blob such as a VHD are
+        proportional to the data actually written to it. The page ranges are
+        listed first and are then downloaded in chunks of self.MAX_CHUNK_GET_SIZE,
+        all conditioned on the ETag of the blob when the download started.
+        Returns an instance of :class:`~azure.storage.blob.models.Blob` with
+        properties and metadata.
+
+        :param str container_name:
+            Name of existing container.
+        :param str blob_name:
+            Name of existing page blob.
+        :param str file_path:
+            Path of file to write out to. The file is created or overwritten.
+        :param str snapshot:
+            The snapshot parameter is an opaque DateTime value that,
+            when present, specifies the blob snapshot to retrieve.
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each retrieved portion of
+            the blob. Note that the service will only return transactional MD5s
+            for chunks 4MB or less, so self.MAX_CHUNK_GET_SIZE must not be set
+            to greater than 4MB.
+        :param progress_callback:
+            Callback for progress with signature function(current, total)
+            where current is the number of bytes transfered so far, and total is
+            the number of bytes in the valid page ranges.
+        :type progress_callback: func(current, total)
+        :param int max_connections:
+            Maximum number of parallel connections to use.
+        :param str lease_id:
+            Required if the blob has an active lease.
+        :param datetime if_modified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC. 
+            Specify this header to perform the operation only
+            if the resource has been modified since the specified time.
+        :param datetime if_unmodified_since:
+            A DateTime value. Azure expects the date value passed in to be UTC.
+            If timezone is included, any non-UTC datetimes will be converted to UTC.
+            If a date is passed in without timezone info, it is assumed to be UTC.
+            Specify this header to perform the operation only if
+            the resource has not been modified since the specified date/time.
+        :param str if_match:
+            An ETag value, or the wildcard character (*). Specify this header to perform
+            the operation only if the resource's ETag matches the value specified.
+        :param str if_none_match:
+            An ETag value, or the wildcard character (*). Specify this header
+            to perform the operation only if the resource's ETag does not match
+            the value specified. Specify the wildcard character (*) to perform
+            the operation only if the resource does not exist, and fail the
+            operation if it does exist.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make 
+            multiple calls to the Azure service and the timeout will apply to 
+            each call individually.
+        :param ~azure.storage.blob.models.CustomerProvidedEncryptionKey cpk:
+            Decrypts the data on the service-side with the given key.
+            Use of customer-provided keys must be done over HTTPS.
+            As the encryption key itself is provided in the request,
+            a secure connection must be established to transfer the key.
+        :return: A Blob with properties and metadata.
+        :rtype: :class:`~azure.storage.blob.models.Blob`
+        '''
+        _validate_not_none('container_name', container_name)
+        _validate_not_none('blob_name', blob_name)
+        _validate_not_none('file_path', file_path)
+
+        blob = self.get_blob_properties(container_name, blob_name, snapshot=snapshot, lease_id=lease_id,
+                                        if_modified_since=if_modified_since,
+                                        if_unmodified_since=if_unmodified_since,
+                                        if_match=if_match, if_none_match=if_none_match,
+                                        timeout=timeout, cpk=cpk)
+
+        # Lock the page list and every range on the etag the download started with
+        etag = blob.properties.etag
+        page_ranges = self.get_page_ranges(container_name, blob_name, snapshot=snapshot, lease_id=lease_id,
+                                           if_match=etag, timeout=timeout)
+
+        with open(file_path, 'wb') as stream:
+            # Extending the empty file leaves the whole blob as a hole, which the
+            # valid page ranges then fill in
+            stream.truncate(blob.properties.content_length)
+
+            _download_blob_page_ranges(
+                self,
+                container_name,
+                blob_name,
+                snapshot,
+                page_ranges,
+                self.MAX_CHUNK_GET_SIZE,
+                stream,
+                max_connections,
+                progress_callback,
+                validate_content,
+                lease_id,
+                etag,
+                timeout,
+                cpk,
+            )
+
+        return blob
+
     def set_premium_page_blob_tier(
             self, container_name, blob_name, premium_page_blob_tier,
             timeout=None):
@@ -1526,12 +1639,16 @@ class PageBlobService(BaseBlobService):
             validate_content=False, lease_id=None, if_sequence_number_lte=None,
             if_sequence_number_lt=None, if_sequence_number_eq=None,
             if_modified_since=None, if_unmodified_since=None,
-            if_match=None, if_none_match=None, cpk=None, timeout=None):
+            if_match=None, if_none_match=None, cpk=None, timeout=None, content_checksum=None):
         '''
         See update_page for more details. This helper method
         allows for encryption or other such special behavior because
         it is safely handled by the library. These behaviors are
         prohibited in the public version of this function.
+        :param str content_checksum:
+            The transactional checksum of the page, if it was computed by the
+            caller, which is sent instead of being computed when validate_content
+            is set.
         '''
 
         request = HTTPRequest()
@@ -1562,7 +1679,6 @@ class PageBlobService(BaseBlobService):
         request.body = _get_data_bytes_only('page', page)
 
         if validate_content:
-            computed_md5 = _get_content_md5(request.body)
-            request.headers['Content-MD5'] = _to_str(computed_md5)
+            _add_content_checksum_header(request, self.content_validation_algorithm, content_checksum)
 
         return self._perform_request(request, _parse_page_properties)
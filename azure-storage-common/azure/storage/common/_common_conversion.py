@@ -7,18 +7,25 @@
 import base64
 import hashlib
 import hmac
+import os
+import stat
+import struct
 import sys
+import threading
 from io import (SEEK_SET)
 
+from azure.common import AzureException
 from dateutil.tz import tzutc
 
 from ._error import (
+    _ERROR_MD5_ABORTED,
     _ERROR_VALUE_SHOULD_BE_BYTES_OR_STREAM,
     _ERROR_VALUE_SHOULD_BE_SEEKABLE_STREAM,
 )
 from .models import (
     _unicode_type,
 )
+from ._constants import _CONTENT_VALIDATION_CRC64
 
 if sys.version_info < (3,):
     def _str(value):
@@ -122,5 +129,205 @@ def _get_content_md5(data):
     return base64.b64encode(md5.digest()).decode('utf-8')
 
 
+# The CRC64 of the service is reflected, with the polynomial 0x9A6C9329AC4BC9B5
+# and the value complemented before and after, as in the Go hash/crc64 package.
+_CRC64_POLYNOMIAL = 0x9A6C9329AC4BC9B5
+_CRC64_MASK = 0xFFFFFFFFFFFFFFFF
+
+# crcmod takes the polynomial unreflected, with its leading term
+_CRC64_CRCMOD_POLYNOMIAL = 0x1AD93D23594C93659
+
+# The words are read 64KB at a time
+_CRC64_READ_SIZE = 64 * 1024
+
+
+def _get_crc64_tables():
+    # _CRC64_TABLES[k][b] is the CRC of the byte b followed by k zero bytes, which
+    # lets the update fold 8 bytes at a time (slicing-by-8).
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ _CRC64_POLYNOMIAL if crc & 1 else crc >> 1
+        table.append(crc)
+
+    tables = [table]
+    for _ in range(7):
+        previous = tables[-1]
+        tables.append([(crc >> 8) ^ table[crc & 0xff] for crc in previous])
+    return tables
+
+
+_CRC64_TABLES = _get_crc64_tables()
+
+
+def _get_crcmod_crc64():
+    # Returns the CRC64 function of crcmod if its C extension is installed. The
+    # CRC64 computed in Python is an order of magnitude slower than MD5.
+    try:
+        from crcmod.crcmod import (
+            _usingExtension,
+            mkCrcFun,
+        )
+    except ImportError:
+        return None
+
+    if not _usingExtension:
+        return None
+    return mkCrcFun(_CRC64_CRCMOD_POLYNOMIAL, rev=True, initCrc=0, xorOut=_CRC64_MASK)
+
+
+_CRCMOD_CRC64 = _get_crcmod_crc64()
+
+
+def _update_crc64(crc, data):
+    if _CRCMOD_CRC64 is not None:
+        return _CRCMOD_CRC64(data, crc)
+    return _update_crc64_python(crc, data)
+
+
+def _update_crc64_python(crc, data):
+    t0, t1, t2, t3, t4, t5, t6, t7 = _CRC64_TABLES
+    crc ^= _CRC64_MASK
+
+    words_end = len(data) - len(data) % 8
+    for start in range(0, words_end, _CRC64_READ_SIZE):
+        count = min(_CRC64_READ_SIZE, words_end - start) // 8
+        for word in struct.unpack_from('<{0}Q'.format(count), data, start):
+            crc ^= word
+            crc = (t7[crc & 0xff] ^ t6[(crc >> 8) & 0xff] ^ t5[(crc >> 16) & 0xff] ^ t4[(crc >> 24) & 0xff] ^
+                   t3[(crc >> 32) & 0xff] ^ t2[(crc >> 40) & 0xff] ^ t1[(crc >> 48) & 0xff] ^ t0[crc >> 56])
+
+    for byte in bytearray(data[words_end:]):
+        crc = t0[(crc ^ byte) & 0xff] ^ (crc >> 8)
+
+    return crc ^ _CRC64_MASK
+
+
+def _get_content_crc64(data):
+    crc = 0
+    if isinstance(data, bytes):
+        crc = _update_crc64(crc, data)
+    elif hasattr(data, 'read'):
+        pos = 0
+        try:
+            pos = data.tell()
+        except:
+            pass
+        for chunk in iter(lambda: data.read(_CRC64_READ_SIZE), b""):
+            crc = _update_crc64(crc, chunk)
+        try:
+            data.seek(pos, SEEK_SET)
+        except (AttributeError, IOError):
+            raise ValueError(_ERROR_VALUE_SHOULD_BE_SEEKABLE_STREAM.format('data'))
+    else:
+        raise ValueError(_ERROR_VALUE_SHOULD_BE_BYTES_OR_STREAM.format('data'))
+
+    # the header holds the little-endian bytes of the CRC
+    return base64.b64encode(struct.pack('<Q', crc)).decode('utf-8')
+
+
+def _get_content_checksum(data, algorithm):
+    if algorithm == _CONTENT_VALIDATION_CRC64:
+        return _get_content_crc64(data)
+    return _get_content_md5(data)
+
+
+class _OrderedDigest(object):
+    '''
+    Computes the MD5 of a blob or file from chunks that may be transferred out
+    of order, given with their offsets.
+
+    The chunks are hashed as soon as they form a contiguous prefix of the content.
+    The chunks that complete ahead of it are held until then, and the threads
+    that would hold more than max_pending bytes ahead of it wait, which bounds
+    the memory used. The chunk that extends the prefix is always accepted, so
+    a transfer that hands out its chunks in order cannot deadlock. A transfer
+    whose chunk fails aborts the digest, so that the threads waiting for that
+    chunk raise instead of waiting forever.
+    '''
+
+    def __init__(self, position, max_pending):
+        self.position = position
+        self.max_pending = max_pending
+        self._md5 = hashlib.md5()
+        self._pending = {}
+        self._hashing = False
+        self._aborted = False
+        self._condition = threading.Condition()
+
+    def update(self, offset, data):
+        if not data:
+            return
+
+        with self._condition:
+            while not self._aborted and offset - self.position > self.max_pending:
+                self._condition.wait()
+            if self._aborted:
+                raise AzureException(_ERROR_MD5_ABORTED)
+            self._pending[offset] = data
+
+            # a single thread hashes the prefix, the others only hand over their chunks
+            if self._hashing:
+                return
+            self._hashing = True
+
+            try:
+                while not self._aborted and self.position in self._pending:
+                    chunk_data = self._pending.pop(self.position)
+                    self._condition.release()
+                    try:
+                        self._md5.update(chunk_data)
+                    finally:
+                        self._condition.acquire()
+                    self.position += len(chunk_data)
+                    self._condition.notify_all()
+            finally:
+                self._hashing = False
+
+    def abort(self):
+        with self._condition:
+            self._aborted = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+    def get_content_md5(self):
+        with self._condition:
+            if self._aborted:
+                raise AzureException(_ERROR_MD5_ABORTED)
+            if self._pending:
+                raise ValueError('The chunks do not form a contiguous range.')
+            return base64.b64encode(self._md5.digest()).decode('utf-8')
+
+
+def _get_positional_fileno(stream):
+    if not hasattr(os, 'pwrite'):
+        return None
+
+    try:
+        fileno = stream.fileno()
+        if stat.S_ISREG(os.fstat(fileno).st_mode):
+            return fileno
+    except (AttributeError, OSError, IOError, ValueError):
+        pass
+    return None
+
+
+def _preallocate(fileno, offset, length):
+    if length <= 0:
+        return
+
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fileno, offset, length)
+            return
+        except OSError:
+            # not every file system supports it
+            pass
+
+    if os.fstat(fileno).st_size < offset + length:
+        os.ftruncate(fileno, offset + length)
+
+
 def _lower(text):
     return text.lower()
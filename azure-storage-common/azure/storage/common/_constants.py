@@ -45,6 +45,11 @@ if sys.version_info >= (3, 5):
 
 # Encryption constants
 _ENCRYPTION_PROTOCOL_V1 = '1.0'
+_ENCRYPTION_PROTOCOL_V2 = '2.0'
+
+# Transactional content validation algorithms
+_CONTENT_VALIDATION_MD5 = 'md5'
+_CONTENT_VALIDATION_CRC64 = 'crc64'
 
 _AUTHORIZATION_HEADER_NAME = 'Authorization'
 _COPY_SOURCE_HEADER_NAME = 'x-ms-copy-source'
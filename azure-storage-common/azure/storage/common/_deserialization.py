@@ -3,7 +3,12 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+from datetime import datetime
+from functools import partial
+from io import BytesIO
+
 from dateutil import parser
+from dateutil.tz import tzutc
 
 from ._common_conversion import _to_str
 
@@ -38,6 +43,64 @@ def _to_upper_str(value):
     return _to_str(value).upper() if value is not None else None
 
 
+_RFC1123_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+                   'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+_UTC = tzutc()
+
+# The parsed seconds, which repeat across the items of a list and the headers
+# of a response. The memo is emptied when it is full.
+_DATETIME_MEMO = {}
+_DATETIME_MEMO_SIZE = 4096
+
+
+def _parse_datetime(value, ignoretz=False):
+    '''
+    Parses the dates returned by the service, in the fixed formats of RFC 1123
+    ('Thu, 09 May 2019 00:52:37 GMT') and of ISO 8601 in UTC with up to 7
+    fractional digits ('2019-05-09T00:52:37.1234567Z'), without dateutil. The
+    datetime of each second is memoized. Any other format is parsed by dateutil.
+
+    :param bool ignoretz:
+        If true, a naive datetime is returned instead of one in UTC.
+    '''
+    try:
+        microsecond = 0
+        if len(value) == 29 and value[3:5] == ', ' and value[25:] == ' GMT':
+            second = value
+        elif value[-1] == 'Z' and value[10] == 'T':
+            second = value[:19]
+            fraction = value[20:-1]
+            if len(value) > 20:
+                if value[19] != '.' or not fraction.isdigit():
+                    raise ValueError
+                # as with dateutil, the digits beyond the microseconds are dropped
+                microsecond = int(fraction[:6].ljust(6, '0'))
+        else:
+            raise ValueError
+
+        key = (second, ignoretz)
+        result = _DATETIME_MEMO.get(key)
+        if result is None:
+            tzinfo = None if ignoretz else _UTC
+            if len(second) == 29:
+                result = datetime(int(second[12:16]), _RFC1123_MONTHS[second[8:11]], int(second[5:7]),
+                                  int(second[17:19]), int(second[20:22]), int(second[23:25]), tzinfo=tzinfo)
+            else:
+                if second[4] != '-' or second[7] != '-' or second[13] != ':' or second[16] != ':':
+                    raise ValueError
+                result = datetime(int(second[0:4]), int(second[5:7]), int(second[8:10]),
+                                  int(second[11:13]), int(second[14:16]), int(second[17:19]), tzinfo=tzinfo)
+
+            if len(_DATETIME_MEMO) >= _DATETIME_MEMO_SIZE:
+                _DATETIME_MEMO.clear()
+            _DATETIME_MEMO[key] = result
+
+        return result.replace(microsecond=microsecond) if microsecond else result
+    except (ValueError, KeyError, IndexError, TypeError):
+        return parser.parse(value, ignoretz=ignoretz)
+
+
 def _get_download_size(start_range, end_range, resource_size):
     if start_range is not None:
         end_range = end_range if end_range else (resource_size if resource_size else None)
@@ -50,7 +113,7 @@ def _get_download_size(start_range, end_range, resource_size):
 
 
 GET_PROPERTIES_ATTRIBUTE_MAP = {
-    'last-modified': (None, 'last_modified', parser.parse),
+    'last-modified': (None, 'last_modified', _parse_datetime),
     'etag': (None, 'etag', _to_str),
     'x-ms-blob-type': (None, 'blob_type', _to_str),
     'content-length': (None, 'content_length', _to_int),
@@ -59,13 +122,13 @@ GET_PROPERTIES_ATTRIBUTE_MAP = {
     'x-ms-blob-committed-block-count': (None, 'append_blob_committed_block_count', _to_int),
     'x-ms-blob-public-access': (None, 'public_access', _to_str),
     'x-ms-access-tier': (None, 'blob_tier', _to_str),
-    'x-ms-access-tier-change-time': (None, 'blob_tier_change_time', parser.parse),
+    'x-ms-access-tier-change-time': (None, 'blob_tier_change_time', _parse_datetime),
     'x-ms-access-tier-inferred': (None, 'blob_tier_inferred', _bool),
     'x-ms-archive-status': (None, 'rehydration_status', _to_str),
     'x-ms-share-quota': (None, 'quota', _to_int),
     'x-ms-server-encrypted': (None, 'server_encrypted', _bool),
     'x-ms-encryption-key-sha256': (None, 'encryption_key_sha256', _to_str),
-    'x-ms-creation-time': (None, 'creation_time', parser.parse),
+    'x-ms-creation-time': (None, 'creation_time', _parse_datetime),
     'content-type': ('content_settings', 'content_type', _to_str),
     'cache-control': ('content_settings', 'cache_control', _to_str),
     'content-encoding': ('content_settings', 'content_encoding', _to_str),
@@ -79,21 +142,36 @@ GET_PROPERTIES_ATTRIBUTE_MAP = {
     'x-ms-copy-source': ('copy', 'source', _to_str),
     'x-ms-copy-status': ('copy', 'status', _to_str),
     'x-ms-copy-progress': ('copy', 'progress', _to_str),
-    'x-ms-copy-completion-time': ('copy', 'completion_time', parser.parse),
+    'x-ms-copy-completion-time': ('copy', 'completion_time', _parse_datetime),
     'x-ms-copy-destination-snapshot': ('copy', 'destination_snapshot_time', _to_str),
     'x-ms-copy-status-description': ('copy', 'status_description', _to_str),
     'x-ms-has-immutability-policy': (None, 'has_immutability_policy', _bool),
     'x-ms-has-legal-hold': (None, 'has_legal_hold', _bool),
     'x-ms-file-attributes': ('smb_properties', 'ntfs_attributes', _to_str),
-    'x-ms-file-creation-time': ('smb_properties', 'creation_time', parser.parse, True),
-    'x-ms-file-last-write-time': ('smb_properties', 'last_write_time', parser.parse, True),
-    'x-ms-file-change-time': ('smb_properties', 'change_time', parser.parse, True),
+    'x-ms-file-creation-time': ('smb_properties', 'creation_time', _parse_datetime, True),
+    'x-ms-file-last-write-time': ('smb_properties', 'last_write_time', _parse_datetime, True),
+    'x-ms-file-change-time': ('smb_properties', 'change_time', _parse_datetime, True),
     'x-ms-file-permission-key': ('smb_properties', 'permission_key', _to_str),
     'x-ms-file-id': ('smb_properties', 'file_id', _to_str),
     'x-ms-file-parent-id': ('smb_properties', 'parent_id', _to_str),
 }
 
 
+def _compile_header_parsers(attribute_map):
+    # Binds the options of the converters, such as the ignoretz of the dates
+    # flagged in the map, so that each header is converted with a single call.
+    header_parsers = {}
+    for header, info in attribute_map.items():
+        convert = info[2]
+        if len(info) > 3:
+            convert = partial(convert, ignoretz=info[3])
+        header_parsers[header] = (info[0], info[1], convert)
+    return header_parsers
+
+
+_GET_PROPERTIES_HEADER_PARSERS = _compile_header_parsers(GET_PROPERTIES_ATTRIBUTE_MAP)
+
+
 def _parse_metadata(response):
     '''
     Extracts out resource metadata information.
@@ -116,26 +194,33 @@ def _parse_properties(response, result_class):
     Ignores the standard http headers.
     '''
 
+    return _parse_properties_and_metadata(response, result_class)[0]
+
+
+def _parse_properties_and_metadata(response, result_class):
+    '''
+    Extracts out resource properties and metadata in a single pass over the
+    headers, with the precompiled converters of the properties.
+    '''
+
     if response is None or response.headers is None:
-        return None
+        return None, None
 
     props = result_class()
+    metadata = _dict()
     for key, value in response.headers.items():
-        info = GET_PROPERTIES_ATTRIBUTE_MAP.get(key)
-        if info:
+        info = _GET_PROPERTIES_HEADER_PARSERS.get(key)
+        if info is not None:
             if info[0] is None:
                 setattr(props, info[1], info[2](value))
             else:
-                attr = getattr(props, info[0])
-                # if info[3] is True, time zones in parsed strings are ignored and a naive :class:`datetime` object
-                # will be returned.
-                ignoretz = info[3] if len(info) > 3 else False
-                header_value = info[2](value, ignoretz=ignoretz) if info[2] is parser.parse else info[2](value)
-                setattr(attr, info[1], header_value)
+                setattr(getattr(props, info[0]), info[1], info[2](value))
+        elif key[:10].lower() == 'x-ms-meta-':
+            metadata[key[10:]] = _to_str(value)
 
     if hasattr(props, 'blob_type') and props.blob_type == 'PageBlob' and hasattr(props, 'blob_tier') and props.blob_tier is not None:
         props.blob_tier = _to_upper_str(props.blob_tier)
-    return props
+    return props, metadata
 
 
 def _parse_length_from_content_range(content_range):
@@ -151,6 +236,50 @@ def _parse_length_from_content_range(content_range):
     return int(content_range.split(' ', 1)[1].split('/', 1)[1])
 
 
+class _XmlListParser(object):
+    '''
+    Parses the XML body of a list response incrementally, instead of building the
+    tree of the whole response. Iterating it yields each item of the list, such
+    as a Blob of a blob listing, as soon as its element is complete, and discards
+    the element when the next item is requested. The text of the other children
+    of the root, such as NextMarker, is kept in values.
+
+    <EnumerationResults>
+      <NextMarker>value</NextMarker>
+      <Collection>
+        <Item>...</Item>
+      </Collection>
+    </EnumerationResults>
+    '''
+
+    def __init__(self, body):
+        self.body = body
+        self.values = {}
+
+    def __iter__(self):
+        depth = 0
+        collection_element = None
+        for event, element in ETree.iterparse(BytesIO(self.body), events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 2:
+                    collection_element = element
+                continue
+
+            depth -= 1
+            if depth == 2:
+                yield element
+                element.clear()
+                collection_element.remove(element)
+            elif depth == 1:
+                # as with findtext, an empty element has an empty text
+                self.values[element.tag] = element.text or ''
+                element.clear()
+
+    def findtext(self, tag):
+        return self.values.get(tag)
+
+
 def _convert_xml_to_signed_identifiers(response):
     '''
     <?xml version="1.0" encoding="utf-8"?>
@@ -181,11 +310,11 @@ def _convert_xml_to_signed_identifiers(response):
         if access_policy_element is not None:
             start_element = access_policy_element.find('Start')
             if start_element is not None:
-                access_policy.start = parser.parse(start_element.text)
+                access_policy.start = _parse_datetime(start_element.text)
 
             expiry_element = access_policy_element.find('Expiry')
             if expiry_element is not None:
-                access_policy.expiry = parser.parse(expiry_element.text)
+                access_policy.expiry = _parse_datetime(expiry_element.text)
 
             access_policy.permission = access_policy_element.findtext('Permission')
 
@@ -214,7 +343,7 @@ def _convert_xml_to_service_stats(response):
     geo_replication = GeoReplication()
     geo_replication.status = geo_replication_element.find('Status').text
     last_sync_time = geo_replication_element.find('LastSyncTime').text
-    geo_replication.last_sync_time = parser.parse(last_sync_time) if last_sync_time else None
+    geo_replication.last_sync_time = _parse_datetime(last_sync_time) if last_sync_time else None
 
     service_stats = ServiceStats()
     service_stats.geo_replication = geo_replication
@@ -16,6 +16,7 @@ from ._common_conversion import (
 )
 from ._constants import (
     _ENCRYPTION_PROTOCOL_V1,
+    _ENCRYPTION_PROTOCOL_V2,
     __version__,
 )
 from ._error import (
@@ -32,6 +33,14 @@ class _EncryptionAlgorithm(object):
     Specifies which client encryption algorithm is used.
     '''
     AES_CBC_256 = 'AES_CBC_256'
+    AES_GCM_256 = 'AES_GCM_256'
+
+
+# Encryption protocol 2.0 encrypts the content in independent regions, each
+# stored as its nonce, its ciphertext and its authentication tag.
+_GCM_REGION_DATA_LENGTH = 4 * 1024 * 1024
+_GCM_NONCE_LENGTH = 12
+_GCM_TAG_LENGTH = 16
 
 
 class _WrappedContentKey:
@@ -58,6 +67,30 @@ class _WrappedContentKey:
         self.key_id = key_id
 
 
+class _EncryptedRegionInfo:
+    '''
+    Represents the layout of the regions of content encrypted with protocol 2.0.
+    '''
+
+    def __init__(self, data_length, nonce_length, tag_length):
+        '''
+        :param int data_length:
+            The length of the plaintext of each region, except the last one.
+        :param int nonce_length:
+            The length of the nonce that precedes the ciphertext of each region.
+        :param int tag_length:
+            The length of the authentication tag that follows the ciphertext of each region.
+        '''
+
+        _validate_not_none('data_length', data_length)
+        _validate_not_none('nonce_length', nonce_length)
+        _validate_not_none('tag_length', tag_length)
+
+        self.data_length = data_length
+        self.nonce_length = nonce_length
+        self.tag_length = tag_length
+
+
 class _EncryptionAgent:
     '''
     Represents the encryption agent stored on the service.
@@ -85,10 +118,10 @@ class _EncryptionData:
     '''
 
     def __init__(self, content_encryption_IV, encryption_agent, wrapped_content_key,
-                 key_wrapping_metadata):
+                 key_wrapping_metadata, encrypted_region_info=None):
         '''
         :param bytes content_encryption_IV:
-            The content encryption initialization vector.
+            The content encryption initialization vector. Not used by protocol 2.0.
         :param _EncryptionAgent encryption_agent:
             The encryption agent.
         :param _WrappedContentKey wrapped_content_key:
@@ -96,9 +129,12 @@ class _EncryptionData:
             and the encrypted key bytes.
         :param dict key_wrapping_metadata:
             A dict containing metadata related to the key wrapping.
+        :param _EncryptedRegionInfo encrypted_region_info:
+            The layout of the encrypted regions, for protocol 2.0.
         '''
 
-        _validate_not_none('content_encryption_IV', content_encryption_IV)
+        if encrypted_region_info is None:
+            _validate_not_none('content_encryption_IV', content_encryption_IV)
         _validate_not_none('encryption_agent', encryption_agent)
         _validate_not_none('wrapped_content_key', wrapped_content_key)
 
@@ -106,20 +142,28 @@ class _EncryptionData:
         self.encryption_agent = encryption_agent
         self.wrapped_content_key = wrapped_content_key
         self.key_wrapping_metadata = key_wrapping_metadata
+        self.encrypted_region_info = encrypted_region_info
 
 
-def _generate_encryption_data_dict(kek, cek, iv):
+def _generate_encryption_data_dict(kek, cek, iv, region_data_length=None):
     '''
     Generates and returns the encryption metadata as a dict.
 
     :param object kek: The key encryption key. See calling functions for more information.
     :param bytes cek: The content encryption key.
-    :param bytes iv: The initialization vector.
+    :param bytes iv: The initialization vector. Not used by protocol 2.0.
+    :param int region_data_length:
+        If set, the content is encrypted with protocol 2.0 in regions of this
+        length, instead of protocol 1.0.
     :return: A dict containing all the encryption metadata.
     :rtype: dict
     '''
-    # Encrypt the cek.
-    wrapped_cek = kek.wrap_key(cek)
+    # Encrypt the cek. Protocol 2.0 wraps the protocol version along with the
+    # cek, so that the metadata cannot be downgraded to another protocol.
+    if region_data_length is not None:
+        wrapped_cek = kek.wrap_key(_get_protocol_key_prefix(_ENCRYPTION_PROTOCOL_V2) + cek)
+    else:
+        wrapped_cek = kek.wrap_key(cek)
 
     # Build the encryption_data dict.
     # Use OrderedDict to comply with Java's ordering requirement.
@@ -129,31 +173,45 @@ def _generate_encryption_data_dict(kek, cek, iv):
     wrapped_content_key['Algorithm'] = kek.get_key_wrap_algorithm()
 
     encryption_agent = OrderedDict()
-    encryption_agent['Protocol'] = _ENCRYPTION_PROTOCOL_V1
-    encryption_agent['EncryptionAlgorithm'] = _EncryptionAlgorithm.AES_CBC_256
+    if region_data_length is not None:
+        encryption_agent['Protocol'] = _ENCRYPTION_PROTOCOL_V2
+        encryption_agent['EncryptionAlgorithm'] = _EncryptionAlgorithm.AES_GCM_256
+    else:
+        encryption_agent['Protocol'] = _ENCRYPTION_PROTOCOL_V1
+        encryption_agent['EncryptionAlgorithm'] = _EncryptionAlgorithm.AES_CBC_256
 
     encryption_data_dict = OrderedDict()
     encryption_data_dict['WrappedContentKey'] = wrapped_content_key
     encryption_data_dict['EncryptionAgent'] = encryption_agent
-    encryption_data_dict['ContentEncryptionIV'] = _encode_base64(iv)
+    if region_data_length is not None:
+        encrypted_region_info = OrderedDict()
+        encrypted_region_info['DataLength'] = region_data_length
+        encrypted_region_info['NonceLength'] = _GCM_NONCE_LENGTH
+        encrypted_region_info['TagLength'] = _GCM_TAG_LENGTH
+        encryption_data_dict['EncryptedRegionInfo'] = encrypted_region_info
+    else:
+        encryption_data_dict['ContentEncryptionIV'] = _encode_base64(iv)
     encryption_data_dict['KeyWrappingMetadata'] = {'EncryptionLibrary': 'Python ' + __version__}
 
     return encryption_data_dict
 
 
-def _dict_to_encryption_data(encryption_data_dict):
+def _dict_to_encryption_data(encryption_data_dict, supported_protocols=(_ENCRYPTION_PROTOCOL_V1,)):
     '''
     Converts the specified dictionary to an EncryptionData object for
     eventual use in decryption.
     
     :param dict encryption_data_dict:
         The dictionary containing the encryption data.
+    :param tuple supported_protocols:
+        The encryption protocol versions that the service can decrypt. Only
+        blobs support encryption protocol 2.0.
     :return: an _EncryptionData object built from the dictionary.
     :rtype: _EncryptionData
     '''
     try:
-        if encryption_data_dict['EncryptionAgent']['Protocol'] != _ENCRYPTION_PROTOCOL_V1:
-            raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_VERSION)
+        protocol = encryption_data_dict['EncryptionAgent']['Protocol']
+        _validate_encryption_protocol_version(protocol, supported_protocols)
     except KeyError:
         raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_VERSION)
     wrapped_content_key = encryption_data_dict['WrappedContentKey']
@@ -170,10 +228,21 @@ def _dict_to_encryption_data(encryption_data_dict):
     else:
         key_wrapping_metadata = None
 
-    encryption_data = _EncryptionData(_decode_base64_to_bytes(encryption_data_dict['ContentEncryptionIV']),
+    if protocol == _ENCRYPTION_PROTOCOL_V2:
+        encrypted_region_info = encryption_data_dict['EncryptedRegionInfo']
+        encrypted_region_info = _EncryptedRegionInfo(encrypted_region_info['DataLength'],
+                                                     encrypted_region_info['NonceLength'],
+                                                     encrypted_region_info.get('TagLength', _GCM_TAG_LENGTH))
+        content_encryption_IV = None
+    else:
+        encrypted_region_info = None
+        content_encryption_IV = _decode_base64_to_bytes(encryption_data_dict['ContentEncryptionIV'])
+
+    encryption_data = _EncryptionData(content_encryption_IV,
                                       encryption_agent,
                                       wrapped_content_key,
-                                      key_wrapping_metadata)
+                                      key_wrapping_metadata,
+                                      encrypted_region_info)
 
     return encryption_data
 
@@ -194,7 +263,8 @@ def _generate_AES_CBC_cipher(cek, iv):
     return Cipher(algorithm, mode, backend)
 
 
-def _validate_and_unwrap_cek(encryption_data, key_encryption_key=None, key_resolver=None):
+def _validate_and_unwrap_cek(encryption_data, key_encryption_key=None, key_resolver=None,
+                             supported_protocols=(_ENCRYPTION_PROTOCOL_V1,)):
     '''
     Extracts and returns the content_encryption_key stored in the encryption_data object
     and performs necessary validation on all parameters.
@@ -206,14 +276,20 @@ def _validate_and_unwrap_cek(encryption_data, key_encryption_key=None, key_resol
     :param func key_resolver:
         A function used that, given a key_id, will return a key_encryption_key. Please refer 
         to high-level service object instance variables for more details.
+    :param tuple supported_protocols:
+        The encryption protocol versions that the service can decrypt.
     :return: the content_encryption_key stored in the encryption_data object.
     :rtype: bytes[]
     '''
 
-    _validate_not_none('content_encryption_IV', encryption_data.content_encryption_IV)
+    protocol = encryption_data.encryption_agent.protocol
+    if protocol == _ENCRYPTION_PROTOCOL_V2:
+        _validate_not_none('encrypted_region_info', encryption_data.encrypted_region_info)
+    else:
+        _validate_not_none('content_encryption_IV', encryption_data.content_encryption_IV)
     _validate_not_none('encrypted_key', encryption_data.wrapped_content_key.encrypted_key)
 
-    _validate_encryption_protocol_version(encryption_data.encryption_agent.protocol)
+    _validate_encryption_protocol_version(protocol, supported_protocols)
 
     content_encryption_key = None
 
@@ -230,4 +306,16 @@ def _validate_and_unwrap_cek(encryption_data, key_encryption_key=None, key_resol
                                                            encryption_data.wrapped_content_key.algorithm)
     _validate_not_none('content_encryption_key', content_encryption_key)
 
+    if protocol == _ENCRYPTION_PROTOCOL_V2:
+        # the protocol version wrapped along with the key must match the metadata
+        prefix = _get_protocol_key_prefix(protocol)
+        if content_encryption_key[:len(prefix)] != prefix:
+            raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_VERSION)
+        content_encryption_key = content_encryption_key[len(prefix):]
+
     return content_encryption_key
+
+
+def _get_protocol_key_prefix(protocol):
+    # the protocol version, padded to 8 bytes, that is wrapped along with the key
+    return protocol.encode('utf-8').ljust(8, b'\0')
@@ -26,6 +26,8 @@ from azure.common import (
     AzureException,
 )
 from ._constants import (
+    _CONTENT_VALIDATION_CRC64,
+    _CONTENT_VALIDATION_MD5,
     _ENCRYPTION_PROTOCOL_V1,
 )
 
@@ -55,6 +57,18 @@ _ERROR_RANGE_TOO_LARGE_FOR_MD5 = \
     'is not supported.'
 _ERROR_MD5_MISMATCH = \
     'MD5 mismatch. Expected value is \'{0}\', computed value is \'{1}\'.'
+_ERROR_MD5_ABORTED = \
+    'The MD5 of the content was not computed because the transfer of a chunk failed.'
+_ERROR_START_END_NEEDED_FOR_CRC64 = \
+    'Both end_range and start_range need to be specified ' + \
+    'for getting content CRC64.'
+_ERROR_RANGE_TOO_LARGE_FOR_CRC64 = \
+    'Getting content CRC64 for a range greater than 4MB ' + \
+    'is not supported.'
+_ERROR_CRC64_MISMATCH = \
+    'CRC64 mismatch. Expected value is \'{0}\', computed value is \'{1}\'.'
+_ERROR_UNSUPPORTED_CONTENT_VALIDATION_ALGORITHM = \
+    'Content validation algorithm is not supported.'
 _ERROR_TOO_MANY_ACCESS_POLICIES = \
     'Too many access policies provided. The server does not support setting more than 5 access policies on a single resource.'
 _ERROR_OBJECT_INVALID = \
@@ -135,6 +149,16 @@ def _validate_content_match(server_md5, computed_md5):
         raise AzureException(_ERROR_MD5_MISMATCH.format(server_md5, computed_md5))
 
 
+def _validate_content_crc64_match(server_crc64, computed_crc64):
+    if server_crc64 != computed_crc64:
+        raise AzureException(_ERROR_CRC64_MISMATCH.format(server_crc64, computed_crc64))
+
+
+def _validate_content_validation_algorithm(algorithm):
+    if algorithm not in [_CONTENT_VALIDATION_MD5, _CONTENT_VALIDATION_CRC64]:
+        raise ValueError(_ERROR_UNSUPPORTED_CONTENT_VALIDATION_ALGORITHM)
+
+
 def _validate_access_policies(identifiers):
     if identifiers and len(identifiers) > 5:
         raise AzureException(_ERROR_TOO_MANY_ACCESS_POLICIES)
@@ -168,8 +192,8 @@ def _validate_decryption_required(require_encryption, kek, resolver):
         raise ValueError(_ERROR_DECRYPTION_REQUIRED)
 
 
-def _validate_encryption_protocol_version(encryption_protocol):
-    if not (_ENCRYPTION_PROTOCOL_V1 == encryption_protocol):
+def _validate_encryption_protocol_version(encryption_protocol, supported_protocols=(_ENCRYPTION_PROTOCOL_V1,)):
+    if encryption_protocol not in supported_protocols:
         raise ValueError(_ERROR_UNSUPPORTED_ENCRYPTION_VERSION)
 
 
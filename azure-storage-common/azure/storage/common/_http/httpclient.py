@@ -89,19 +89,30 @@ class _HTTPClient(object):
                                         headers=request.headers,
                                         data=request.body or None,
                                         timeout=self.timeout,
-                                        proxies=self.proxies)
-
-        # Parse the response
-        status = int(response.status_code)
-        response_headers = {}
-        for key, name in response.headers.items():
-            # Preserve the case of metadata
-            if key.lower().startswith('x-ms-meta-'):
-                response_headers[key] = name
+                                        proxies=self.proxies,
+                                        stream=True)
+
+        # The body is streamed, so the connection is only released to the pool
+        # once the response is closed, even if reading the body fails.
+        try:
+            # Parse the response
+            status = int(response.status_code)
+            response_headers = {}
+            for key, name in response.headers.items():
+                # Preserve the case of metadata
+                if key.lower().startswith('x-ms-meta-'):
+                    response_headers[key] = name
+                else:
+                    response_headers[key.lower()] = name
+
+            # requests decodes the body of a response with a content encoding, such as
+            # a blob stored gzip-encoded, which is returned as stored instead so that
+            # its ranges and checksums match the stored content.
+            if 'content-encoding' in response_headers:
+                body = response.raw.read(decode_content=False)
             else:
-                response_headers[key.lower()] = name
+                body = response.content
+        finally:
+            response.close()
 
-        wrap = HTTPResponse(status, response.reason, response_headers, response.content)
-        response.close()
-
-        return wrap
+        return HTTPResponse(status, response.reason, response_headers, body)
@@ -26,15 +26,20 @@ except ImportError:
 from ._error import (
     _ERROR_VALUE_SHOULD_BE_BYTES,
     _ERROR_VALUE_SHOULD_BE_BYTES_OR_STREAM,
-    _ERROR_VALUE_SHOULD_BE_SEEKABLE_STREAM
+    _ERROR_VALUE_SHOULD_BE_SEEKABLE_STREAM,
+    _validate_content_validation_algorithm,
 )
 from .models import (
     _unicode_type,
 )
 from ._common_conversion import (
     _str,
+    _get_content_checksum,
+)
+from ._constants import (
+    _CLIENT_REQUEST_ID_HEADER_NAME,
+    _CONTENT_VALIDATION_CRC64,
 )
-from ._constants import _CLIENT_REQUEST_ID_HEADER_NAME
 
 
 def _to_utc_datetime(value):
@@ -75,6 +80,22 @@ def _update_request(request, x_ms_version, user_agent_string):
     request.path = url_quote(request.path, '/()$=\',~')
 
 
+def _add_content_checksum_header(request, algorithm, content_checksum=None):
+    '''
+    Sets the transactional checksum of the request body, which the service checks
+    against the content that has arrived, as a Content-MD5 or a x-ms-content-crc64
+    header depending on the algorithm. The checksum is computed unless given.
+    '''
+    _validate_content_validation_algorithm(algorithm)
+    if content_checksum is None:
+        content_checksum = _get_content_checksum(request.body, algorithm)
+
+    if algorithm == _CONTENT_VALIDATION_CRC64:
+        request.headers['x-ms-content-crc64'] = content_checksum
+    else:
+        request.headers['Content-MD5'] = content_checksum
+
+
 def _add_metadata_headers(metadata, request):
     if metadata:
         if not request.headers:
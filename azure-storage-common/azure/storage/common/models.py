@@ -43,11 +43,15 @@ class _OperationContext(object):
         Whether the location should be locked for this operation.
     :ivar str location: 
         The location to lock to.
+    :ivar dict content_keys:
+        The content-encryption-keys unwrapped during this operation, keyed by
+        the encryption metadata they were unwrapped from.
     '''
 
     def __init__(self, location_lock=False):
         self.location_lock = location_lock
         self.host_location = None
+        self.content_keys = {}
 
 
 class ListGenerator(Iterable):
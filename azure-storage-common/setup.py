@@ -78,5 +78,6 @@ setup(
     ],
     extras_require={
         ":python_version<'3.0'": ['azure-storage-nspkg'],
+        'crc64': ['crcmod'],
     }
 )
@@ -3,8 +3,6 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
-from dateutil import parser
-
 try:
     from xml.etree import cElementTree as ETree
 except ImportError:
@@ -23,8 +21,9 @@ from azure.storage.common.models import (
     _list,
 )
 from azure.storage.common._deserialization import (
-    _parse_properties,
-    _parse_metadata,
+    _parse_properties_and_metadata,
+    _parse_datetime,
+    _XmlListParser,
 )
 from azure.storage.common._error import _validate_content_match
 from azure.storage.common._common_conversion import (
@@ -46,8 +45,7 @@ def _parse_share(response, name, snapshot=None):
     if response is None:
         return None
 
-    metadata = _parse_metadata(response)
-    props = _parse_properties(response, ShareProperties)
+    props, metadata = _parse_properties_and_metadata(response, ShareProperties)
     return Share(name, props, metadata, snapshot)
 
 
@@ -55,8 +53,7 @@ def _parse_directory(response, name):
     if response is None:
         return None
 
-    metadata = _parse_metadata(response)
-    props = _parse_properties(response, DirectoryProperties)
+    props, metadata = _parse_properties_and_metadata(response, DirectoryProperties)
     return Directory(name, props, metadata)
 
 
@@ -82,8 +79,7 @@ def _parse_file(response, name, validate_content=False):
     if response is None:
         return None
 
-    metadata = _parse_metadata(response)
-    props = _parse_properties(response, FileProperties)
+    props, metadata = _parse_properties_and_metadata(response, FileProperties)
 
     # For range gets, only look at 'x-ms-content-md5' for overall MD5
     content_settings = getattr(props, 'content_settings')
@@ -128,15 +124,12 @@ def _convert_xml_to_shares(response):
         return None
 
     shares = _list()
-    list_element = ETree.fromstring(response.body)
-
-    # Set next marker
-    next_marker = list_element.findtext('NextMarker') or None
-    setattr(shares, 'next_marker', next_marker)
+    list_parser = _XmlListParser(response.body)
 
-    shares_element = list_element.find('Shares')
+    for share_element in list_parser:
+        if share_element.tag != 'Share':
+            continue
 
-    for share_element in shares_element.findall('Share'):
         # Name element
         share = Share()
         share.name = share_element.findtext('Name')
@@ -153,13 +146,17 @@ def _convert_xml_to_shares(response):
 
         # Properties
         properties_element = share_element.find('Properties')
-        share.properties.last_modified = parser.parse(properties_element.findtext('Last-Modified'))
+        share.properties.last_modified = _parse_datetime(properties_element.findtext('Last-Modified'))
         share.properties.etag = properties_element.findtext('Etag')
         share.properties.quota = int(properties_element.findtext('Quota'))
 
         # Add share to list
         shares.append(share)
 
+    # Set next marker
+    next_marker = list_parser.findtext('NextMarker') or None
+    setattr(shares, 'next_marker', next_marker)
+
     return shares
 
 
@@ -187,33 +184,35 @@ def _convert_xml_to_directories_and_files(response):
         return None
 
     entries = _list()
-    list_element = ETree.fromstring(response.body)
+    list_parser = _XmlListParser(response.body)
 
-    # Set next marker
-    next_marker = list_element.findtext('NextMarker') or None
-    setattr(entries, 'next_marker', next_marker)
+    # The files are listed before the directories
+    directories = []
+    for entry_element in list_parser:
+        if entry_element.tag == 'File':
+            # Name element
+            file = File()
+            file.name = entry_element.findtext('Name')
 
-    entries_element = list_element.find('Entries')
-
-    for file_element in entries_element.findall('File'):
-        # Name element
-        file = File()
-        file.name = file_element.findtext('Name')
+            # Properties
+            properties_element = entry_element.find('Properties')
+            file.properties.content_length = int(properties_element.findtext('Content-Length'))
 
-        # Properties
-        properties_element = file_element.find('Properties')
-        file.properties.content_length = int(properties_element.findtext('Content-Length'))
+            # Add file to list
+            entries.append(file)
+        elif entry_element.tag == 'Directory':
+            # Name element
+            directory = Directory()
+            directory.name = entry_element.findtext('Name')
 
-        # Add file to list
-        entries.append(file)
+            # Add directory to list
+            directories.append(directory)
 
-    for directory_element in entries_element.findall('Directory'):
-        # Name element
-        directory = Directory()
-        directory.name = directory_element.findtext('Name')
+    entries.extend(directories)
 
-        # Add directory to list
-        entries.append(directory)
+    # Set next marker
+    next_marker = list_parser.findtext('NextMarker') or None
+    setattr(entries, 'next_marker', next_marker)
 
     return entries
 
@@ -241,15 +240,12 @@ def _convert_xml_to_handles(response):
         return None
 
     entries = _list()
-    list_element = ETree.fromstring(response.body)
+    list_parser = _XmlListParser(response.body)
 
-    # Set next marker
-    next_marker = list_element.findtext('NextMarker') or None
-    setattr(entries, 'next_marker', next_marker)
-
-    handles_list_element = list_element.find('Entries')
+    for handle_element in list_parser:
+        if handle_element.tag != 'Handle':
+            continue
 
-    for handle_element in handles_list_element.findall('Handle'):
         # Name element
         handle = Handle()
         handle.handle_id = handle_element.findtext('HandleId')
@@ -258,15 +254,19 @@ def _convert_xml_to_handles(response):
         handle.parent_id = handle_element.findtext('ParentId')
         handle.session_id = handle_element.findtext('SessionId')
         handle.client_ip = handle_element.findtext('ClientIp')
-        handle.open_time = parser.parse(handle_element.findtext('OpenTime'))
+        handle.open_time = _parse_datetime(handle_element.findtext('OpenTime'))
 
         last_connect_time_string = handle_element.findtext('LastReconnectTime')
         if last_connect_time_string is not None:
-            handle.last_reconnect_time = parser.parse(last_connect_time_string)
+            handle.last_reconnect_time = _parse_datetime(last_connect_time_string)
 
         # Add file to list
         entries.append(handle)
 
+    # Set next marker
+    next_marker = list_parser.findtext('NextMarker') or None
+    setattr(entries, 'next_marker', next_marker)
+
     return entries
 
 
@@ -3,15 +3,28 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import os
 import threading
 
+from azure.storage.common._common_conversion import (
+    _get_positional_fileno,
+    _preallocate,
+)
+
 
 def _download_file_chunks(file_service, share_name, directory_name, file_name,
                           download_size, block_size, progress, start_range, end_range,
                           stream, max_connections, progress_callback, validate_content,
                           timeout, operation_context, snapshot):
 
-    downloader_class = _ParallelFileChunkDownloader if max_connections > 1 else _SequentialFileChunkDownloader
+    if max_connections > 1:
+        # Regular files are written with positional writes, which need no lock.
+        if _get_positional_fileno(stream) is not None:
+            downloader_class = _PositionalFileChunkDownloader
+        else:
+            downloader_class = _ParallelFileChunkDownloader
+    else:
+        downloader_class = _SequentialFileChunkDownloader
 
     downloader = downloader_class(
         file_service,
@@ -31,6 +44,39 @@ def _download_file_chunks(file_service, share_name, directory_name, file_name,
         snapshot,
     )
 
+    if max_connections > 1:
+        import concurrent.futures
+        executor = concurrent.futures.ThreadPoolExecutor(max_connections)
+        list(executor.map(downloader.process_chunk, downloader.get_chunk_offsets()))
+        if downloader_class is _PositionalFileChunkDownloader:
+            downloader.seek_to_end()
+    else:
+        for chunk in downloader.get_chunk_offsets():
+            downloader.process_chunk(chunk)
+
+
+def _download_file_ranges(file_service, share_name, directory_name, file_name, file_ranges,
+                          block_size, stream, max_connections, progress_callback,
+                          validate_content, timeout, snapshot):
+    downloader = _RangeFileChunkDownloader(
+        file_service,
+        share_name,
+        directory_name,
+        file_name,
+        sum(file_range.end - file_range.start + 1 for file_range in file_ranges),
+        block_size,
+        0,
+        0,
+        file_ranges[-1].end + 1 if file_ranges else 0,
+        stream,
+        progress_callback,
+        validate_content,
+        timeout,
+        None,
+        snapshot,
+    )
+    downloader.file_ranges = file_ranges
+
     if max_connections > 1:
         import concurrent.futures
         executor = concurrent.futures.ThreadPoolExecutor(max_connections)
@@ -76,17 +122,18 @@ class _FileChunkDownloader(object):
             index += self.chunk_size
 
     def process_chunk(self, chunk_start):
-        if chunk_start + self.chunk_size > self.file_end:
-            chunk_end = self.file_end
-        else:
-            chunk_end = chunk_start + self.chunk_size
-
+        chunk_end = self._get_chunk_end(chunk_start)
         chunk_data = self._download_chunk(chunk_start, chunk_end).content
         length = chunk_end - chunk_start
         if length > 0:
             self._write_to_stream(chunk_data, chunk_start)
             self._update_progress(length)
 
+    def _get_chunk_end(self, chunk_start):
+        if chunk_start + self.chunk_size > self.file_end:
+            return self.file_end
+        return chunk_start + self.chunk_size
+
     # should be provided by the subclass
     def _update_progress(self, length):
         pass
@@ -140,6 +187,52 @@ class _ParallelFileChunkDownloader(_FileChunkDownloader):
             self.stream.write(chunk_data)
 
 
+class _PositionalFileChunkDownloader(_ParallelFileChunkDownloader):
+    def __init__(self, *args):
+        super(_PositionalFileChunkDownloader, self).__init__(*args)
+
+        # The chunks are written straight to the file descriptor, so anything
+        # still buffered by the stream must reach the file first.
+        self.stream.flush()
+        self.fileno = self.stream.fileno()
+        _preallocate(self.fileno, self.stream_start, self.file_end - self.start_index)
+
+    def _write_to_stream(self, chunk_data, chunk_start):
+        # Positional writes do not move a shared file offset, so the workers
+        # can write their chunks concurrently without taking the stream lock.
+        offset = self.stream_start + (chunk_start - self.start_index)
+        data = memoryview(chunk_data)
+        while data:
+            written = os.pwrite(self.fileno, data, offset)
+            offset += written
+            data = data[written:]
+
+    def seek_to_end(self):
+        # The positional writes leave the stream where the download started, so
+        # it is moved past the downloaded range, as a write would have left it.
+        self.stream.seek(self.stream_start + (self.file_end - self.start_index))
+
+
+class _RangeFileChunkDownloader(_ParallelFileChunkDownloader):
+    file_ranges = ()
+
+    def get_chunk_offsets(self):
+        # Only the valid ranges are downloaded, each in chunks that do not cross
+        # the end of the range, and the bytes between them are left as holes in
+        # the destination.
+        self._chunk_ends = {}
+        for file_range in self.file_ranges:
+            range_end = file_range.end + 1
+            index = file_range.start
+            while index < range_end:
+                self._chunk_ends[index] = min(index + self.chunk_size, range_end)
+                yield index
+                index += self.chunk_size
+
+    def _get_chunk_end(self, chunk_start):
+        return self._chunk_ends[chunk_start]
+
+
 class _SequentialFileChunkDownloader(_FileChunkDownloader):
     def __init__(self, file_service, share_name, directory_name, file_name, download_size, chunk_size, progress,
                  start_range, end_range, stream, progress_callback, validate_content, timeout, operation_context,
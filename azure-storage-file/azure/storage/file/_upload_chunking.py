@@ -3,12 +3,14 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import os
+import stat
 import threading
 
 
 def _upload_file_chunks(file_service, share_name, directory_name, file_name,
                         file_size, block_size, stream, max_connections,
-                        progress_callback, validate_content, timeout):
+                        progress_callback, validate_content, timeout, digest=None):
     uploader = _FileChunkUploader(
         file_service,
         share_name,
@@ -22,6 +24,7 @@ def _upload_file_chunks(file_service, share_name, directory_name, file_name,
         validate_content,
         timeout
     )
+    uploader.digest = digest
 
     if progress_callback is not None:
         progress_callback(0, file_size)
@@ -29,17 +32,24 @@ def _upload_file_chunks(file_service, share_name, directory_name, file_name,
     if max_connections > 1:
         import concurrent.futures
         executor = concurrent.futures.ThreadPoolExecutor(max_connections)
-        range_ids = list(executor.map(uploader.process_chunk, uploader.get_chunk_offsets()))
+        try:
+            range_ids = list(executor.map(uploader.process_chunk, uploader.get_chunk_offsets()))
+        finally:
+            executor.shutdown(wait=False)
     else:
         if file_size is not None:
             range_ids = [uploader.process_chunk(start) for start in uploader.get_chunk_offsets()]
         else:
             range_ids = uploader.process_all_unknown_size()
 
-    return range_ids
+    # the ranges that were left empty were not uploaded
+    return [range_id for range_id in range_ids if range_id is not None]
 
 
 class _FileChunkUploader(object):
+    # the _OrderedDigest that computes the MD5 of the whole stream as it is read, if any
+    digest = None
+
     def __init__(self, file_service, share_name, directory_name, file_name,
                  file_size, chunk_size, stream, parallel, progress_callback,
                  validate_content, timeout):
@@ -70,7 +80,21 @@ class _FileChunkUploader(object):
                 yield index
                 index += self.chunk_size
         else:
+            # The holes of a sparse file read back as zeros, so the chunks that
+            # lie entirely in a hole can be skipped without reading them.
+            data_extents = self._get_data_extents() if self.stream_lock is not None else None
+            extent_index = 0
             while index < self.file_size:
+                if data_extents is not None:
+                    while extent_index < len(data_extents) and data_extents[extent_index][1] <= index:
+                        extent_index += 1
+                    if extent_index == len(data_extents) or data_extents[extent_index][0] >= index + self.chunk_size:
+                        if self.digest is not None:
+                            self.digest.update(index, bytes(bytearray(min(self.chunk_size, self.file_size - index))))
+                        self._update_progress(min(self.chunk_size, self.file_size - index))
+                        index += self.chunk_size
+                        continue
+
                 yield index
                 index += self.chunk_size
 
@@ -78,7 +102,15 @@ class _FileChunkUploader(object):
         size = self.chunk_size
         if self.file_size is not None:
             size = min(size, self.file_size - chunk_offset)
-        chunk_data = self._read_from_stream(chunk_offset, size)
+        try:
+            chunk_data = self._read_from_stream(chunk_offset, size)
+            if self.digest is not None:
+                self.digest.update(chunk_offset, chunk_data)
+        except:
+            # the chunks ahead of this one would wait for it to be hashed
+            if self.digest is not None:
+                self.digest.abort()
+            raise
         return self._upload_chunk_with_progress(chunk_offset, chunk_data)
 
     def process_all_unknown_size(self):
@@ -88,6 +120,8 @@ class _FileChunkUploader(object):
         while True:
             data = self._read_from_stream(None, self.chunk_size)
             if data:
+                if self.digest is not None:
+                    self.digest.update(self.digest.position, data)
                 index += len(data)
                 range_id = self._upload_chunk_with_progress(index, data)
                 range_ids.append(range_id)
@@ -116,7 +150,55 @@ class _FileChunkUploader(object):
                 total = self.progress_total
             self.progress_callback(total, self.file_size)
 
+    def _get_data_extents(self):
+        # Lists the extents of the stream that hold data, relative to
+        # stream_start, or returns None if the stream is not a regular file or
+        # the platform cannot report holes.
+        if not hasattr(os, 'SEEK_DATA'):
+            return None
+
+        try:
+            fileno = self.stream.fileno()
+            if not stat.S_ISREG(os.fstat(fileno).st_mode):
+                return None
+        except (AttributeError, OSError, IOError, ValueError):
+            return None
+
+        end = self.stream_start + self.file_size
+        extents = []
+        # seeking the descriptor moves the position under the stream, which is
+        # restored once the extents are known
+        position = os.lseek(fileno, 0, os.SEEK_CUR)
+        try:
+            offset = self.stream_start
+            while offset < end:
+                try:
+                    data_start = os.lseek(fileno, offset, os.SEEK_DATA)
+                except OSError:
+                    # there is no data past the offset
+                    break
+                if data_start >= end:
+                    break
+                data_end = min(os.lseek(fileno, data_start, os.SEEK_HOLE), end)
+                extents.append((data_start - self.stream_start, data_end - self.stream_start))
+                offset = data_end
+        except OSError:
+            # the file system does not support holes
+            return None
+        finally:
+            os.lseek(fileno, position, os.SEEK_SET)
+
+        return extents
+
+    def _is_chunk_empty(self, chunk_data):
+        return chunk_data.count(b'\x00') == len(chunk_data)
+
     def _upload_chunk_with_progress(self, chunk_start, chunk_data):
+        if self._is_chunk_empty(chunk_data):
+            # the file is created filled with zeros, so empty ranges need not be uploaded
+            self._update_progress(len(chunk_data))
+            return None
+
         chunk_end = chunk_start + len(chunk_data) - 1
         self.file_service.update_range(
             self.share_name,
@@ -5,6 +5,7 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import copy
 import sys
 from datetime import datetime
 
@@ -21,6 +22,7 @@ from azure.storage.common._common_conversion import (
     _int_to_str,
     _to_str,
     _get_content_md5,
+    _OrderedDigest,
 )
 from azure.storage.common._connection import _ServiceParameters
 from azure.storage.common._constants import (
@@ -75,13 +77,17 @@ from ._deserialization import (
     _parse_snapshot_share,
     _parse_directory,
     _parse_permission_key, _parse_permission)
-from ._download_chunking import _download_file_chunks
+from ._download_chunking import (
+    _download_file_chunks,
+    _download_file_ranges,
+)
 from ._serialization import (
     _get_path,
     _validate_and_format_range_headers,
     _validate_and_return_file_permission)
 from ._upload_chunking import _upload_file_chunks
 from .models import (
+    ContentSettings,
     FileProperties,
     SMBProperties)
 
@@ -1890,10 +1896,14 @@ class FileService(StorageClient):
     def create_file_from_path(self, share_name, directory_name, file_name,
                               local_file_path, content_settings=None,
                               metadata=None, validate_content=False, progress_callback=None,
-                              max_connections=2, file_permission=None, smb_properties=SMBProperties(), timeout=None):
+                              max_connections=2, file_permission=None, smb_properties=SMBProperties(), timeout=None,
+                              set_content_md5=False):
         '''
         Creates a new azure file from a local file path, or updates the content of an
         existing file, with automatic chunking and progress notifications.
+        The ranges of the local file that only hold zeros are not uploaded, and
+        the holes of a sparse file are skipped without being read when
+        max_connections is greater than 1.
 
         :param str share_name:
             Name of existing share.
@@ -1926,6 +1936,12 @@ class FileService(StorageClient):
             File permission, a portable SDDL
         :param ~azure.storage.file.models.SMBProperties smb_properties:
             Sets the SMB related file properties
+        :param bool set_content_md5:
+            If true, the MD5 of the whole file is computed in stream order while
+            the ranges are read, even if they are uploaded in parallel, and is set
+            as the content_md5 of the file once they are uploaded, unless one is
+            given in the content_settings. This takes one more request, which sets
+            the file properties again.
         :param int timeout:
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
@@ -1940,12 +1956,13 @@ class FileService(StorageClient):
             self.create_file_from_stream(
                 share_name, directory_name, file_name, stream,
                 count, content_settings, metadata, validate_content, progress_callback,
-                max_connections, file_permission=file_permission, smb_properties=smb_properties, timeout=timeout)
+                max_connections, file_permission=file_permission, smb_properties=smb_properties, timeout=timeout,
+                set_content_md5=set_content_md5)
 
     def create_file_from_text(self, share_name, directory_name, file_name,
                               text, encoding='utf-8', content_settings=None,
                               metadata=None, validate_content=False, timeout=None, file_permission=None,
-                              smb_properties=SMBProperties()):
+                              smb_properties=SMBProperties(), set_content_md5=False):
         '''
         Creates a new file from str/unicode, or updates the content of an
         existing file, with automatic chunking and progress notifications.
@@ -1976,6 +1993,12 @@ class FileService(StorageClient):
             File permission, a portable SDDL
         :param ~azure.storage.file.models.SMBProperties smb_properties:
             Sets the SMB related file properties
+        :param bool set_content_md5:
+            If true, the MD5 of the whole file is computed in stream order while
+            the ranges are read, even if they are uploaded in parallel, and is set
+            as the content_md5 of the file once they are uploaded, unless one is
+            given in the content_settings. This takes one more request, which sets
+            the file properties again.
         :param int timeout:
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
@@ -1993,13 +2016,13 @@ class FileService(StorageClient):
             share_name, directory_name, file_name, text, count=len(text),
             content_settings=content_settings, metadata=metadata,
             validate_content=validate_content, file_permission=file_permission, smb_properties=smb_properties,
-            timeout=timeout)
+            timeout=timeout, set_content_md5=set_content_md5)
 
     def create_file_from_bytes(
             self, share_name, directory_name, file_name, file,
             index=0, count=None, content_settings=None, metadata=None,
             validate_content=False, progress_callback=None, max_connections=2, timeout=None,
-            file_permission=None, smb_properties=SMBProperties()):
+            file_permission=None, smb_properties=SMBProperties(), set_content_md5=False):
         '''
         Creates a new file from an array of bytes, or updates the content
         of an existing file, with automatic chunking and progress
@@ -2041,6 +2064,12 @@ class FileService(StorageClient):
             File permission, a portable SDDL
         :param ~azure.storage.file.models.SMBProperties smb_properties:
             Sets the SMB related file properties
+        :param bool set_content_md5:
+            If true, the MD5 of the whole file is computed in stream order while
+            the ranges are read, even if they are uploaded in parallel, and is set
+            as the content_md5 of the file once they are uploaded, unless one is
+            given in the content_settings. This takes one more request, which sets
+            the file properties again.
         :param int timeout:
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
@@ -2063,16 +2092,20 @@ class FileService(StorageClient):
         self.create_file_from_stream(
             share_name, directory_name, file_name, stream, count,
             content_settings, metadata, validate_content, progress_callback,
-            max_connections, file_permission=file_permission, smb_properties=smb_properties, timeout=timeout)
+            max_connections, file_permission=file_permission, smb_properties=smb_properties, timeout=timeout,
+            set_content_md5=set_content_md5)
 
     def create_file_from_stream(
             self, share_name, directory_name, file_name, stream, count,
             content_settings=None, metadata=None, validate_content=False,
             progress_callback=None, max_connections=2, timeout=None,
-            file_permission=None, smb_properties=SMBProperties()):
+            file_permission=None, smb_properties=SMBProperties(), set_content_md5=False):
         '''
         Creates a new file from a file/stream, or updates the content of an
         existing file, with automatic chunking and progress notifications.
+        The file is created filled with zeros, so the ranges of the stream that
+        only hold zeros are not uploaded, and neither are the holes of a sparse
+        local file when max_connections is greater than 1.
 
         :param str share_name:
             Name of existing share.
@@ -2109,6 +2142,12 @@ class FileService(StorageClient):
             File permission, a portable SDDL
         :param ~azure.storage.file.models.SMBProperties smb_properties:
             Sets the SMB related file properties
+        :param bool set_content_md5:
+            If true, the MD5 of the whole file is computed in stream order while
+            the ranges are read, even if they are uploaded in parallel, and is set
+            as the content_md5 of the file once they are uploaded, unless one is
+            given in the content_settings. This takes one more request, which sets
+            the file properties again.
         :param int timeout:
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
@@ -2134,6 +2173,11 @@ class FileService(StorageClient):
             timeout=timeout
         )
 
+        # The ranges may be uploaded out of order, but are hashed in stream order
+        digest = None
+        if set_content_md5 and (content_settings is None or not content_settings.content_md5):
+            digest = _OrderedDigest(0, 2 * max_connections * self.MAX_RANGE_SIZE)
+
         _upload_file_chunks(
             self,
             share_name,
@@ -2145,9 +2189,17 @@ class FileService(StorageClient):
             max_connections,
             progress_callback,
             validate_content,
-            timeout
+            timeout,
+            digest
         )
 
+        # Setting the properties replaces all of them, so the ones the file was created with are sent again
+        if digest is not None:
+            content_settings = copy.copy(content_settings) if content_settings is not None else ContentSettings()
+            content_settings.content_md5 = digest.get_content_md5()
+            self.set_file_properties(share_name, directory_name, file_name, content_settings, timeout=timeout,
+                                     smb_properties=SMBProperties())
+
     def _get_file(self, share_name, directory_name, file_name,
                   start_range=None, end_range=None, validate_content=False,
                   timeout=None, _context=None, snapshot=None):
@@ -2263,7 +2315,9 @@ class FileService(StorageClient):
             prevents parallel download. This may also be valuable if the file is 
             being concurrently modified to enforce atomicity or if many files are 
             expected to be empty as an extra request is required for empty files 
-            if max_connections is greater than 1.
+            if max_connections is greater than 1. Where the platform supports it,
+            the file is preallocated and the chunks are written in place with
+            positional writes, without serializing the threads on a lock.
         :param int timeout:
             The timeout parameter is expressed in seconds. This method may make 
             multiple calls to the Azure service and the timeout will apply to 
@@ -2645,6 +2699,76 @@ class FileService(StorageClient):
         file.content = file.content.decode(encoding)
         return file
 
+    def get_sparse_file_to_path(self, share_name, directory_name, file_name, file_path,
+                                validate_content=False, progress_callback=None,
+                                max_connections=2, timeout=None, snapshot=None):
+        '''
+        Downloads a file to a file path, fetching only its valid ranges. The local
+        file is sized to the file and the ranges that were never written or were
+        cleared are left as holes, which most file systems store sparsely, so the
+        time and space taken by a mostly empty file such as a database or a VM
+        disk are proportional to the data actually written to it. The ranges are
+        listed first and are then downloaded in chunks of self.MAX_CHUNK_GET_SIZE.
+        Returns an instance of File with properties and metadata.
+
+        :param str share_name:
+            Name of existing share.
+        :param str directory_name:
+            The path to the directory.
+        :param str file_name:
+            Name of existing file.
+        :param str file_path:
+            Path of file to write to. The file is created or overwritten.
+        :param bool validate_content:
+            If set to true, validates an MD5 hash for each retrieved portion of 
+            the file. Note that the service will only return transactional MD5s 
+            for chunks 4MB or less, so self.MAX_CHUNK_GET_SIZE must not be set 
+            to greater than 4MB.
+        :param progress_callback:
+            Callback for progress with signature function(current, total) 
+            where current is the number of bytes transfered so far, and total is 
+            the number of bytes in the valid ranges.
+        :type progress_callback: func(current, total)
+        :param int max_connections:
+            Maximum number of parallel connections to use.
+        :param int timeout:
+            The timeout parameter is expressed in seconds. This method may make 
+            multiple calls to the Azure service and the timeout will apply to 
+            each call individually.
+        :param str snapshot:
+            A string that represents the snapshot version, if applicable.
+        :return: A File with properties and metadata.
+        :rtype: :class:`~azure.storage.file.models.File`
+        '''
+        _validate_not_none('share_name', share_name)
+        _validate_not_none('file_name', file_name)
+        _validate_not_none('file_path', file_path)
+
+        file = self.get_file_properties(share_name, directory_name, file_name, timeout=timeout, snapshot=snapshot)
+        file_ranges = self.list_ranges(share_name, directory_name, file_name, timeout=timeout, snapshot=snapshot)
+
+        with open(file_path, 'wb') as stream:
+            # Extending the empty file leaves the whole file as a hole, which the
+            # valid ranges then fill in
+            stream.truncate(file.properties.content_length)
+
+            _download_file_ranges(
+                self,
+                share_name,
+                directory_name,
+                file_name,
+                file_ranges,
+                self.MAX_CHUNK_GET_SIZE,
+                stream,
+                max_connections,
+                progress_callback,
+                validate_content,
+                timeout,
+                snapshot,
+            )
+
+        return file
+
     def update_range(self, share_name, directory_name, file_name, data,
                      start_range, end_range, validate_content=False, timeout=None):
         '''
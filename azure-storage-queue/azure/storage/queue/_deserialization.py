@@ -3,8 +3,6 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
-from dateutil import parser
-
 try:
     from xml.etree import cElementTree as ETree
 except ImportError:
@@ -20,6 +18,8 @@ from azure.storage.common.models import (
 from azure.storage.common._deserialization import (
     _to_int,
     _parse_metadata,
+    _parse_datetime,
+    _XmlListParser,
 )
 from ._encryption import (
     _decrypt_queue_message,
@@ -42,7 +42,7 @@ def _parse_queue_message_from_headers(response):
     '''
     message = QueueMessage()
     message.pop_receipt = response.headers.get('x-ms-popreceipt')
-    message.time_next_visible = parser.parse(response.headers.get('x-ms-time-next-visible'))
+    message.time_next_visible = _parse_datetime(response.headers.get('x-ms-time-next-visible'))
 
     return message
 
@@ -68,15 +68,12 @@ def _convert_xml_to_queues(response):
         return None
 
     queues = _list()
-    list_element = ETree.fromstring(response.body)
-
-    # Set next marker
-    next_marker = list_element.findtext('NextMarker') or None
-    setattr(queues, 'next_marker', next_marker)
+    list_parser = _XmlListParser(response.body)
 
-    queues_element = list_element.find('Queues')
+    for queue_element in list_parser:
+        if queue_element.tag != 'Queue':
+            continue
 
-    for queue_element in queues_element.findall('Queue'):
         # Name element
         queue = Queue()
         queue.name = queue_element.findtext('Name')
@@ -91,6 +88,10 @@ def _convert_xml_to_queues(response):
         # Add queue to list
         queues.append(queue)
 
+    # Set next marker
+    next_marker = list_parser.findtext('NextMarker') or None
+    setattr(queues, 'next_marker', next_marker)
+
     return queues
 
 
@@ -135,14 +136,14 @@ def _convert_xml_to_queue_messages(response, decode_function, require_encryption
                                                          key_encryption_key, resolver)
             message.content = decode_function(message.content)
 
-        message.insertion_time = parser.parse(message_element.findtext('InsertionTime'))
-        message.expiration_time = parser.parse(message_element.findtext('ExpirationTime'))
+        message.insertion_time = _parse_datetime(message_element.findtext('InsertionTime'))
+        message.expiration_time = _parse_datetime(message_element.findtext('ExpirationTime'))
 
         message.pop_receipt = message_element.findtext('PopReceipt')
 
         time_next_visible = message_element.find('TimeNextVisible')
         if time_next_visible is not None:
-            message.time_next_visible = parser.parse(time_next_visible.text)
+            message.time_next_visible = _parse_datetime(time_next_visible.text)
 
         # Add message to list
         messages.append(message)
@@ -0,0 +1,51 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import datetime
+import os
+import sys
+
+from azure.storage.common._common_conversion import _get_content_checksum
+
+# Measures the CPU cost of the transactional checksums that can be chosen with the
+# content_validation_algorithm of the blob services, in seconds per GB of blocks.
+# The checksums are computed on local data, so no storage account is needed. The
+# CRC64 is computed by the C extension of crcmod if it is installed, and otherwise
+# in Python.
+
+# NAME, SIZE (MB)
+LOCAL_BLOCKS = [
+    ('BLOC-0004M', 4),
+    ('BLOC-0064M', 64),
+]
+
+BLOCK_COUNT = 4
+
+ALGORITHMS = ['md5', 'crc64']
+
+
+def checksum_blocks(blocks, algorithm):
+    start_time = datetime.datetime.now()
+    for block in blocks:
+        _get_content_checksum(block, algorithm)
+    return (datetime.datetime.now() - start_time).total_seconds()
+
+
+def process(sizes, algorithms):
+    for name, size_in_megs in sizes:
+        blocks = [os.urandom(size_in_megs * 1024 * 1024) for _ in range(BLOCK_COUNT)]
+        total_in_megs = size_in_megs * BLOCK_COUNT
+        for algorithm in algorithms:
+            elapsed_time = checksum_blocks(blocks, algorithm)
+            sys.stdout.write('{0}\t{1}\t{2:.2f}s/GB\t{3:.1f}MB/s\n'.format(
+                name, algorithm, elapsed_time * 1024 / total_in_megs, total_in_megs / elapsed_time))
+
+
+def main():
+    process(LOCAL_BLOCKS, ALGORITHMS)
+
+
+if __name__ == '__main__':
+    main()
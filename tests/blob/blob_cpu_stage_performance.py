@@ -0,0 +1,82 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import datetime
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from azure.storage.blob import BlockBlobService
+from tests.encryption_test_helper import KeyWrapper
+
+# Measures how the per-chunk CPU work of a chunked upload (the MD5 computed for
+# validate_content and the AES-GCM encryption of encryption protocol 2.0) scales
+# with the number of processes of the blob service's cpu_executor. The blocks
+# are discarded instead of being sent, so that the network does not hide the
+# CPU cost, and no storage account is needed.
+
+# NAME, SIZE (MB)
+LOCAL_BLOBS = [
+    ('BLOC-0256M', 256),
+]
+
+CONNECTION_COUNT = 16
+
+# None runs the work on the threads that drive the connections
+PROCESS_COUNTS = [None] + sorted(set([1, 2, 4, 8, multiprocessing.cpu_count()]))
+
+
+def discard_block(container_name, blob_name, block, block_id, **kwargs):
+    pass
+
+
+def discard_block_list(container_name, blob_name, block_list, **kwargs):
+    pass
+
+
+def create_service(processes):
+    service = BlockBlobService('account', 'a2V5')
+    service.MAX_SINGLE_PUT_SIZE = 0
+    service.key_encryption_key = KeyWrapper('key1')
+    service.encryption_version = '2.0'
+    service._put_block = discard_block
+    service._put_block_list = discard_block_list
+    if processes is not None:
+        service.cpu_executor = ProcessPoolExecutor(processes)
+    return service
+
+
+def upload_blob(service, data):
+    start_time = datetime.datetime.now()
+    service.create_blob_from_bytes('performance', 'blob', data, validate_content=True,
+                                   max_connections=CONNECTION_COUNT)
+    return (datetime.datetime.now() - start_time).total_seconds()
+
+
+def process(blobs, counts):
+    for name, size_in_megs in blobs:
+        data = os.urandom(size_in_megs * 1024 * 1024)
+        for processes in counts:
+            service = create_service(processes)
+            try:
+                # the first upload starts the processes of the pool
+                upload_blob(service, data[:service.MAX_BLOCK_SIZE * 2])
+                elapsed_time = upload_blob(service, data)
+            finally:
+                if service.cpu_executor is not None:
+                    service.cpu_executor.shutdown()
+
+            sys.stdout.write('{0}\tProcesses:{1}\t{2}s\t{3:.1f}MB/s\n'.format(
+                name, processes or '-', elapsed_time, size_in_megs / elapsed_time))
+
+
+def main():
+    sys.stdout.write('CPUs:{0}\tConnections:{1}\n'.format(multiprocessing.cpu_count(), CONNECTION_COUNT))
+    process(LOCAL_BLOBS, PROCESS_COUNTS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import time
+from threading import Lock
+
+from azure.common import AzureHttpError
+
+from azure.storage.blob import (
+    AppendBlobService,
+    AppendBlobWriter,
+)
+from azure.storage.blob.models import AppendBlockProperties
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeAppendBlobService(object):
+    # records the append calls made by the writer instead of sending them
+    MAX_BLOCK_SIZE = AppendBlobService.MAX_BLOCK_SIZE
+
+    def __init__(self, fail_after=None):
+        self.blocks = []
+        self.conditions = []
+        self.fail_after = fail_after
+        self.lock = Lock()
+
+    def append_block(self, container_name, blob_name, block, appendpos_condition=None, **kwargs):
+        with self.lock:
+            if self.fail_after is not None and len(self.blocks) >= self.fail_after:
+                raise AzureHttpError('AppendPositionConditionNotMet', 412)
+
+            self.conditions.append(appendpos_condition)
+            props = AppendBlockProperties()
+            props.append_offset = sum(len(b) for b in self.blocks)
+            self.blocks.append(block)
+            return props
+
+
+class StorageAppendBlobWriterTest(StorageTestCase):
+
+    def test_small_writes_are_coalesced(self):
+        service = _FakeAppendBlobService()
+
+        with AppendBlobWriter(service, 'container', 'blob', block_size=100) as writer:
+            for i in range(1000):
+                writer.write(b'0123456789')
+            self.assertEqual(writer.tell(), 10000)
+
+        self.assertEqual(len(service.blocks), 100)
+        self.assertEqual(b''.join(service.blocks), b'0123456789' * 1000)
+
+        # only the first append is unconditional
+        self.assertEqual(service.conditions, [None] + [i * 100 for i in range(1, 100)])
+
+        stats = writer.statistics
+        self.assertEqual(stats.blocks_appended, 100)
+        self.assertEqual(stats.bytes_appended, 10000)
+        self.assertEqual(stats.pending_bytes, 0)
+        self.assertEqual(stats.average_batch_size, 100)
+
+    def test_flush_appends_partial_block(self):
+        service = _FakeAppendBlobService()
+        writer = AppendBlobWriter(service, 'container', 'blob', block_size=100)
+
+        writer.write(b'abc')
+        writer.flush()
+        self.assertEqual(service.blocks, [b'abc'])
+
+        writer.write(b'def')
+        writer.close()
+        self.assertEqual(service.blocks, [b'abc', b'def'])
+        self.assertEqual(service.conditions, [None, 3])
+
+        with self.assertRaises(ValueError):
+            writer.write(b'ghi')
+
+    def test_flush_interval(self):
+        service = _FakeAppendBlobService()
+        writer = AppendBlobWriter(service, 'container', 'blob', block_size=100, flush_interval=0.05)
+
+        writer.write(b'abc')
+        deadline = time.time() + 5
+        while not service.blocks and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(service.blocks, [b'abc'])
+        writer.close()
+
+    def test_append_failure_is_raised(self):
+        service = _FakeAppendBlobService(fail_after=1)
+        writer = AppendBlobWriter(service, 'container', 'blob', block_size=10)
+
+        writer.write(b'x' * 10)
+        writer.write(b'y' * 10)
+        with self.assertRaises(AzureHttpError):
+            writer.close()
+
+        self.assertEqual(service.blocks, [b'x' * 10])
+        self.assertTrue(writer.closed)
+
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,203 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from threading import Lock
+
+from azure.common import AzureHttpError
+from dateutil.tz import tzutc
+
+from azure.storage.blob import (
+    BlobCache,
+    BlockBlobService,
+)
+from azure.storage.blob.models import Blob
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeBlob(object):
+    # serves conditional ranged gets of in-memory blobs instead of sending them
+    def __init__(self):
+        self.blobs = {}
+        self.requests = []
+        self.lock = Lock()
+
+    def upload(self, blob_name, content):
+        self.blobs[blob_name] = (content, '"{0}"'.format(len(self.requests) + len(content)))
+
+    def _get_blob(self, container_name, blob_name, snapshot=None, start_range=None, end_range=None,
+                  if_match=None, if_none_match=None, **kwargs):
+        content, etag = self.blobs[blob_name]
+        with self.lock:
+            self.requests.append((blob_name, start_range, if_none_match))
+        if if_none_match == etag:
+            raise AzureHttpError('Not Modified', 304)
+        if if_match is not None and if_match != etag:
+            raise AzureHttpError('ConditionNotMet', 412)
+
+        blob = Blob(blob_name, content=content[start_range:end_range + 1])
+        blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(
+            start_range, start_range + len(blob.content) - 1, len(content))
+        blob.properties.content_length = len(blob.content)
+        blob.properties.etag = etag
+        blob.properties.last_modified = datetime(2019, 5, 9, 0, 52, 37, 123456, tzinfo=tzutc())
+        blob.properties.content_settings.content_type = 'application/octet-stream'
+        blob.metadata = {'name': blob_name}
+        return blob
+
+
+class StorageBlobCacheTest(StorageTestCase):
+
+    def setUp(self):
+        super(StorageBlobCacheTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.fake_blob = _FakeBlob()
+        self.bs = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        self.bs.MAX_SINGLE_GET_SIZE = 1024
+        self.bs.MAX_CHUNK_GET_SIZE = 512
+        self.bs._get_blob = self.fake_blob._get_blob
+        self.bs.blob_cache = BlobCache(os.path.join(self.directory, 'cache'), max_size=16 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return super(StorageBlobCacheTest, self).tearDown()
+
+    def test_revalidates_with_etag(self):
+        # Arrange
+        content = os.urandom(5000)
+        self.fake_blob.upload('model', content)
+
+        # Act
+        first = self.bs.get_blob_to_bytes('container', 'model', max_connections=3)
+        del self.fake_blob.requests[:]
+        second = self.bs.get_blob_to_bytes('container', 'model', max_connections=3)
+
+        # Assert
+        self.assertEqual(first.content, content)
+        self.assertEqual(second.content, content)
+        self.assertEqual(second.properties.etag, first.properties.etag)
+        self.assertEqual(second.metadata, {'name': 'model'})
+        self.assertEqual(self.fake_blob.requests, [('model', 0, first.properties.etag)])
+
+    def test_entries_hold_properties_as_json(self):
+        # Arrange
+        self.fake_blob.upload('model', os.urandom(3000))
+        first = self.bs.get_blob_to_bytes('container', 'model', max_connections=3)
+
+        # Act
+        cached = self.bs.get_blob_to_bytes('container', 'model')
+
+        # Assert
+        entry_path = self.bs.blob_cache._get_entry_path(self.bs.account_name, 'container', 'model', None)
+        with open(entry_path, 'rb') as entry:
+            entry.seek(3000)
+            values = json.loads(entry.read()[:-8].decode('utf-8'))
+        self.assertEqual(values['metadata'], {'name': 'model'})
+        self.assertEqual(values['properties']['etag'], first.properties.etag)
+        self.assertEqual(cached.name, 'model')
+        self.assertEqual(cached.properties.last_modified, first.properties.last_modified)
+        self.assertEqual(cached.properties.content_settings.content_type, 'application/octet-stream')
+        self.assertEqual(cached.properties.content_length, 3000)
+
+    def test_large_blobs_are_not_written_to_the_cache(self):
+        # Arrange
+        temp_files = []
+        create_temp_file = self.bs.blob_cache._create_temp_file
+
+        def _create_temp_file():
+            temp_files.append(create_temp_file())
+            return temp_files[-1]
+        self.bs.blob_cache._create_temp_file = _create_temp_file
+        self.fake_blob.upload('small', os.urandom(3000))
+        self.fake_blob.upload('too_large', os.urandom(17 * 1024))
+
+        # Act
+        small = self.bs.get_blob_to_bytes('container', 'small', max_connections=3)
+        too_large = self.bs.get_blob_to_bytes('container', 'too_large', max_connections=3)
+
+        # Assert
+        self.assertEqual(small.content, self.fake_blob.blobs['small'][0])
+        self.assertEqual(too_large.content, self.fake_blob.blobs['too_large'][0])
+        self.assertEqual(len(temp_files), 1)
+        self.assertEqual(len(os.listdir(self.bs.blob_cache.directory)), 1)
+
+    def test_downloads_changed_blob(self):
+        # Arrange
+        self.fake_blob.upload('config', b'old')
+        self.bs.get_blob_to_bytes('container', 'config')
+
+        # Act
+        self.fake_blob.upload('config', os.urandom(3000))
+        blob = self.bs.get_blob_to_path('container', 'config', os.path.join(self.directory, 'config'))
+        del self.fake_blob.requests[:]
+        cached = self.bs.get_blob_to_bytes('container', 'config')
+
+        # Assert
+        with open(os.path.join(self.directory, 'config'), 'rb') as stream:
+            self.assertEqual(stream.read(), self.fake_blob.blobs['config'][0])
+        self.assertEqual(blob.properties.etag, self.fake_blob.blobs['config'][1])
+        self.assertEqual(cached.content, self.fake_blob.blobs['config'][0])
+        self.assertEqual(self.fake_blob.requests, [('config', 0, blob.properties.etag)])
+
+    def test_skips_revalidation_within_ttl(self):
+        # Arrange
+        self.bs.blob_cache.ttl = 60
+        self.fake_blob.upload('model', os.urandom(100))
+        self.bs.get_blob_to_bytes('container', 'model')
+        del self.fake_blob.requests[:]
+
+        # Act
+        blob = self.bs.get_blob_to_bytes('container', 'model')
+
+        # Assert
+        self.assertEqual(blob.content, self.fake_blob.blobs['model'][0])
+        self.assertEqual(self.fake_blob.requests, [])
+
+    def test_ranged_downloads_are_not_cached(self):
+        # Arrange
+        self.fake_blob.upload('model', os.urandom(100))
+
+        # Act
+        blob = self.bs.get_blob_to_bytes('container', 'model', start_range=10, end_range=19)
+
+        # Assert
+        self.assertEqual(blob.content, self.fake_blob.blobs['model'][0][10:20])
+        self.assertEqual(os.listdir(self.bs.blob_cache.directory), [])
+
+    def test_evicts_least_recently_used(self):
+        # Arrange
+        for name in ('a', 'b', 'c'):
+            self.fake_blob.upload(name, os.urandom(6 * 1024))
+
+        # Act
+        self.bs.get_blob_to_bytes('container', 'a')
+        self.bs.get_blob_to_bytes('container', 'b')
+        os.utime(self.bs.blob_cache._get_entry_path(self.bs.account_name, 'container', 'a', None), (0, 0))
+        self.bs.get_blob_to_bytes('container', 'c')
+        self.fake_blob.upload('too_large', os.urandom(17 * 1024))
+        self.bs.get_blob_to_bytes('container', 'too_large')
+
+        # Assert
+        cached = set(name for name in ('a', 'b', 'c', 'too_large') if os.path.exists(
+            self.bs.blob_cache._get_entry_path(self.bs.account_name, 'container', name, None)))
+        self.assertEqual(cached, set(['b', 'c']))
+        self.assertEqual(len(os.listdir(self.bs.blob_cache.directory)), 2)
+
+        self.bs.blob_cache.clear()
+        self.assertEqual(os.listdir(self.bs.blob_cache.directory), [])
+
+
+# ------------------------------------------------------------------------------
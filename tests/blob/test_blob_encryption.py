@@ -4,6 +4,7 @@
 # license information.
 # --------------------------------------------------------------------------
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from io import (
     StringIO,
     BytesIO,
@@ -21,6 +22,7 @@ from azure.storage.common._encryption import (
     _validate_and_unwrap_cek,
     _generate_AES_CBC_cipher,
 )
+from azure.storage.common._http import HTTPResponse
 from azure.storage.common._error import (
     _ERROR_OBJECT_INVALID,
     _ERROR_DECRYPTION_FAILURE,
@@ -34,6 +36,7 @@ from azure.storage.blob import (
     AppendBlobService,
     PageBlobService,
 )
+from azure.storage.blob._encryption import _encrypt_blob
 from tests.encryption_test_helper import (
     KeyWrapper,
     KeyResolver,
@@ -696,6 +699,193 @@ class StorageBlobEncryptionTest(StorageTestCase):
         with open(FILE_PATH, 'rb') as stream:
             self.assertEqual(self.bytes, stream.read()) 
 
+    def _serve_encrypted_blob(self, service, content, key_encryption_key, region_length=None):
+        # answers the gets of the service with ranges of an encrypted blob
+        # instead of sending them
+        encryption_data, encrypted = _encrypt_blob(content, key_encryption_key, region_length)
+        return self._serve_blob(service, encryption_data, encrypted)
+
+    def _serve_blob(self, service, encryption_data, encrypted):
+        requested = []
+
+        def perform_request(request, parser=None, parser_args=None, operation_context=None, **kwargs):
+            start, end = 0, len(encrypted) - 1
+            headers = {'x-ms-meta-encryptiondata': encryption_data, 'x-ms-blob-type': 'BlockBlob',
+                       'etag': '"etag"', 'last-modified': 'Fri, 01 Jan 2016 00:00:00 GMT'}
+            if 'x-ms-range' in request.headers:
+                start, end = [int(bound) for bound in request.headers['x-ms-range'][6:].split('-')]
+                end = min(end, len(encrypted) - 1)
+                requested.append((start, end))
+                headers['content-range'] = 'bytes {0}-{1}/{2}'.format(start, end, len(encrypted))
+            headers['content-length'] = str(end - start + 1)
+            response = HTTPResponse(206, 'Partial Content', headers, encrypted[start:end + 1])
+            return parser(*([response] + parser_args))
+
+        service._perform_request = perform_request
+        return requested
+
+    def test_get_blob_unwraps_key_once_per_download(self):
+        # Arrange
+        unwrapped = []
+        kek = KeyWrapper('key1')
+        unwrap_key = kek.unwrap_key
+        kek.unwrap_key = lambda key, algorithm: unwrapped.append(key) or unwrap_key(key, algorithm)
+        content = urandom(10 * 1024 + 5)
+        self._serve_encrypted_blob(self.bbs, content, kek)
+        self.bbs.key_encryption_key = kek
+        self.bbs.MAX_SINGLE_GET_SIZE = 1024
+        self.bbs.MAX_CHUNK_GET_SIZE = 1024
+
+        # Act
+        first = self.bbs.get_blob_to_bytes('container', 'blob', max_connections=3)
+        second = self.bbs.get_blob_to_bytes('container', 'blob', max_connections=1)
+
+        # Assert
+        self.assertEqual(first.content, content)
+        self.assertEqual(second.content, content)
+        self.assertEqual(len(unwrapped), 2)
+
+    def test_get_blob_with_content_key_cache(self):
+        # Arrange
+        unwrapped = []
+        kek = KeyWrapper('key1')
+        unwrap_key = kek.unwrap_key
+        kek.unwrap_key = lambda key, algorithm: unwrapped.append(key) or unwrap_key(key, algorithm)
+        content = urandom(3 * 1024)
+        self._serve_encrypted_blob(self.bbs, content, kek)
+        self.bbs.key_encryption_key = kek
+        self.bbs.content_key_cache_ttl = 60
+        self.bbs.MAX_SINGLE_GET_SIZE = 1024
+        self.bbs.MAX_CHUNK_GET_SIZE = 1024
+
+        # Act
+        blobs = [self.bbs.get_blob_to_bytes('container', 'blob') for _ in range(3)]
+        ranged = self.bbs.get_blob_to_bytes('container', 'blob', start_range=100, end_range=1999)
+
+        # Assert
+        self.assertEqual([blob.content for blob in blobs], [content] * 3)
+        self.assertEqual(ranged.content, content[100:2000])
+        self.assertEqual(len(unwrapped), 1)
+
+    def test_get_blob_to_stream_decrypts_contiguous_ranges(self):
+        # Arrange
+        content = urandom(5000)
+        requested = self._serve_encrypted_blob(self.bbs, content, KeyWrapper('key1'))
+        self.bbs.key_encryption_key = KeyWrapper('key1')
+        self.bbs.MAX_SINGLE_GET_SIZE = 1000
+        self.bbs.MAX_CHUNK_GET_SIZE = 700
+
+        for start_range, end_range in [(None, None), (0, 15), (17, 4095), (1000, 4999), (4990, 6000)]:
+            for max_connections in (1, 3):
+                del requested[:]
+
+                # Act
+                stream = BytesIO()
+                blob = self.bbs.get_blob_to_stream('container', 'blob', stream, start_range=start_range,
+                                                   end_range=end_range, max_connections=max_connections)
+
+                # Assert
+                expected = content[start_range or 0:end_range + 1 if end_range is not None else None]
+                self.assertEqual(stream.getvalue(), expected)
+                self.assertEqual(blob.properties.content_length, len(expected))
+                # each byte of ciphertext is downloaded once, from the IV block on
+                fetch_start = max((start_range or 0) // 16 * 16 - 16, 0)
+                self.assertEqual(requested[0][0], fetch_start)
+                for (_, end), (start, _) in zip(requested, requested[1:]):
+                    self.assertEqual(start, end + 1)
+
+    def test_get_blob_to_stream_decrypts_regions(self):
+        # Arrange
+        content = urandom(5000)
+        requested = self._serve_encrypted_blob(self.bbs, content, KeyWrapper('key1'), region_length=256)
+        self.bbs.key_encryption_key = KeyWrapper('key1')
+        self.bbs.encryption_version = '2.0'
+        self.bbs.MAX_SINGLE_GET_SIZE = 1000
+        self.bbs.MAX_CHUNK_GET_SIZE = 700
+
+        for start_range, end_range in [(None, None), (0, 15), (17, 4095), (1000, 4999), (4990, 6000)]:
+            for max_connections in (1, 3):
+                del requested[:]
+
+                # Act
+                stream = BytesIO()
+                blob = self.bbs.get_blob_to_stream('container', 'blob', stream, start_range=start_range,
+                                                   end_range=end_range, max_connections=max_connections)
+
+                # Assert
+                expected = content[start_range or 0:end_range + 1 if end_range is not None else None]
+                self.assertEqual(stream.getvalue(), expected)
+                self.assertEqual(blob.properties.content_length, len(expected))
+                # after the first get, whole regions of 256 + 28 bytes are downloaded
+                for start, end in requested[1:]:
+                    self.assertEqual(start % 284, 0)
+
+    def test_get_blob_decrypts_regions_on_cpu_executor(self):
+        # Arrange
+        content = urandom(5000)
+        requested = self._serve_encrypted_blob(self.bbs, content, KeyWrapper('key1'), region_length=256)
+        self.bbs.key_encryption_key = KeyWrapper('key1')
+        self.bbs.MAX_SINGLE_GET_SIZE = 1000
+        self.bbs.MAX_CHUNK_GET_SIZE = 700
+        self.bbs.cpu_executor = ProcessPoolExecutor(2)
+
+        # Act
+        try:
+            blob = self.bbs.get_blob_to_bytes('container', 'blob', start_range=300, max_connections=3)
+        finally:
+            self.bbs.cpu_executor.shutdown()
+
+        # Assert
+        self.assertEqual(blob.content, content[300:])
+        self.assertGreater(len(requested), 2)
+
+    def test_get_blob_detects_tampered_region(self):
+        # Arrange
+        content = urandom(3000)
+        encryption_data, encrypted = _encrypt_blob(content, KeyWrapper('key1'), 1024)
+        tampered = bytearray(encrypted)
+        tampered[2000] ^= 1
+        self._serve_blob(self.bbs, encryption_data, bytes(tampered))
+        self.bbs.key_encryption_key = KeyWrapper('key1')
+        self.bbs.MAX_SINGLE_GET_SIZE = 1024
+
+        # Act
+        first_region = self.bbs.get_blob_to_bytes('container', 'blob', start_range=0, end_range=1023)
+        with self.assertRaises(AzureException) as e:
+            self.bbs.get_blob_to_bytes('container', 'blob', max_connections=3)
+
+        # Assert
+        self.assertEqual(first_region.content, content[:1024])
+        self.assertEqual(str(e.exception), _ERROR_DECRYPTION_FAILURE)
+
+    def test_create_blob_encrypts_regions_in_parallel(self):
+        # Arrange
+        content = urandom(5000)
+        blocks = {}
+        committed = {}
+        self.bbs.key_encryption_key = KeyWrapper('key1')
+        self.bbs.encryption_version = '2.0'
+        self.bbs.MAX_SINGLE_PUT_SIZE = 1024
+        self.bbs.MAX_BLOCK_SIZE = 1024
+        self.bbs._put_block = lambda container_name, blob_name, block, block_id, **kwargs: \
+            blocks.__setitem__(block_id, block)
+        self.bbs._put_block_list = lambda container_name, blob_name, block_list, encryption_data=None, **kwargs: \
+            committed.update(block_list=block_list, encryption_data=encryption_data)
+
+        # Act
+        self.bbs.create_blob_from_bytes('container', 'blob', content, max_connections=3)
+        encrypted = b''.join(blocks[block.id] for block in committed['block_list'])
+        self._serve_blob(self.bbs, committed['encryption_data'], encrypted)
+        blob = self.bbs.get_blob_to_bytes('container', 'blob', max_connections=3)
+
+        # Assert
+        encryption_data = loads(committed['encryption_data'])
+        self.assertEqual(encryption_data['EncryptionAgent']['Protocol'], '2.0')
+        self.assertEqual(encryption_data['EncryptionAgent']['EncryptionAlgorithm'], 'AES_GCM_256')
+        self.assertEqual(encryption_data['EncryptedRegionInfo']['DataLength'], 1024)
+        self.assertEqual(len(encrypted), 5000 + 5 * 28)
+        self.assertEqual(blob.content, content)
+
 #------------------------------------------------------------------------------
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
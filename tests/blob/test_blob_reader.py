@@ -0,0 +1,160 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import os
+import time
+import zipfile
+from io import (
+    BytesIO,
+    SEEK_END,
+)
+from threading import Lock
+
+from azure.common import AzureHttpError
+
+from azure.storage.blob import (
+    BlobReader,
+    BlockBlobService,
+)
+from azure.storage.blob.models import Blob
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeBlob(object):
+    # serves ranged gets of an in-memory blob instead of sending them
+    def __init__(self, content, etag='"etag"'):
+        self.content = content
+        self.etag = etag
+        self.ranges = []
+        self.lock = Lock()
+
+    def attach(self, service):
+        service._get_blob = self._get_blob
+        service.get_blob_properties = self.get_blob_properties
+        return service
+
+    def get_blob_properties(self, container_name, blob_name, **kwargs):
+        blob = Blob(blob_name)
+        blob.properties.etag = self.etag
+        blob.properties.content_length = len(self.content)
+        return blob
+
+    def _get_blob(self, container_name, blob_name, start_range=None, end_range=None, if_match=None, **kwargs):
+        if if_match != self.etag:
+            raise AzureHttpError('ConditionNotMet', 412)
+        with self.lock:
+            self.ranges.append(start_range)
+        return Blob(blob_name, content=self.content[start_range:end_range + 1])
+
+
+class StorageBlobReaderTest(StorageTestCase):
+
+    def _create_reader(self, fake_blob, **kwargs):
+        service = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        return BlobReader(fake_blob.attach(service), 'container', 'blob', **kwargs)
+
+    def test_random_reads_are_served_from_cached_blocks(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        reader = self._create_reader(fake_blob, block_size=100, read_ahead=0)
+
+        reader.seek(-10, SEEK_END)
+        self.assertEqual(reader.read(), fake_blob.content[-10:])
+        reader.seek(910)
+        self.assertEqual(reader.read(5), fake_blob.content[910:915])
+        reader.seek(150)
+        self.assertEqual(reader.read(100), fake_blob.content[150:250])
+        self.assertEqual(reader.tell(), 250)
+
+        buffer = bytearray(10)
+        self.assertEqual(reader.readinto(buffer), 10)
+        self.assertEqual(bytes(buffer), fake_blob.content[250:260])
+
+        self.assertEqual(reader.read(0), b'')
+        reader.seek(2000)
+        self.assertEqual(reader.read(), b'')
+
+        # each block was only downloaded once
+        self.assertEqual(fake_blob.ranges, [900, 100, 200])
+        reader.close()
+
+    def test_least_recently_used_blocks_are_evicted(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        reader = self._create_reader(fake_blob, block_size=100, max_cached_blocks=2, read_ahead=0)
+
+        for position in (0, 500, 0, 800, 0, 500):
+            reader.seek(position)
+            reader.read(1)
+
+        self.assertEqual(fake_blob.ranges, [0, 500, 800, 500])
+
+    def test_sequential_reads_trigger_read_ahead(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        reader = self._create_reader(fake_blob, block_size=100, read_ahead=3)
+
+        self.assertEqual(reader.read(150), fake_blob.content[:150])
+        deadline = time.time() + 5
+        while len(fake_blob.ranges) < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sorted(fake_blob.ranges), [0, 100, 200, 300, 400])
+
+        self.assertEqual(reader.read(), fake_blob.content[150:])
+        self.assertEqual(sorted(fake_blob.ranges), list(range(0, 1000, 100)))
+
+    def test_prefetch(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        reader = self._create_reader(fake_blob, block_size=100, read_ahead=0, max_connections=4)
+
+        reader.prefetch(250, 300)
+        self.assertEqual(sorted(fake_blob.ranges), [200, 300, 400, 500])
+
+        reader.seek(250)
+        self.assertEqual(reader.read(300), fake_blob.content[250:550])
+        self.assertEqual(len(fake_blob.ranges), 4)
+
+    def test_zipfile_over_blob(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            for i in range(20):
+                zip_file.writestr('file{0}.txt'.format(i), os.urandom(500))
+            zip_file.writestr('target.txt', b'hello from the blob')
+        fake_blob = _FakeBlob(archive.getvalue())
+
+        with zipfile.ZipFile(self._create_reader(fake_blob, block_size=1024)) as zip_file:
+            self.assertEqual(zip_file.read('target.txt'), b'hello from the blob')
+
+    def test_modified_blob_fails_reads(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        reader = self._create_reader(fake_blob, block_size=100, read_ahead=0)
+
+        reader.read(10)
+        fake_blob.etag = '"modified"'
+        with self.assertRaises(AzureHttpError):
+            reader.read(200)
+
+    def test_truncated_blob_ends_reads(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        reader = self._create_reader(fake_blob, block_size=100, read_ahead=0)
+
+        fake_blob.content = fake_blob.content[:450]
+        self.assertEqual(reader.read(), fake_blob.content)
+        self.assertEqual(reader.tell(), 450)
+
+    def test_key_resolver_is_not_supported(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        service = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        service.key_resolver_function = lambda kid: None
+
+        with self.assertRaises(ValueError):
+            BlobReader(fake_blob.attach(service), 'container', 'blob')
+
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,121 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import gzip
+import os
+import zlib
+from threading import Lock
+
+from azure.storage.blob import (
+    BlockBlobService,
+    BlockBlobWriter,
+)
+from azure.storage.blob.models import ResourceProperties
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeBlockBlobService(object):
+    # keeps staged and committed blocks in memory instead of sending them
+    MAX_BLOCK_SIZE = BlockBlobService.MAX_BLOCK_SIZE
+
+    def __init__(self):
+        self.require_encryption = False
+        self.key_encryption_key = None
+        self.cpu_executor = None
+        self.staged = {}
+        self.committed = None
+        self.lock = Lock()
+
+    def _put_block(self, container_name, blob_name, block, block_id, **kwargs):
+        with self.lock:
+            self.staged[block_id] = block
+
+    def _put_block_list(self, container_name, blob_name, block_list, **kwargs):
+        self.committed = b''.join(self.staged[block.id] for block in block_list)
+        return ResourceProperties()
+
+
+class StorageBlockBlobWriterTest(StorageTestCase):
+
+    def test_write_stages_blocks_and_commits_on_close(self):
+        data = os.urandom(10 * 1024 + 3)
+        service = _FakeBlockBlobService()
+        progress = []
+
+        with BlockBlobWriter(service, 'container', 'blob', block_size=1024, max_connections=3,
+                             progress_callback=lambda current, total: progress.append(current)) as writer:
+            for i in range(0, len(data), 100):
+                writer.write(data[i:i + 100])
+
+            # nothing is committed before close
+            self.assertIsNone(service.committed)
+
+        self.assertEqual(len(service.staged), 11)
+        self.assertEqual(service.committed, data)
+        self.assertEqual(max(progress), len(data))
+        self.assertIsNotNone(writer.response_properties)
+
+    def test_serializer_streams_to_writer(self):
+        data = b'abc,def\n' * 10000
+        service = _FakeBlockBlobService()
+
+        with BlockBlobWriter(service, 'container', 'blob', block_size=1024) as writer:
+            with gzip.GzipFile(fileobj=writer, mode='wb') as compressed:
+                compressed.write(data)
+
+        self.assertEqual(zlib.decompress(service.committed, 16 + zlib.MAX_WBITS), data)
+
+    def test_exception_aborts_without_commit(self):
+        service = _FakeBlockBlobService()
+
+        with self.assertRaises(RuntimeError):
+            with BlockBlobWriter(service, 'container', 'blob', block_size=10) as writer:
+                writer.write(b'x' * 25)
+                raise RuntimeError()
+
+        self.assertTrue(writer.closed)
+        self.assertIsNone(service.committed)
+
+    def test_create_blob_from_iterable(self):
+        service = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        fake = _FakeBlockBlobService()
+        service._put_block = fake._put_block
+        service._put_block_list = fake._put_block_list
+        service.MAX_BLOCK_SIZE = 1000
+
+        chunks = [os.urandom(n) for n in (1, 999, 1000, 2500, 0, 7)]
+        service.create_blob_from_iterable('container', 'blob', (chunk for chunk in chunks), max_connections=4)
+
+        self.assertEqual(fake.committed, b''.join(chunks))
+        self.assertEqual(len(fake.staged), 5)
+
+    def test_create_blob_from_iterable_does_not_commit_on_error(self):
+        service = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        fake = _FakeBlockBlobService()
+        service._put_block = fake._put_block
+        service._put_block_list = fake._put_block_list
+
+        def chunks():
+            yield b'data'
+            raise IOError('upstream connection reset')
+
+        with self.assertRaises(IOError):
+            service.create_blob_from_iterable('container', 'blob', chunks())
+        self.assertIsNone(fake.committed)
+
+    def test_empty_writer_commits_empty_blob(self):
+        service = _FakeBlockBlobService()
+        BlockBlobWriter(service, 'container', 'blob').close()
+        self.assertEqual(service.committed, b'')
+
+
+# ------------------------------------------------------------------------------
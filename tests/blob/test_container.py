@@ -7,11 +7,16 @@
 # --------------------------------------------------------------------------
 import requests
 from datetime import datetime, timedelta
+from dateutil import parser
+from dateutil.tz import tzutc
 from azure.common import (AzureConflictHttpError, AzureException,
                           AzureHttpError, AzureMissingResourceHttpError)
 from azure.storage.blob import (BlockBlobService, ContainerPermissions,
                                 Include, PublicAccess)
 from azure.storage.common import AccessPolicy
+from azure.storage.common._deserialization import _XmlListParser, _parse_datetime
+from azure.storage.common._http import HTTPResponse
+from azure.storage.blob._deserialization import _convert_xml_to_blob_list, _parse_container
 
 from tests.testcase import StorageTestCase, TestMode, record, LogCaptured
 
@@ -742,6 +747,62 @@ class StorageContainerTest(StorageTestCase):
                          'application/octet-stream')
         self.assertIsNotNone(blobs[0].properties.creation_time)
 
+    def test_list_blobs_parses_items_incrementally(self):
+        # Arrange
+        body = (b'<?xml version="1.0" encoding="utf-8"?>'
+                b'<EnumerationResults ContainerName="container"><Blobs>'
+                b'<Blob><Name>a</Name><Properties><Content-Length>1</Content-Length></Properties></Blob>'
+                b'<BlobPrefix><Name>b/</Name></BlobPrefix>'
+                b'<Blob><Name>c</Name><Metadata><key>value</key></Metadata></Blob>'
+                b'</Blobs><NextMarker>marker</NextMarker></EnumerationResults>')
+
+        # Act
+        list_parser = _XmlListParser(body)
+        elements = iter(list_parser)
+        first = next(elements)
+        names = [first.findtext('Name')] + [element.findtext('Name') for element in elements]
+        blobs = _convert_xml_to_blob_list(HTTPResponse(200, 'OK', {}, body))
+
+        # Assert
+        self.assertEqual(names, ['a', 'b/', 'c'])
+        self.assertEqual(len(first), 0)
+        self.assertEqual(list_parser.findtext('NextMarker'), 'marker')
+        self.assertEqual([blob.name for blob in blobs], ['b/', 'a', 'c'])
+        self.assertEqual(blobs[1].properties.content_length, 1)
+        self.assertEqual(blobs[2].metadata, {'key': 'value'})
+        self.assertEqual(blobs.next_marker, 'marker')
+
+    def test_parse_datetime_matches_dateutil(self):
+        # Arrange
+        values = ['Thu, 09 May 2019 00:52:37 GMT', '2019-05-09T00:52:37.1234567Z', '2019-05-09T00:52:37.12Z',
+                  '2019-05-09T00:52:37Z', '2019-05-09T00:52:37+02:00', 'Thu, 9 May 2019 00:52:37 GMT']
+
+        for value in values:
+            for ignoretz in (False, True):
+                # Act
+                parsed = _parse_datetime(value, ignoretz=ignoretz)
+                memoized = _parse_datetime(value, ignoretz=ignoretz)
+
+                # Assert
+                expected = parser.parse(value, ignoretz=ignoretz)
+                self.assertEqual(parsed, expected)
+                self.assertEqual(parsed.utcoffset(), expected.utcoffset())
+                self.assertEqual(memoized, parsed)
+
+    def test_parse_container_properties_and_metadata(self):
+        # Arrange
+        headers = {'last-modified': 'Thu, 09 May 2019 00:52:37 GMT', 'etag': '"0x8D6D4156F1C08C8"',
+                   'x-ms-lease-state': 'available', 'x-ms-meta-Hello': 'world', 'X-MS-META-number': '42'}
+
+        # Act
+        container = _parse_container(HTTPResponse(200, 'OK', headers, b''), 'container')
+
+        # Assert
+        self.assertEqual(container.properties.last_modified, datetime(2019, 5, 9, 0, 52, 37, tzinfo=tzutc()))
+        self.assertEqual(container.properties.etag, '"0x8D6D4156F1C08C8"')
+        self.assertEqual(container.properties.lease.state, 'available')
+        self.assertEqual(container.metadata, {'Hello': 'world', 'number': '42'})
+
     @record
     def test_list_blobs_leased_blob(self):
         # Arrange
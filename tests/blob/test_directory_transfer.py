@@ -0,0 +1,240 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from threading import Lock
+
+from azure.common import AzureHttpError
+from dateutil.tz import tzutc
+
+from azure.storage.blob import BlockBlobService
+from azure.storage.blob.models import (
+    Blob,
+    ResourceProperties,
+)
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeContainer(object):
+    # keeps the blobs of a container in memory instead of sending them
+    def __init__(self, fail_on=None):
+        self.blobs = {}
+        self.properties = {}
+        self.staged = {}
+        self.puts = []
+        self.gets = []
+        self.fail_on = fail_on
+        self.lock = Lock()
+
+    def attach(self, service):
+        service._put_blob = self._put_blob
+        service._put_block = self._put_block
+        service._put_block_list = self._put_block_list
+        service._get_blob = self._get_blob
+        service.list_blobs = self.list_blobs
+        return service
+
+    def set_blob(self, blob_name, content, last_modified=None):
+        self.blobs[blob_name] = content
+        self.properties[blob_name] = (str(uuid.uuid4()), last_modified or datetime.now(tzutc()))
+
+    def _put_blob(self, container_name, blob_name, blob, **kwargs):
+        if blob_name == self.fail_on:
+            raise AzureHttpError('ServerBusy', 503)
+        with self.lock:
+            self.puts.append(blob_name)
+            self.set_blob(blob_name, blob)
+        return ResourceProperties()
+
+    def _put_block(self, container_name, blob_name, block, block_id, **kwargs):
+        with self.lock:
+            self.staged[(blob_name, block_id)] = block
+
+    def _put_block_list(self, container_name, blob_name, block_list, **kwargs):
+        with self.lock:
+            self.puts.append(blob_name)
+            self.set_blob(blob_name, b''.join(self.staged[(blob_name, block.id)] for block in block_list))
+        return ResourceProperties()
+
+    def _get_blob(self, container_name, blob_name, start_range=None, end_range=None, if_match=None, **kwargs):
+        if if_match != self.properties[blob_name][0]:
+            raise AzureHttpError('ConditionNotMet', 412)
+        with self.lock:
+            self.gets.append((blob_name, start_range))
+        content = self.blobs[blob_name]
+        if start_range is not None:
+            content = content[start_range:end_range + 1]
+        return Blob(blob_name, content=content)
+
+    def list_blobs(self, container_name, prefix=None, **kwargs):
+        for name, content in sorted(self.blobs.items()):
+            if prefix and not name.startswith(prefix):
+                continue
+            blob = Blob(name)
+            blob.properties.content_length = len(content)
+            blob.properties.etag, blob.properties.last_modified = self.properties[name]
+            blob.properties.content_settings.content_md5 = \
+                base64.b64encode(hashlib.md5(content).digest()).decode('utf-8')
+            yield blob
+
+
+class StorageDirectoryTransferTest(StorageTestCase):
+
+    def setUp(self):
+        super(StorageDirectoryTransferTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.files = {
+            'a.txt': b'a' * 10,
+            'large.bin': os.urandom(2500),
+            'sub/b.txt': b'b' * 20,
+            'sub/c.tmp': b'c' * 30,
+            'sub/deeper/d.txt': b'd' * 40,
+            '.git/config': b'e' * 50,
+        }
+        for name, content in self.files.items():
+            file_path = os.path.join(self.directory, *name.split('/'))
+            if not os.path.isdir(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            with open(file_path, 'wb') as stream:
+                stream.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return super(StorageDirectoryTransferTest, self).tearDown()
+
+    def _create_service(self, container):
+        service = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        service.MAX_SINGLE_PUT_SIZE = 1000
+        service.MAX_BLOCK_SIZE = 1000
+        return container.attach(service)
+
+    def test_upload_directory(self):
+        container = _FakeContainer()
+        service = self._create_service(container)
+        reports = []
+
+        report = service.upload_directory('container', self.directory, blob_prefix='backup/',
+                                          exclude=['.git', '*.tmp'], max_connections=3,
+                                          progress_callback=reports.append)
+
+        expected = dict(('backup/' + name, content) for name, content in self.files.items()
+                        if not name.startswith('.git') and not name.endswith('.tmp'))
+        self.assertEqual(container.blobs, expected)
+        self.assertEqual(len([key for key in container.staged if key[0] == 'backup/large.bin']), 3)
+
+        self.assertEqual(report.files_transferred, 4)
+        self.assertEqual(report.files_skipped, 0)
+        self.assertEqual(report.bytes_transferred, sum(len(c) for c in expected.values()))
+        self.assertEqual(max(r.bytes_transferred for r in reports), report.bytes_transferred)
+
+    def test_upload_directory_include(self):
+        container = _FakeContainer()
+        service = self._create_service(container)
+
+        service.upload_directory('container', self.directory, include=['sub/*.txt'])
+
+        self.assertEqual(sorted(container.blobs), ['sub/b.txt', 'sub/deeper/d.txt'])
+
+    def test_upload_directory_skip_unchanged(self):
+        container = _FakeContainer()
+        service = self._create_service(container)
+        service.upload_directory('container', self.directory, exclude=['.git'])
+
+        # the blobs were listed as modified now, which is after the files
+        past = time.time() - 60
+        for name in self.files:
+            os.utime(os.path.join(self.directory, *name.split('/')), (past, past))
+        with open(os.path.join(self.directory, 'a.txt'), 'wb') as stream:
+            stream.write(b'changed size')
+
+        container.puts = []
+        report = service.upload_directory('container', self.directory, exclude=['.git'], skip_unchanged=True)
+        self.assertEqual(container.puts, ['a.txt'])
+        self.assertEqual(report.files_skipped, 4)
+
+        # same size but different content is only detected with MD5
+        with open(os.path.join(self.directory, 'sub', 'b.txt'), 'wb') as stream:
+            stream.write(b'x' * 20)
+        os.utime(os.path.join(self.directory, 'sub', 'b.txt'), (past, past))
+
+        container.puts = []
+        service.upload_directory('container', self.directory, exclude=['.git'], skip_unchanged=True)
+        self.assertEqual(container.puts, [])
+
+        service.upload_directory('container', self.directory, exclude=['.git'], skip_unchanged=True,
+                                 compare_content_md5=True)
+        self.assertEqual(container.puts, ['sub/b.txt'])
+
+    def test_upload_directory_fails_fast(self):
+        container = _FakeContainer(fail_on='a.txt')
+        service = self._create_service(container)
+
+        with self.assertRaises(AzureHttpError):
+            service.upload_directory('container', self.directory, max_connections=1)
+
+    def test_download_directory(self):
+        container = _FakeContainer()
+        service = self._create_service(container)
+        service.MAX_SINGLE_GET_SIZE = 1000
+        service.MAX_CHUNK_GET_SIZE = 400
+        last_modified = datetime(2020, 1, 1, tzinfo=tzutc())
+        for name, content in self.files.items():
+            container.set_blob('backup/' + name, content, last_modified)
+        container.set_blob('other/e.txt', b'other')
+        target = os.path.join(self.directory, 'restore')
+
+        report = service.download_directory('container', target, prefix='backup/', exclude=['.git', '*.tmp'],
+                                            max_connections=3)
+
+        downloaded = {}
+        for root, dirs, files in os.walk(target):
+            for name in files:
+                with open(os.path.join(root, name), 'rb') as stream:
+                    relative_path = os.path.relpath(os.path.join(root, name), target)
+                    downloaded[relative_path.replace(os.sep, '/')] = stream.read()
+        expected = dict((name, content) for name, content in self.files.items()
+                        if not name.startswith('.git') and not name.endswith('.tmp'))
+        self.assertEqual(downloaded, expected)
+        self.assertFalse(os.path.exists(os.path.join(target, '.git')))
+
+        # the large blob is downloaded in ranges
+        self.assertEqual(sorted(r for n, r in container.gets if n == 'backup/large.bin'), [0, 400, 800, 1200,
+                                                                                          1600, 2000, 2400])
+        self.assertEqual(report.files_transferred, 4)
+        self.assertEqual(report.bytes_transferred, sum(len(c) for c in expected.values()))
+
+        # files are stamped with the last modified time of their blob and skipped until it changes
+        self.assertEqual(int(os.path.getmtime(os.path.join(target, 'a.txt'))), 1577836800)
+        container.set_blob('backup/a.txt', b'new content')
+        container.gets = []
+        report = service.download_directory('container', target, prefix='backup/', exclude=['.git', '*.tmp'],
+                                            skip_unchanged=True)
+        self.assertEqual(container.gets, [('backup/a.txt', None)])
+        self.assertEqual(report.files_skipped, 3)
+
+    def test_download_directory_rejects_names_outside_directory(self):
+        container = _FakeContainer()
+        service = self._create_service(container)
+        container.set_blob('../escape.txt', b'data')
+
+        with self.assertRaises(ValueError):
+            service.download_directory('container', os.path.join(self.directory, 'restore'))
+
+
+# ------------------------------------------------------------------------------
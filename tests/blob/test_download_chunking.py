@@ -0,0 +1,495 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from io import BytesIO
+
+from azure.common import (
+    AzureException,
+    AzureHttpError,
+)
+
+from azure.storage.blob import (
+    BlockBlobService,
+    PageBlobService,
+)
+from azure.storage.blob._download_chunking import (
+    _get_positional_fileno,
+    _OrderedDigest,
+    _PositionalBlobChunkDownloader,
+)
+from azure.storage.blob._compression import _BlobDecompressionStage
+from azure.storage.blob._deserialization import _parse_blob
+from azure.storage.blob._serialization import _validate_and_format_range_headers
+from azure.storage.blob.models import (
+    Blob,
+    PageRange,
+)
+from azure.storage.common._common_conversion import (
+    _get_content_crc64,
+    _get_content_md5,
+)
+from azure.storage.common._http import (
+    HTTPRequest,
+    HTTPResponse,
+)
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeBlob(object):
+    # serves ranged gets of an in-memory blob instead of sending them
+    def __init__(self, content):
+        self.content = content
+        self.content_md5 = None
+        self.content_encoding = None
+
+    def _get_blob(self, container_name, blob_name, snapshot=None, start_range=None, end_range=None, **kwargs):
+        if start_range is not None and start_range >= len(self.content):
+            raise AzureHttpError('InvalidRange', 416)
+
+        blob = Blob(blob_name, content=self.content)
+        if start_range is not None:
+            blob.content = self.content[start_range:end_range + 1]
+            blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(
+                start_range, start_range + len(blob.content) - 1, len(self.content))
+        blob.properties.etag = '"etag"'
+        blob.properties.content_length = len(blob.content)
+        blob.properties.content_settings.content_md5 = self.content_md5
+        blob.properties.content_settings.content_encoding = self.content_encoding
+        return blob
+
+
+class StorageDownloadChunkingTest(StorageTestCase):
+
+    def setUp(self):
+        super(StorageDownloadChunkingTest, self).setUp()
+        self.fake_blob = _FakeBlob(os.urandom(10 * 1024 + 17))
+        self.bs = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        self.bs.MAX_SINGLE_GET_SIZE = 1024
+        self.bs.MAX_CHUNK_GET_SIZE = 512
+        self.bs._get_blob = self.fake_blob._get_blob
+
+        handle, self.file_path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+        return super(StorageDownloadChunkingTest, self).tearDown()
+
+    def test_positional_writes_only_for_regular_files(self):
+        with open(self.file_path, 'wb') as stream:
+            self.assertEqual(_get_positional_fileno(stream) is not None, hasattr(os, 'pwrite'))
+        self.assertIsNone(_get_positional_fileno(BytesIO()))
+
+    @unittest.skipUnless(hasattr(os, 'pwrite'), 'positional writes are not supported on this platform')
+    def test_get_blob_to_path_with_positional_writes(self):
+        # Arrange
+        original_init = _PositionalBlobChunkDownloader.__init__
+        downloaders = []
+
+        def init(downloader, *args):
+            downloaders.append(downloader)
+            original_init(downloader, *args)
+
+        _PositionalBlobChunkDownloader.__init__ = init
+        try:
+            # Act
+            self.bs.get_blob_to_path('container', 'blob', self.file_path, max_connections=4)
+        finally:
+            _PositionalBlobChunkDownloader.__init__ = original_init
+
+        # Assert
+        self.assertEqual(len(downloaders), 1)
+        with open(self.file_path, 'rb') as stream:
+            self.assertEqual(stream.read(), self.fake_blob.content)
+
+    def test_get_blob_to_stream_at_offset_of_file(self):
+        # Arrange
+        with open(self.file_path, 'wb') as stream:
+            stream.write(b'header')
+
+        # Act
+        with open(self.file_path, 'r+b') as stream:
+            stream.seek(6)
+            self.bs.get_blob_to_stream('container', 'blob', stream, start_range=100, end_range=5099,
+                                       max_connections=3)
+
+        # Assert
+        with open(self.file_path, 'rb') as stream:
+            self.assertEqual(stream.read(), b'header' + self.fake_blob.content[100:5100])
+
+    def test_get_blobs_appended_to_one_file(self):
+        # Act
+        with open(self.file_path, 'wb') as stream:
+            self.bs.get_blob_to_stream('container', 'blob', stream, max_connections=4)
+            first_end = stream.tell()
+            self.bs.get_blob_to_stream('container', 'blob', stream, max_connections=4)
+            second_end = stream.tell()
+
+        # Assert
+        self.assertEqual(first_end, len(self.fake_blob.content))
+        self.assertEqual(second_end, 2 * len(self.fake_blob.content))
+        with open(self.file_path, 'rb') as stream:
+            self.assertEqual(stream.read(), self.fake_blob.content * 2)
+
+    def test_get_blob_to_buffer(self):
+        progress = []
+
+        blob = self.bs.get_blob_to_buffer('container', 'blob', max_connections=4,
+                                          progress_callback=lambda current, total: progress.append(current))
+
+        self.assertIsInstance(blob.content, bytearray)
+        self.assertEqual(blob.content, self.fake_blob.content)
+        self.assertEqual(blob.properties.content_length, len(self.fake_blob.content))
+        self.assertEqual(max(progress), len(self.fake_blob.content))
+
+    def test_get_blob_to_caller_buffer(self):
+        buffer = bytearray(6000)
+
+        blob = self.bs.get_blob_to_buffer('container', 'blob', buffer, start_range=100, end_range=5099,
+                                          max_connections=1)
+
+        self.assertIs(blob.content, buffer)
+        self.assertEqual(blob.properties.content_length, 5000)
+        self.assertEqual(buffer[:5000], self.fake_blob.content[100:5100])
+        self.assertEqual(buffer[5000:], bytearray(1000))
+
+        with self.assertRaises(ValueError):
+            self.bs.get_blob_to_buffer('container', 'blob', bytearray(100))
+        with self.assertRaises(ValueError):
+            self.bs.get_blob_to_buffer('container', 'blob', bytes(len(self.fake_blob.content)))
+
+    def test_get_empty_blob_to_buffer(self):
+        self.fake_blob.content = b''
+        blob = self.bs.get_blob_to_buffer('container', 'blob')
+        self.assertEqual(blob.content, bytearray())
+
+
+    def test_get_blob_to_non_seekable_stream_with_ordered_writes(self):
+        # Arrange
+        class NonSeekableStream(object):
+            def __init__(self):
+                self.writes = []
+
+            def write(self, data):
+                self.writes.append(data)
+
+            def seekable(self):
+                return False
+
+        stream = NonSeekableStream()
+
+        # Act
+        blob = self.bs.get_blob_to_stream('container', 'blob', stream, max_connections=4, ordered_writes=True)
+
+        # Assert
+        self.assertEqual(b''.join(stream.writes), self.fake_blob.content)
+        self.assertEqual([len(data) for data in stream.writes], [1024] + [512] * 18 + [17])
+        self.assertEqual(blob.properties.content_length, len(self.fake_blob.content))
+
+        with self.assertRaises(ValueError):
+            self.bs.get_blob_to_stream('container', 'blob', NonSeekableStream(), max_connections=4)
+
+
+    def test_ordered_digest_hashes_chunks_completed_out_of_order(self):
+        # Arrange
+        content = os.urandom(10 * 100)
+        digest = _OrderedDigest(0, 1000)
+
+        # Act
+        for offset in [300, 100, 0, 900, 500, 400, 200, 800, 600, 700]:
+            digest.update(offset, content[offset:offset + 100])
+
+        # Assert
+        self.assertEqual(digest.position, len(content))
+        self.assertEqual(digest.get_content_md5(), _get_content_md5(content))
+
+    def test_ordered_digest_bounds_pending_chunks(self):
+        # Arrange
+        digest = _OrderedDigest(0, 100)
+        digest.update(100, b'b' * 100)
+        thread = threading.Thread(target=digest.update, args=(200, b'c' * 100))
+
+        # Act
+        thread.start()
+        thread.join(0.1)
+        waited = thread.is_alive()
+        digest.update(0, b'a' * 100)
+        thread.join()
+
+        # Assert
+        self.assertTrue(waited)
+        self.assertEqual(digest.get_content_md5(), _get_content_md5(b'a' * 100 + b'b' * 100 + b'c' * 100))
+
+    def test_ordered_digest_abort_wakes_waiting_threads(self):
+        # Arrange
+        digest = _OrderedDigest(0, 100)
+        errors = []
+
+        def update():
+            try:
+                digest.update(200, b'c' * 100)
+            except AzureException as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=update)
+
+        # Act
+        thread.start()
+        thread.join(0.1)
+        waited = thread.is_alive()
+        digest.abort()
+        thread.join(5)
+
+        # Assert
+        self.assertTrue(waited)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        with self.assertRaises(AzureException):
+            digest.update(0, b'a' * 100)
+        with self.assertRaises(AzureException):
+            digest.get_content_md5()
+
+    def test_get_blob_to_path_validates_blob_md5_with_failed_chunk(self):
+        # Arrange
+        self.fake_blob.content_md5 = _get_content_md5(self.fake_blob.content)
+        get_blob = self.fake_blob._get_blob
+        chunks_ahead_requested = threading.Event()
+
+        def failing_get_blob(container_name, blob_name, snapshot=None, start_range=None, end_range=None, **kwargs):
+            # the first chunk fails once the chunks far ahead of it wait for it to be hashed
+            if start_range == 1024:
+                chunks_ahead_requested.wait(5)
+                raise AzureHttpError('ServerBusy', 503)
+            if start_range >= 6144:
+                chunks_ahead_requested.set()
+            return get_blob(container_name, blob_name, snapshot, start_range, end_range, **kwargs)
+
+        self.bs._get_blob = failing_get_blob
+        threads = set(threading.enumerate())
+
+        # Act
+        with self.assertRaises(AzureHttpError):
+            self.bs.get_blob_to_path('container', 'blob', self.file_path, max_connections=4,
+                                     validate_blob_md5=True)
+
+        # Assert
+        for _ in range(100):
+            if set(threading.enumerate()) <= threads:
+                break
+            time.sleep(0.05)
+        self.assertEqual(set(threading.enumerate()) - threads, set())
+
+    def test_get_blob_to_path_validates_blob_md5(self):
+        # Arrange
+        self.fake_blob.content_md5 = _get_content_md5(self.fake_blob.content)
+
+        # Act
+        blob = self.bs.get_blob_to_path('container', 'blob', self.file_path, max_connections=4,
+                                        validate_blob_md5=True)
+
+        # Assert
+        self.assertEqual(blob.properties.content_md5, self.fake_blob.content_md5)
+        with open(self.file_path, 'rb') as stream:
+            self.assertEqual(stream.read(), self.fake_blob.content)
+
+    def test_get_blob_to_stream_validates_blob_md5_with_ordered_writes(self):
+        # Arrange
+        self.fake_blob.content_md5 = _get_content_md5(self.fake_blob.content)
+        stream = BytesIO()
+
+        # Act
+        blob = self.bs.get_blob_to_stream('container', 'blob', stream, max_connections=4, ordered_writes=True,
+                                          validate_blob_md5=True)
+
+        # Assert
+        self.assertEqual(blob.properties.content_md5, self.fake_blob.content_md5)
+        self.assertEqual(stream.getvalue(), self.fake_blob.content)
+
+    def test_get_blob_to_bytes_returns_stored_md5_unverified(self):
+        # Arrange
+        self.fake_blob.content_md5 = _get_content_md5(b'other content')
+
+        # Act
+        blob = self.bs.get_blob_to_bytes('container', 'blob', max_connections=4)
+        ranged = self.bs.get_blob_to_bytes('container', 'blob', start_range=100, max_connections=4)
+
+        # Assert
+        self.assertEqual(blob.properties.content_md5, self.fake_blob.content_md5)
+        self.assertIsNone(ranged.properties.content_md5)
+
+    def test_get_blob_to_bytes_detects_blob_md5_mismatch(self):
+        # Arrange
+        self.fake_blob.content_md5 = _get_content_md5(b'other content')
+
+        # Act
+        with self.assertRaises(AzureException):
+            self.bs.get_blob_to_bytes('container', 'blob', max_connections=4, validate_blob_md5=True)
+
+        with self.assertRaises(ValueError):
+            self.bs.get_blob_to_bytes('container', 'blob', start_range=100, validate_blob_md5=True)
+
+    def test_range_get_asks_for_content_crc64(self):
+        request = HTTPRequest()
+        _validate_and_format_range_headers(request, 0, 1023, check_content_crc64=True)
+        self.assertEqual(request.headers['x-ms-range-get-content-crc64'], 'true')
+        self.assertNotIn('x-ms-range-get-content-md5', request.headers)
+
+        with self.assertRaises(ValueError):
+            _validate_and_format_range_headers(HTTPRequest(), 0, 4 * 1024 * 1024 + 1, check_content_crc64=True)
+
+    def test_parse_blob_validates_content_crc64(self):
+        content = os.urandom(1024)
+        headers = {'x-ms-content-crc64': _get_content_crc64(content)}
+
+        blob = _parse_blob(HTTPResponse(206, 'Partial Content', headers, content), 'blob', None,
+                           validate_content=True)
+        self.assertEqual(blob.content, content)
+
+        with self.assertRaises(AzureException):
+            _parse_blob(HTTPResponse(206, 'Partial Content', headers, content + b'x'), 'blob', None,
+                        validate_content=True)
+
+    def test_get_gzip_encoded_blob_decompressed(self):
+        # Arrange
+        content = b'name,value\n' + b''.join(b'row,' + str(i).encode() + b'\n' for i in range(2000))
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.fake_blob.content = compressor.compress(content) + compressor.flush()
+        self.fake_blob.content_encoding = 'gzip'
+        self.assertGreater(len(self.fake_blob.content), self.bs.MAX_SINGLE_GET_SIZE)
+
+        class NonSeekableStream(object):
+            def __init__(self):
+                self.writes = []
+
+            def write(self, data):
+                self.writes.append(data)
+
+            def seekable(self):
+                return False
+
+        # Act
+        blob = self.bs.get_blob_to_bytes('container', 'blob', decompress=True)
+        stream = NonSeekableStream()
+        self.bs.get_blob_to_stream('container', 'blob', stream, max_connections=4, decompress=True)
+        self.bs.get_blob_to_path('container', 'blob', self.file_path, max_connections=1, decompress=True)
+
+        # Assert
+        self.assertEqual(blob.content, content)
+        self.assertEqual(blob.properties.content_length, len(self.fake_blob.content))
+        self.assertEqual(b''.join(stream.writes), content)
+        with open(self.file_path, 'rb') as stream:
+            self.assertEqual(stream.read(), content)
+        self.assertEqual(self.bs.get_blob_to_bytes('container', 'blob').content, self.fake_blob.content)
+
+    def test_get_gzip_encoded_blob_decompressed_detects_truncation(self):
+        # Arrange
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.fake_blob.content = (compressor.compress(os.urandom(5000)) + compressor.flush())[:-10]
+        self.fake_blob.content_encoding = 'gzip'
+
+        # Act
+        with self.assertRaises(AzureException):
+            self.bs.get_blob_to_bytes('container', 'blob', decompress=True)
+        with self.assertRaises(ValueError):
+            self.bs.get_blob_to_bytes('container', 'blob', start_range=0, end_range=99, decompress=True)
+
+    def test_decompression_stage_decompresses_concatenated_members(self):
+        # Arrange
+        members = b''
+        for content in (b'first', b'second'):
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            members += compressor.compress(content) + compressor.flush()
+        stage = _BlobDecompressionStage()
+
+        # Act
+        decompressed = b''.join(stage.update(members[i:i + 7]) for i in range(0, len(members), 7))
+        decompressed += stage.finalize()
+
+        # Assert
+        self.assertEqual(decompressed, b'firstsecond')
+
+    def test_get_sparse_blob_to_path(self):
+        # Arrange
+        content = bytearray(64 * 512)
+        page_ranges = [PageRange(512, 2047), PageRange(10 * 512, 20 * 512 - 1), PageRange(63 * 512, 64 * 512 - 1)]
+        for page_range in page_ranges:
+            content[page_range.start:page_range.end + 1] = os.urandom(page_range.end - page_range.start + 1)
+        self.fake_blob.content = bytes(content)
+
+        ps = PageBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        ps.MAX_CHUNK_GET_SIZE = 1024
+        ps.get_blob_properties = lambda *args, **kwargs: self._get_properties()
+        ps.get_page_ranges = lambda *args, **kwargs: page_ranges
+
+        requested = []
+
+        def get_blob(container_name, blob_name, snapshot=None, start_range=None, end_range=None, **kwargs):
+            requested.append((start_range, end_range, kwargs['if_match']))
+            return self.fake_blob._get_blob(container_name, blob_name, snapshot, start_range, end_range)
+
+        ps._get_blob = get_blob
+        progress = []
+
+        # Act
+        blob = ps.get_sparse_blob_to_path('container', 'blob', self.file_path, max_connections=3,
+                                          progress_callback=lambda current, total: progress.append((current, total)))
+
+        # Assert
+        with open(self.file_path, 'rb') as stream:
+            self.assertEqual(stream.read(), self.fake_blob.content)
+        self.assertEqual(blob.properties.content_length, len(content))
+        self.assertEqual(sorted(requested), [
+            (512, 1535, '"etag"'), (1536, 2047, '"etag"'),
+            (5120, 6143, '"etag"'), (6144, 7167, '"etag"'), (7168, 8191, '"etag"'),
+            (8192, 9215, '"etag"'), (9216, 10239, '"etag"'), (63 * 512, 64 * 512 - 1, '"etag"'),
+        ])
+        self.assertEqual(max(progress), (14 * 512, 14 * 512))
+
+    def test_read_ranges(self):
+        # Arrange
+        requested = []
+
+        def get_blob(container_name, blob_name, snapshot=None, start_range=None, end_range=None, **kwargs):
+            requested.append((start_range, end_range, kwargs['if_match']))
+            return self.fake_blob._get_blob(container_name, blob_name, snapshot, start_range, end_range)
+
+        self.bs._get_blob = get_blob
+        ranges = [(5000, 5009), (100, 199), (150, 249), (300, 309), (2000, 2999), (10 * 1024, 11 * 1024)]
+
+        # Act
+        contents = self.bs.read_ranges('container', 'blob', ranges, max_gap=100, max_connections=3)
+
+        # Assert
+        self.assertEqual([bytes(content) for content in contents],
+                         [self.fake_blob.content[start:end + 1] for start, end in ranges])
+        self.assertEqual(requested[0], (100, 309, None))
+        self.assertEqual(sorted(requested[1:]), [
+            (2000, 2999, '"etag"'), (5000, 5009, '"etag"'), (10 * 1024, 11 * 1024, '"etag"'),
+        ])
+        self.assertEqual(self.bs.read_ranges('container', 'blob', []), [])
+        with self.assertRaises(ValueError):
+            self.bs.read_ranges('container', 'blob', [(10, 9)])
+
+    def _get_properties(self):
+        blob = Blob('blob')
+        blob.properties.etag = '"etag"'
+        blob.properties.content_length = len(self.fake_blob.content)
+        return blob
+
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,114 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import os
+from threading import Lock
+
+from azure.common import AzureHttpError
+
+from azure.storage.blob import BlockBlobService
+from azure.storage.blob.models import Blob
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeBlob(object):
+    # serves ranged gets of an in-memory blob instead of sending them
+    def __init__(self, content, etag='"etag"'):
+        self.content = content
+        self.etag = etag
+        self.requests = []
+        self.lock = Lock()
+
+    def attach(self, service):
+        service._get_blob = self._get_blob
+        return service
+
+    def _get_blob(self, container_name, blob_name, snapshot=None, start_range=None, end_range=None,
+                  if_match=None, **kwargs):
+        with self.lock:
+            self.requests.append((start_range, if_match))
+        if if_match is not None and if_match != self.etag:
+            raise AzureHttpError('ConditionNotMet', 412)
+        if start_range is not None and start_range >= len(self.content):
+            raise AzureHttpError('InvalidRange', 416)
+
+        blob = Blob(blob_name, content=self.content)
+        if start_range is not None:
+            blob.content = self.content[start_range:end_range + 1]
+            blob.properties.content_range = 'bytes {0}-{1}/{2}'.format(
+                start_range, start_range + len(blob.content) - 1, len(self.content))
+        blob.properties.etag = self.etag
+        blob.properties.content_length = len(blob.content)
+        return blob
+
+
+class StorageGetBlobChunksTest(StorageTestCase):
+
+    def _create_service(self, fake_blob):
+        service = BlockBlobService(self.settings.STORAGE_ACCOUNT_NAME, self.settings.STORAGE_ACCOUNT_KEY)
+        service.MAX_CHUNK_GET_SIZE = 100
+        return fake_blob.attach(service)
+
+    def test_get_blob_chunks(self):
+        fake_blob = _FakeBlob(os.urandom(1050))
+        service = self._create_service(fake_blob)
+        progress = []
+
+        chunks = list(service.get_blob_chunks('container', 'blob', read_ahead=3,
+                                              progress_callback=lambda current, total: progress.append(current)))
+
+        self.assertEqual(b''.join(chunks), fake_blob.content)
+        self.assertEqual([len(chunk) for chunk in chunks], [100] * 10 + [50])
+        self.assertEqual(progress[-1], 1050)
+
+        # the gets after the first one are locked on the etag
+        self.assertEqual(fake_blob.requests[0], (0, None))
+        self.assertTrue(all(if_match == fake_blob.etag for _, if_match in fake_blob.requests[1:]))
+
+    def test_get_blob_chunks_range(self):
+        fake_blob = _FakeBlob(os.urandom(1050))
+        service = self._create_service(fake_blob)
+
+        chunks = list(service.get_blob_chunks('container', 'blob', start_range=150, end_range=649, read_ahead=0))
+
+        self.assertEqual(b''.join(chunks), fake_blob.content[150:650])
+        self.assertEqual([start for start, _ in fake_blob.requests], [150, 250, 350, 450, 550])
+
+    def test_get_blob_chunks_is_lazy_and_bounded(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        service = self._create_service(fake_blob)
+
+        chunks = service.get_blob_chunks('container', 'blob', read_ahead=2)
+        self.assertEqual(fake_blob.requests, [])
+
+        next(chunks)
+        next(chunks)
+        chunks.close()
+        # the first get, the chunk consumed after it, and at most 2 chunks read ahead
+        self.assertTrue(len(fake_blob.requests) <= 4)
+
+    def test_get_blob_chunks_modified_during_download(self):
+        fake_blob = _FakeBlob(os.urandom(1000))
+        service = self._create_service(fake_blob)
+
+        chunks = service.get_blob_chunks('container', 'blob', read_ahead=0)
+        next(chunks)
+        fake_blob.etag = '"modified"'
+        with self.assertRaises(AzureHttpError):
+            next(chunks)
+
+    def test_get_blob_chunks_empty_blob(self):
+        service = self._create_service(_FakeBlob(b''))
+        self.assertEqual(list(service.get_blob_chunks('container', 'blob')), [])
+
+
+# ------------------------------------------------------------------------------
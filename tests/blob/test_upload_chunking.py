@@ -5,9 +5,43 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import base64
 import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+
+from azure.common import AzureHttpError
 
-from azure.storage.blob._upload_chunking import _SubStream
+from azure.storage.common._common_conversion import (
+    _get_content_crc64,
+    _get_content_md5,
+    _OrderedDigest,
+    _update_crc64,
+    _update_crc64_python,
+)
+from azure.storage.common._encryption import _EncryptedRegionInfo
+from azure.storage.common._http import HTTPRequest
+from azure.storage.common._serialization import _add_content_checksum_header
+from azure.storage.blob._encryption import _decrypt_regions
+from azure.storage.blob._upload_chunking import (
+    _SubStream,
+    _AppendBlobChunkUploader,
+    _BlockBlobChunkUploader,
+    _upload_blob_chunks,
+    _read_ahead,
+    _BlockAccumulator,
+)
+from azure.storage.blob import BlockBlobService
+from azure.storage.blob.models import (
+    AppendBlockProperties,
+    ContentSettings,
+)
 from threading import Lock
 from io import (BytesIO, SEEK_SET)
 
@@ -18,6 +52,45 @@ from tests.testcase import (
 # ------------------------------------------------------------------------------
 
 
+class _FakeAppendBlobService(object):
+    # records the append calls made by the uploader instead of sending them
+    def __init__(self):
+        self.blocks = []
+
+    def append_block(self, container_name, blob_name, block, appendpos_condition=None, **kwargs):
+        expected_position = sum(len(b) for b in self.blocks)
+        if appendpos_condition is not None and appendpos_condition != expected_position:
+            raise AssertionError('append position mismatch')
+
+        props = AppendBlockProperties()
+        props.append_offset = expected_position
+        self.blocks.append(block)
+        return props
+
+
+class _FakeBlockBlobService(object):
+    # records the blocks put by the uploader instead of sending them
+    def __init__(self):
+        self.blocks = {}
+        self.lock = Lock()
+        self.content_validation_algorithm = 'md5'
+
+    def _put_block(self, container_name, blob_name, block, block_id, content_checksum=None, **kwargs):
+        if hasattr(block, 'read'):
+            block = block.read(len(block))
+        with self.lock:
+            self.blocks[block_id] = (block, content_checksum)
+
+    def _put_block_list(self, container_name, blob_name, block_list, content_settings=None, **kwargs):
+        self.block_list = block_list
+        self.content_settings = content_settings
+
+    def attach(self, service):
+        service._put_block = self._put_block
+        service._put_block_list = self._put_block_list
+        return service
+
+
 class StorageBlobUploadChunkingTest(StorageTestCase):
 
     # this is a white box test that's designed to make sure _Substream behaves properly
@@ -109,3 +182,214 @@ class StorageBlobUploadChunkingTest(StorageTestCase):
         finally:
             wrapped_stream.close()
             substream.close()
+
+    def test_read_ahead_preserves_order(self):
+        chunks = list(_read_ahead(((i, str(i).encode()) for i in range(100)), 3))
+        self.assertEqual(chunks, [(i, str(i).encode()) for i in range(100)])
+
+    def test_read_ahead_propagates_producer_error(self):
+        def chunks():
+            yield 0, b'a'
+            raise IOError('disk failure')
+
+        iterator = _read_ahead(chunks(), 2)
+        self.assertEqual(next(iterator), (0, b'a'))
+        with self.assertRaises(IOError):
+            next(iterator)
+
+    def test_pipelined_append_is_serial_and_ordered(self):
+        data = os.urandom(10 * 1024 + 7)
+        service = _FakeAppendBlobService()
+
+        _upload_blob_chunks(service, 'container', 'blob', len(data), 1024, BytesIO(data),
+                            max_connections=1, progress_callback=None, validate_content=False,
+                            lease_id=None, uploader_class=_AppendBlobChunkUploader, read_ahead=2)
+
+        self.assertEqual(len(service.blocks), 11)
+        self.assertEqual(b''.join(service.blocks), data)
+
+    def test_block_accumulator_rechunks_without_copies(self):
+        accumulator = _BlockAccumulator(4)
+        aligned = b'abcd'
+
+        # a chunk that lines up with a block is passed through as is
+        blocks = list(accumulator.add(aligned))
+        self.assertEqual(len(blocks), 1)
+        self.assertIs(blocks[0], aligned)
+
+        blocks = list(accumulator.add(b'ef'))
+        self.assertEqual(blocks, [])
+        self.assertEqual(len(accumulator), 2)
+
+        blocks = list(accumulator.add(bytearray(b'ghijklmno')))
+        self.assertEqual(blocks, [b'efgh', b'ijkl'])
+        self.assertEqual(accumulator.pop(), b'mno')
+        self.assertEqual(len(accumulator), 0)
+
+    def test_chunks_are_encrypted_and_hashed_on_cpu_executor(self):
+        data = os.urandom(10 * 1024 + 7)
+        content_encryption_key = os.urandom(32)
+        service = _FakeBlockBlobService()
+
+        executor = ProcessPoolExecutor(2)
+        try:
+            block_list = _upload_blob_chunks(service, 'container', 'blob', len(data), 1024, BytesIO(data),
+                                             max_connections=3, progress_callback=None, validate_content=True,
+                                             lease_id=None, uploader_class=_BlockBlobChunkUploader,
+                                             content_encryption_key=content_encryption_key,
+                                             encryption_region_length=256, cpu_executor=executor)
+        finally:
+            executor.shutdown()
+
+        region_info = _EncryptedRegionInfo(256, 12, 16)
+        blocks = [service.blocks[block.id] for block in block_list]
+        self.assertEqual(len(blocks), 11)
+        for block, content_md5 in blocks:
+            self.assertEqual(content_md5, _get_content_md5(block))
+        self.assertEqual(b''.join(_decrypt_regions(content_encryption_key, region_info, block)
+                                  for block, _ in blocks), data)
+
+    def test_content_crc64_matches_service_crc64(self):
+        def bitwise_crc64(data):
+            crc = 0xFFFFFFFFFFFFFFFF
+            for byte in bytearray(data):
+                crc ^= byte
+                for _ in range(8):
+                    crc = (crc >> 1) ^ 0x9A6C9329AC4BC9B5 if crc & 1 else crc >> 1
+            return crc ^ 0xFFFFFFFFFFFFFFFF
+
+        # check value of the CRC-64 of the service
+        self.assertEqual(_get_content_crc64(b'123456789'), 'iJh5CoYUi64=')
+        self.assertEqual(_get_content_crc64(b''), 'AAAAAAAAAAA=')
+
+        # the unaligned tail is folded a byte at a time
+        data = os.urandom(1000 + 3)
+        expected = base64.b64encode(struct.pack('<Q', bitwise_crc64(data))).decode('utf-8')
+        self.assertEqual(_get_content_crc64(data), expected)
+        self.assertEqual(_get_content_crc64(BytesIO(data)), expected)
+
+        # the Python fallback matches the C extension of crcmod, if installed,
+        # including when the CRC is updated chunk by chunk
+        self.assertEqual(_update_crc64_python(0, data), bitwise_crc64(data))
+        self.assertEqual(_update_crc64(_update_crc64(0, data[:501]), data[501:]), bitwise_crc64(data))
+
+    def test_add_content_checksum_header(self):
+        request = HTTPRequest()
+        request.body = b'123456789'
+        _add_content_checksum_header(request, 'crc64')
+        self.assertEqual(request.headers, {'x-ms-content-crc64': 'iJh5CoYUi64='})
+
+        request = HTTPRequest()
+        request.body = b'123456789'
+        _add_content_checksum_header(request, 'md5')
+        self.assertEqual(request.headers, {'Content-MD5': _get_content_md5(b'123456789')})
+
+        with self.assertRaises(ValueError):
+            _add_content_checksum_header(request, 'sha1')
+
+    def test_chunks_are_sent_with_crc64(self):
+        data = os.urandom(10 * 1024 + 7)
+        service = _FakeBlockBlobService()
+        service.content_validation_algorithm = 'crc64'
+
+        # the checksums are computed on the executor and passed to the requests
+        executor = ThreadPoolExecutor(2)
+        try:
+            block_list = _upload_blob_chunks(service, 'container', 'blob', len(data), 1024, BytesIO(data),
+                                             max_connections=3, progress_callback=None, validate_content=True,
+                                             lease_id=None, uploader_class=_BlockBlobChunkUploader,
+                                             cpu_executor=executor)
+        finally:
+            executor.shutdown()
+
+        blocks = [service.blocks[block.id] for block in block_list]
+        self.assertEqual(b''.join(block for block, _ in blocks), data)
+        for block, content_crc64 in blocks:
+            self.assertEqual(content_crc64, _get_content_crc64(block))
+
+    def test_create_blob_from_stream_sets_content_md5(self):
+        data = os.urandom(10 * 1024 + 7)
+        fake_service = _FakeBlockBlobService()
+        service = fake_service.attach(BlockBlobService('account', 'a2V5'))
+        service.MAX_SINGLE_PUT_SIZE = 1024
+        service.MAX_BLOCK_SIZE = 1024
+        service.MIN_LARGE_BLOCK_UPLOAD_THRESHOLD = 1
+
+        # the blocks are buffered by the chunked path and read from sub streams otherwise
+        for use_byte_buffer in (True, False):
+            content_settings = ContentSettings(content_type='text/plain')
+            service.create_blob_from_stream('container', 'blob', BytesIO(data), max_connections=4,
+                                            content_settings=content_settings, use_byte_buffer=use_byte_buffer)
+
+            self.assertEqual(b''.join(fake_service.blocks[block.id][0] for block in fake_service.block_list), data)
+            self.assertEqual(fake_service.content_settings.content_md5, _get_content_md5(data))
+            self.assertEqual(fake_service.content_settings.content_type, 'text/plain')
+            self.assertIsNone(content_settings.content_md5)
+
+        # a content MD5 given by the caller is kept
+        service.create_blob_from_stream('container', 'blob', BytesIO(data),
+                                        content_settings=ContentSettings(content_md5='given'))
+        self.assertEqual(fake_service.content_settings.content_md5, 'given')
+
+    def test_create_blob_from_stream_with_failed_block_sets_content_md5(self):
+        data = os.urandom(10 * 1024 + 7)
+        fake_service = _FakeBlockBlobService()
+        service = fake_service.attach(BlockBlobService('account', 'a2V5'))
+        service.MAX_SINGLE_PUT_SIZE = 1024
+        service.MAX_BLOCK_SIZE = 1024
+        service.MIN_LARGE_BLOCK_UPLOAD_THRESHOLD = 1
+        blocks_ahead_put = threading.Event()
+
+        def failing_put_block(container_name, blob_name, block, block_id, **kwargs):
+            # the second block fails once the blocks far ahead of it wait for it to be hashed
+            if block_id == 'BlockId00001':
+                blocks_ahead_put.wait(5)
+                raise AzureHttpError('ServerBusy', 503)
+            if block_id >= 'BlockId00006':
+                blocks_ahead_put.set()
+            return fake_service._put_block(container_name, blob_name, block, block_id, **kwargs)
+
+        service._put_block = failing_put_block
+        threads = set(threading.enumerate())
+
+        with self.assertRaises(AzureHttpError):
+            service.create_blob_from_stream('container', 'blob', BytesIO(data), max_connections=4)
+
+        # the threads of the pool end instead of waiting for the failed block
+        for _ in range(100):
+            if set(threading.enumerate()) <= threads:
+                break
+            time.sleep(0.05)
+        self.assertEqual(set(threading.enumerate()) - threads, set())
+
+    def test_create_blob_from_bytes_compresses_content(self):
+        data = b''.join(b'{"id": ' + str(i).encode() + b'}\n' for i in range(5000))
+        fake_service = _FakeBlockBlobService()
+        service = fake_service.attach(BlockBlobService('account', 'a2V5'))
+        service.MAX_BLOCK_SIZE = 1024
+
+        content_settings = ContentSettings(content_type='application/json')
+        service.create_blob_from_bytes('container', 'blob', data, content_settings=content_settings,
+                                       max_connections=4, compress=True)
+
+        compressed = b''.join(fake_service.blocks[block.id][0] for block in fake_service.block_list)
+        self.assertLess(len(compressed), len(data) // 4)
+        self.assertEqual(zlib.decompress(compressed, 16 + zlib.MAX_WBITS), data)
+        self.assertEqual(fake_service.content_settings.content_encoding, 'gzip')
+        self.assertEqual(fake_service.content_settings.content_type, 'application/json')
+        self.assertIsNone(content_settings.content_encoding)
+
+    def test_sub_stream_gives_data_read_again_to_digest_once(self):
+        data = os.urandom(100)
+        digest = _OrderedDigest(0, 100)
+        wrapped_stream = BytesIO(data)
+        lock = Lock()
+        sub_streams = [_SubStream(wrapped_stream, 60, 40, lock, digest), _SubStream(wrapped_stream, 0, 60, lock, digest)]
+
+        # the second sub stream is read before the first, and read again as a retry would
+        self.assertEqual(sub_streams[0].read(40), data[60:])
+        sub_streams[1].read(30)
+        sub_streams[1].seek(0)
+        self.assertEqual(sub_streams[1].read(60), data[:60])
+
+        self.assertEqual(digest.get_content_md5(), _get_content_md5(data))
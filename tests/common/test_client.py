@@ -18,9 +18,39 @@ from tests.testcase import (
 )
 from azure.storage.common import TokenCredential, ExponentialRetry
 from azure.storage.common._constants import _CLIENT_REQUEST_ID_HEADER_NAME
+from azure.storage.common._http import HTTPRequest
+from azure.storage.common._http.httpclient import _HTTPClient
 from azure.common import AzureException
 
 # ------------------------------------------------------------------------------
+class _FailingBody(object):
+    def read(self, decode_content=True):
+        raise IOError('Connection reset by peer')
+
+
+class _StreamedResponse(object):
+    # a streamed response whose body fails to be read
+    def __init__(self):
+        self.status_code = 200
+        self.reason = 'OK'
+        self.headers = {'Content-Encoding': 'gzip'}
+        self.raw = _FailingBody()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _StreamingSession(object):
+    def __init__(self):
+        self.headers = {}
+        self.responses = []
+
+    def request(self, method, uri, **kwargs):
+        self.responses.append(_StreamedResponse())
+        return self.responses[-1]
+
+
 SERVICES = {
     BlockBlobService: 'blob',
     PageBlobService: 'blob',
@@ -419,6 +449,22 @@ class StorageClientTest(StorageTestCase):
         # Assert the client request ID validation is not throwing when the ID is not echoed
         service.exists(name)
 
+    def test_response_is_closed_when_body_read_fails(self):
+        # Arrange
+        session = _StreamingSession()
+        client = _HTTPClient(protocol='https', session=session, timeout=10)
+        request = HTTPRequest()
+        request.method = 'GET'
+        request.host = 'account.blob.core.windows.net'
+        request.path = '/container/blob'
+
+        # Act
+        with self.assertRaises(IOError):
+            client.perform_request(request)
+
+        # Assert
+        self.assertTrue(session.responses[0].closed)
+
 
 # ------------------------------------------------------------------------------
 if __name__ == '__main__':
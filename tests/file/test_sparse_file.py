@@ -0,0 +1,165 @@
+# coding: utf-8
+
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import os
+import tempfile
+from threading import Lock
+
+from azure.storage.file import (
+    File,
+    FileService,
+)
+from azure.storage.common._common_conversion import _get_content_md5
+from azure.storage.file._download_chunking import _download_file_chunks
+from azure.storage.file.models import FileRange
+from tests.testcase import (
+    StorageTestCase,
+)
+
+
+# ------------------------------------------------------------------------------
+
+
+class _FakeFile(object):
+    # keeps the content of a file in memory instead of sending the requests
+    def __init__(self):
+        self.content = bytearray()
+        self.updated_ranges = []
+        self.requested_ranges = []
+        self.content_settings = None
+        self.lock = Lock()
+
+    def attach(self, service):
+        service.create_file = self.create_file
+        service.update_range = self.update_range
+        service.get_file_properties = self.get_file_properties
+        service.list_ranges = self.list_ranges
+        service._get_file = self._get_file
+        service.set_file_properties = self.set_file_properties
+        return service
+
+    def create_file(self, share_name, directory_name, file_name, content_length, *args, **kwargs):
+        self.content = bytearray(content_length)
+
+    def update_range(self, share_name, directory_name, file_name, data, start_range, end_range, *args, **kwargs):
+        with self.lock:
+            self.updated_ranges.append((start_range, end_range))
+            self.content[start_range:end_range + 1] = data
+
+    def set_file_properties(self, share_name, directory_name, file_name, content_settings, **kwargs):
+        self.content_settings = content_settings
+
+    def get_file_properties(self, share_name, directory_name, file_name, **kwargs):
+        file = File(file_name)
+        file.properties.content_length = len(self.content)
+        return file
+
+    def list_ranges(self, share_name, directory_name, file_name, **kwargs):
+        return [FileRange(start, end) for start, end in sorted(self.updated_ranges)]
+
+    def _get_file(self, share_name, directory_name, file_name, start_range=None, end_range=None, **kwargs):
+        with self.lock:
+            self.requested_ranges.append((start_range, end_range))
+        return File(file_name, content=bytes(self.content[start_range:end_range + 1]))
+
+
+class StorageSparseFileTest(StorageTestCase):
+
+    def setUp(self):
+        super(StorageSparseFileTest, self).setUp()
+        self.fake_file = _FakeFile()
+        self.fs = self.fake_file.attach(FileService(self.settings.STORAGE_ACCOUNT_NAME,
+                                                    self.settings.STORAGE_ACCOUNT_KEY))
+        self.fs.MAX_RANGE_SIZE = 1024
+        self.fs.MAX_CHUNK_GET_SIZE = 1024
+
+        self.paths = []
+        for _ in range(2):
+            handle, file_path = tempfile.mkstemp()
+            os.close(handle)
+            self.paths.append(file_path)
+
+    def tearDown(self):
+        for file_path in self.paths:
+            os.remove(file_path)
+        return super(StorageSparseFileTest, self).tearDown()
+
+    def _write_sparse_file(self, file_path, size, extents):
+        with open(file_path, 'wb') as stream:
+            stream.truncate(size)
+            for start, length in extents:
+                stream.seek(start)
+                stream.write(os.urandom(length))
+        with open(file_path, 'rb') as stream:
+            return stream.read()
+
+    def test_create_file_from_path_skips_zero_ranges(self):
+        # Arrange
+        data = self._write_sparse_file(self.paths[0], 64 * 1024, [(1000, 100), (40 * 1024, 2048)])
+        progress = []
+
+        # Act
+        for max_connections in (1, 3):
+            self.fake_file.updated_ranges = []
+            self.fs.create_file_from_path('share', None, 'file', self.paths[0], max_connections=max_connections,
+                                          progress_callback=lambda current, total: progress.append(current))
+
+            # Assert
+            self.assertEqual(bytes(self.fake_file.content), data)
+            self.assertEqual(sorted(self.fake_file.updated_ranges),
+                             [(0, 1023), (1024, 2047), (40 * 1024, 41 * 1024 - 1), (41 * 1024, 42 * 1024 - 1)])
+            self.assertEqual(max(progress), len(data))
+
+    def test_create_file_from_path_sets_content_md5(self):
+        # Arrange
+        data = self._write_sparse_file(self.paths[0], 64 * 1024 + 17, [(1000, 100), (40 * 1024, 2048 + 5)])
+
+        # Act
+        self.fs.create_file_from_path('share', None, 'file', self.paths[0], max_connections=3,
+                                      set_content_md5=True)
+
+        # Assert
+        self.assertEqual(bytes(self.fake_file.content), data)
+        self.assertEqual(self.fake_file.content_settings.content_md5, _get_content_md5(data))
+
+    def test_get_sparse_file_to_path(self):
+        # Arrange
+        data = self._write_sparse_file(self.paths[0], 64 * 1024 + 17, [(1000, 100), (40 * 1024, 2048 + 5)])
+        self.fs.create_file_from_path('share', None, 'file', self.paths[0])
+        progress = []
+
+        # Act
+        file = self.fs.get_sparse_file_to_path('share', None, 'file', self.paths[1], max_connections=3,
+                                               progress_callback=lambda current, total: progress.append(current))
+
+        # Assert
+        with open(self.paths[1], 'rb') as stream:
+            self.assertEqual(stream.read(), data)
+        self.assertEqual(file.properties.content_length, len(data))
+        self.assertEqual(sorted(self.fake_file.requested_ranges), sorted(self.fake_file.updated_ranges))
+        self.assertEqual(max(progress), 5 * 1024)
+
+    def test_file_chunks_appended_to_one_file(self):
+        # Arrange
+        self.fake_file.content = bytearray(os.urandom(5 * 1024 + 7))
+        size = len(self.fake_file.content)
+
+        # Act
+        with open(self.paths[0], 'wb') as stream:
+            for _ in range(2):
+                stream.write(self.fake_file.content[:1024])
+                _download_file_chunks(self.fs, 'share', None, 'file', size, 1024, 1024, 1024, size,
+                                      stream, 4, None, False, None, None, None)
+            end = stream.tell()
+
+        # Assert
+        self.assertEqual(end, 2 * size)
+        with open(self.paths[0], 'rb') as stream:
+            self.assertEqual(stream.read(), bytes(self.fake_file.content) * 2)
+
+
+# ------------------------------------------------------------------------------
@@ -28,12 +28,16 @@ from azure.storage.common._encryption import (
     _WrappedContentKey,
     _EncryptionAgent,
     _EncryptionData,
+    _dict_to_encryption_data,
+    _generate_encryption_data_dict,
 )
 from azure.storage.common._error import (
     _ERROR_OBJECT_INVALID,
     _ERROR_DECRYPTION_FAILURE,
     _ERROR_ENCRYPTION_REQUIRED,
+    _ERROR_UNSUPPORTED_ENCRYPTION_VERSION,
 )
+from azure.storage.queue._encryption import _decrypt_queue_message
 from azure.storage.queue._error import (
     _ERROR_MESSAGE_NOT_ENCRYPTED,
 )
@@ -459,6 +463,22 @@ class StorageQueueEncryptionTest(StorageTestCase):
         with self.assertRaises(AzureHttpError):
             self.qs.put_message(queue_name, message)
 
+    def test_encryption_protocol_2_is_not_supported(self):
+        # Arrange
+        kek = KeyWrapper('key1')
+        encryption_data = _generate_encryption_data_dict(kek, b'\x01' * 32, None, 4 * 1024 * 1024)
+        message = dumps({'EncryptedMessageContents': u'AAAA', 'EncryptionData': encryption_data})
+
+        # Act
+        with self.assertRaises(ValueError) as e:
+            _dict_to_encryption_data(encryption_data)
+        with self.assertRaises(ValueError) as message_error:
+            _decrypt_queue_message(message, True, kek, None)
+
+        # Assert
+        self.assertEqual(str(e.exception), _ERROR_UNSUPPORTED_ENCRYPTION_VERSION)
+        self.assertEqual(str(message_error.exception), _ERROR_MESSAGE_NOT_ENCRYPTED)
+
     @record
     def test_encryption_nonmatching_kid(self):
         # Arrange